@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""endaq_ide
+
+Reads channel data directly from enDAQ/Slam Stick .IDE recordings without exporting to csv.
+
+IDE files are EBML (the container format used by Matroska) with Mide's schema. Sensor samples
+are stored in ChannelDataBlock elements, each holding the channel ID, the timestamp of the first
+sample (modulo TIMECODE_MODULUS ticks) and a payload of packed samples. Older recordings (and
+high rate channels) use SimpleChannelDataBlock elements instead, where the timestamp (modulo
+SIMPLE_TIMECODE_MODULUS ticks) and channel ID are a binary header in front of the samples. The
+payloads of a channel are joined and decoded with numpy in one step, and sample times are
+interpolated between the start times of successive blocks. All channels share one time origin (the
+earliest first block of any channel) so the offsets between channels are kept.
+
+Only the data blocks are decoded - channel parsers (struct format of each sample) are supplied by
+the caller rather than read from the recording properties, and samples are returned as recorded
+(calibration is applied by the caller).
+
+  Typical usage example:
+
+  channels = read_ide_channels("flight.IDE", {8: "<hhh", 36: "<ff"})
+  time, data = channels[8]
+"""
+
+# ---------------------------------------------------
+# IMPORTS
+# ---------------------------------------------------
+
+import mmap
+import numpy as np
+
+# ---------------------------------------------------
+# CONSTANTS
+# ---------------------------------------------------
+
+# EBML element IDs (including the length marker bits) from the Mide IDE schema
+ID_EBML_HEADER = 0x1A45DFA3
+ID_CHANNEL_DATA_BLOCK = 0xA1
+ID_SIMPLE_CHANNEL_DATA_BLOCK = 0xAC
+ID_CHANNEL_ID_REF = 0xB0
+ID_CHANNEL_DATA_PAYLOAD = 0xB2
+ID_START_TIMECODE_ABS_MOD = 0xB4
+
+# block timestamps are ticks of the 32.768kHz real time clock, wrapping at 24 bits
+TIMECODE_SCALE = 1/32768
+TIMECODE_MODULUS = 2**24
+
+# SimpleChannelDataBlock header - big endian timestamp (wrapping at 16 bits) and channel ID
+SIMPLE_HEADER_DTYPE = np.dtype([("timecode", ">u2"), ("channel_id", "u1")])
+SIMPLE_TIMECODE_MODULUS = 2**16
+
+# struct format characters and their numpy equivalents
+STRUCT_TO_NUMPY = {"b": "i1", "B": "u1", "h": "i2", "H": "u2", "i": "i4", "I": "u4",
+                   "l": "i4", "L": "u4", "q": "i8", "Q": "u8", "f": "f4", "d": "f8"}
+
+# ---------------------------------------------------
+# FUNCTIONS - EBML
+# ---------------------------------------------------
+
+
+def read_vint(buffer, pos, keep_marker=False):
+    """Reads an EBML variable length integer
+
+    Returns the value and the position after it. Element IDs keep their length marker bits
+    and sizes have them removed. Sizes with all value bits set (unknown size) return None.
+    """
+
+    first = buffer[pos]
+
+    if first == 0:
+        raise ValueError(f"Invalid EBML variable length integer at byte {pos}")
+
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        length += 1
+        mask >>= 1
+
+    value = first if keep_marker else first & (mask - 1)
+    for idx in range(1, length):
+        value = (value << 8) | buffer[pos + idx]
+
+    if not keep_marker and value == (1 << (7*length)) - 1:
+        value = None
+
+    return value, pos + length
+
+
+def iter_elements(buffer, pos=0, end=None):
+    """Yields the ID, data start and data end of each EBML element between pos and end"""
+
+    if end is None:
+        end = len(buffer)
+
+    while pos < end:
+        element_id, pos = read_vint(buffer, pos, keep_marker=True)
+        size, pos = read_vint(buffer, pos)
+
+        # unknown sized elements extend to the end of their parent
+        element_end = end if size is None else min(pos + size, end)
+
+        yield element_id, pos, element_end
+
+        pos = element_end
+
+
+def read_uint(buffer, start, end):
+    """Reads a big endian unsigned integer element"""
+
+    return int.from_bytes(buffer[start:end], "big")
+
+# ---------------------------------------------------
+# FUNCTIONS - IDE
+# ---------------------------------------------------
+
+
+def read_ide_channels(filepath, channel_parsers):
+    """Reads and decodes channels from an IDE file in a single pass
+
+    channel_parsers maps channel IDs to the struct format of one sample (e.g. "<hhh" for three
+    16 bit subchannels). Returns a dict mapping channel IDs to (time, data) where time is seconds
+    since the first block of the recording (of any channel, read or not) and data is an
+    (n, num_subchannels) array.
+    """
+
+    with open(filepath, "rb") as ide_file:
+        buffer = mmap.mmap(ide_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            payloads, block_starts, block_lengths, block_moduli, first_starts = \
+                _read_channel_blocks(buffer, channel_parsers)
+        finally:
+            buffer.close()
+
+    start_times = _first_block_times(first_starts)
+
+    channels = {}
+
+    for channel_id, parser in channel_parsers.items():
+
+        if not payloads[channel_id]:
+            raise ValueError(f"No data blocks for channel {channel_id} in {filepath}")
+
+        dtype = struct_to_dtype(parser)
+        data = np.frombuffer(b"".join(payloads[channel_id]), dtype=dtype)
+        # one column per subchannel
+        data = np.stack([data[name] for name in dtype.names], axis=1).astype(np.float64)
+
+        block_samples = np.array(block_lengths[channel_id]) // dtype.itemsize
+        time = _interpolate_block_times(np.array(block_starts[channel_id], dtype=np.int64), block_samples,
+                                        block_moduli[channel_id], start_times[channel_id])
+
+        channels[channel_id] = (time, data)
+
+    return channels
+
+
+def struct_to_dtype(parser):
+    """Converts a struct format string of a single sample to a numpy structured dtype"""
+
+    byte_order = "<"
+    if parser[0] in "<>!=@":
+        byte_order = ">" if parser[0] in ">!" else "<"
+        parser = parser[1:]
+
+    try:
+        fields = [byte_order + STRUCT_TO_NUMPY[char] for char in parser]
+    except KeyError as error:
+        raise ValueError(f"Unsupported struct format character {error} in channel parser") from None
+
+    return np.dtype(",".join(fields))
+
+
+def _read_channel_blocks(buffer, channel_parsers):
+    """Collects the payloads, start times and payload lengths of all data blocks of each channel,
+    the modulus of the start times of each channel (which depends on the block element) and the
+    start time and modulus of the first block of every channel in the recording
+    """
+
+    payloads = {channel_id: [] for channel_id in channel_parsers}
+    block_starts = {channel_id: [] for channel_id in channel_parsers}
+    block_lengths = {channel_id: [] for channel_id in channel_parsers}
+    block_moduli = {channel_id: TIMECODE_MODULUS for channel_id in channel_parsers}
+    first_starts = {}
+
+    elements = iter_elements(buffer)
+
+    element_id, _, _ = next(elements)
+    if element_id != ID_EBML_HEADER:
+        raise ValueError("File is not an EBML (IDE) file")
+
+    for element_id, start, end in elements:
+
+        if element_id == ID_CHANNEL_DATA_BLOCK:
+            channel_id, block_start, payload = _read_channel_data_block(buffer, start, end)
+            modulus = TIMECODE_MODULUS
+
+        elif element_id == ID_SIMPLE_CHANNEL_DATA_BLOCK:
+            channel_id, block_start, payload = _read_simple_channel_data_block(buffer, start, end)
+            modulus = SIMPLE_TIMECODE_MODULUS
+
+        else:
+            continue
+
+        if channel_id is None or block_start is None:
+            continue
+
+        # channels that are not read still set the time origin
+        if channel_id not in first_starts:
+            first_starts[channel_id] = (block_start, modulus)
+
+        if channel_id not in payloads or payload is None:
+            continue
+
+        payloads[channel_id].append(payload)
+        block_starts[channel_id].append(block_start)
+        block_lengths[channel_id].append(len(payload))
+        block_moduli[channel_id] = modulus
+
+    return payloads, block_starts, block_lengths, block_moduli, first_starts
+
+
+def _read_channel_data_block(buffer, start, end):
+    """Returns the channel ID, start time (ticks) and payload of a ChannelDataBlock"""
+
+    channel_id = None
+    payload = None
+    block_start = None
+
+    for child_id, child_start, child_end in iter_elements(buffer, start, end):
+        if child_id == ID_CHANNEL_ID_REF:
+            channel_id = read_uint(buffer, child_start, child_end)
+        elif child_id == ID_CHANNEL_DATA_PAYLOAD:
+            payload = buffer[child_start:child_end]
+        elif child_id == ID_START_TIMECODE_ABS_MOD:
+            block_start = read_uint(buffer, child_start, child_end)
+
+    return channel_id, block_start, payload
+
+
+def _read_simple_channel_data_block(buffer, start, end):
+    """Returns the channel ID, start time (ticks) and payload of a SimpleChannelDataBlock"""
+
+    if end - start < SIMPLE_HEADER_DTYPE.itemsize:
+        return None, None, None
+
+    header = np.frombuffer(buffer[start:start + SIMPLE_HEADER_DTYPE.itemsize], dtype=SIMPLE_HEADER_DTYPE)[0]
+
+    return int(header["channel_id"]), int(header["timecode"]), buffer[start + SIMPLE_HEADER_DTYPE.itemsize:end]
+
+
+def _first_block_times(first_starts):
+    """Returns the time (s) of the first block of each channel since the earliest of them
+
+    first_starts maps channel IDs to the start time (ticks) and modulus of their first block.
+    Timestamps are aligned to a channel with the largest modulus (24 bit) taking the nearest
+    time for 16 bit timestamps, so channels must start within 1s of each other.
+    """
+
+    start_ref, _ = max(first_starts.values(), key=lambda first_start: first_start[1])
+
+    # signed difference (ticks) from the reference start
+    start_diffs = {channel_id: (block_start - start_ref + modulus//2) % modulus - modulus//2
+                   for channel_id, (block_start, modulus) in first_starts.items()}
+    start_origin = min(start_diffs.values())
+
+    return {channel_id: (start_diff - start_origin)*TIMECODE_SCALE for channel_id, start_diff in start_diffs.items()}
+
+
+def _interpolate_block_times(block_starts, block_samples, modulus=TIMECODE_MODULUS, start_time=0.0):
+    """Returns the time of every sample from the start time (ticks) of each block
+
+    Start times are unwrapped at modulus and samples are spaced evenly up to the start of the
+    next block (the last block uses the sample period of the one before it). The first block is
+    at start_time (s).
+    """
+
+    # unwrap the modulo timestamps
+    wraps = np.concatenate(([0], np.cumsum(np.diff(block_starts) < 0)))
+    block_starts = (block_starts + wraps*modulus)*TIMECODE_SCALE
+    block_starts = block_starts - block_starts[0] + start_time
+
+    if len(block_starts) > 1:
+        sample_period = np.diff(block_starts)/block_samples[:-1]
+        sample_period = np.append(sample_period, sample_period[-1])
+    else:
+        # single block - no timing information between samples
+        sample_period = np.zeros(1)
+
+    idx_block_start = np.cumsum(block_samples) - block_samples
+    idx_in_block = np.arange(np.sum(block_samples)) - np.repeat(idx_block_start, block_samples)
+
+    return np.repeat(block_starts, block_samples) + idx_in_block*np.repeat(sample_period, block_samples)
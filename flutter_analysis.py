@@ -4,32 +4,55 @@
 
 
 TODO
-- Add calculation of damping with the half-point power method (requires increased freq res)
+- None
 """
 
 # ---------------------------------
 # IMPORTS
 # ---------------------------------
 
+import functools
 import math
 import numpy as np
+import scipy.fft
 import scipy.signal as signal
+import scipy.stats as stats
 import sys
 
 import flutter_config as cfg
 from flutter_config import cfg_analysis
 
-from flutter_other import stationary_check, acc_filter_butter
+from flutter_other import stationary_check, acc_filter_butter_bank, filter_window_lowpass, samples_at_samp_rate
 from flutter_output import plot_acc, welch_plot
 
+# ---------------------------------
+# CONSTANTS
+# ---------------------------------
+
+# number of Welch windows (segment length and sample rate) memoised by _welch_window
+WELCH_WINDOW_CACHE_SIZE = 16
+
+# diagnostic codes of the headless damping calculation (DAMPING_HEADLESS)
+DAMPING_OK = "ok"
+DAMPING_NO_BANDS = "no_bands"  # FREQ_FILTER_REF is empty (bands cannot be entered)
+DAMPING_INVALID_DATA = "invalid_data"  # empty or non-finite data
+DAMPING_TOO_FEW_PEAKS = "too_few_peaks"  # less than two peaks detected
+DAMPING_NO_CYCLES = "no_cycles"  # selected peaks do not span a cycle
+DAMPING_NO_DECAY = "no_decay"  # later peak is not smaller than the initial peak
+
 # ---------------------------------
 # FUNCTIONS
 # ---------------------------------
 
 
-def analyse_data_acc(acc_data, time_ranges, idx_range, airspeed, altitude, subtitle):
+def analyse_data_acc(acc_data, time_ranges, idx_range, airspeed, altitude, subtitle, psd=None):
+    """Analyses a single time range (test point)
 
-    dict_results = {"altitude": altitude, "airspeed": airspeed}
+    psd = (f, Gxx) for this time range if already calculated (welch_test_points)
+    """
+
+    # sample rate of the analysed data (after any decimation)
+    dict_results = {"altitude": altitude, "airspeed": airspeed, "samp_rate": cfg_analysis.SAMP_RATE}
 
     data_extract, data_raw_extract, time_extract = extract_time_and_data(acc_data, time_ranges, idx_range)
 
@@ -49,8 +72,9 @@ def analyse_data_acc(acc_data, time_ranges, idx_range, airspeed, altitude, subti
         plot_acc(data=data_extract, time=time_extract, title=str_title, subtitle=str_subtitle, limits=cfg.LIMITS)
 
     f_max = None
+    zoom = None
     if cfg.CALC_FREQ:
-        f_max, f, Gxx = analyse_data_freq(data_extract, time_extract, str_title, str_subtitle)
+        f_max, f, Gxx, zoom = analyse_data_freq(data_extract, time_extract, str_title, str_subtitle, psd=psd)
 
     dict_results["modal_freq"] = f_max
 
@@ -58,10 +82,21 @@ def analyse_data_acc(acc_data, time_ranges, idx_range, airspeed, altitude, subti
     dict_results["f"] = f
     dict_results["Gxx"] = Gxx
 
+    # fine resolution PSD around each peak (ZOOM_REFINE)
+    dict_results["zoom"] = zoom
+
     damping_modal_ratio = None
+    damping_details = {}
     if cfg.CALC_DAMPING:
-        damping_modal_ratio = analyse_data_damping(data_extract, data_raw_extract, time_extract, str_title)
+        damping_modal_ratio, damping_details = analyse_data_damping(data_extract, data_raw_extract,
+                                                                    time_extract, str_title)
     dict_results["damping_modal_ratio"] = damping_modal_ratio
+
+    # diagnostic code for each damping ratio (DAMPING_HEADLESS or DAMPING_LSTSQ)
+    # confidence interval and residual of each damping ratio (DAMPING_LSTSQ)
+    dict_results["damping_diagnostics"] = damping_details.get("diagnostics")
+    dict_results["damping_ci"] = damping_details.get("ci")
+    dict_results["damping_residual"] = damping_details.get("residual")
     # TODO Change the name of these
     dict_results["f_modal"] = cfg_analysis.FREQ_FILTER_MODE
 
@@ -74,51 +109,93 @@ def analyse_data_acc(acc_data, time_ranges, idx_range, airspeed, altitude, subti
 
 def extract_time_and_data(acc_data, time_ranges, idx_range):
 
-    if time_ranges[idx_range] != 0:
+    data_extract, data_raw_extract, time_extract = extract_windows(acc_data, [time_ranges[idx_range]])[0]
 
-        if cfg_analysis.DATA_FORMAT == 0:
-            sys.exit("ERROR - DATA_FORMAT and TIME_RANGES mismatch")
+    if cfg.CHECK_STAT:
+        stationary_check(data_extract, time_extract, check_mean=False)
 
-        times = time_ranges[idx_range]
+    return data_extract, data_raw_extract, time_extract
 
-        time_lower = times[0] - cfg_analysis.OFFSET
-        time_upper = times[1] + cfg_analysis.OFFSET
 
-        idx_start = min(np.where(acc_data[:, cfg.COL_TIME] > time_lower)[0])
-        idx_end = max(np.where(acc_data[:, cfg.COL_TIME] < time_upper)[0])
-        time_extract = acc_data[:, cfg.COL_TIME][idx_start:idx_end]
-        data_extract = acc_data[:, cfg.COL_FILTERED][idx_start:idx_end]
-        data_raw_extract = acc_data[:, cfg.COL_SIGNAL][idx_start:idx_end]
+def extract_windows(acc_data, time_ranges):
+    """
+    Extracts the data of every time range in a file
 
-    else:
+    Returns a list with (data_extract, data_raw_extract, time_extract) for each time range. These
+    are views of acc_data (data_extract is a view of the memoised filtered window with
+    FILTER_PER_WINDOW) so must not be modified.
+    """
 
-        time_extract = acc_data[:, cfg.COL_TIME]
-        data_extract = acc_data[:, cfg.COL_FILTERED]
-        data_raw_extract = acc_data[:, cfg.COL_SIGNAL]
+    idx_starts, idx_ends = window_indices(acc_data, time_ranges)
 
-    if cfg.CHECK_STAT:
-        stationary_check(data_extract, time_extract, check_mean=False)
+    windows = []
+    for idx_start, idx_end in zip(idx_starts, idx_ends):
+        windows.append((filter_window_lowpass(acc_data, idx_start, idx_end),
+                        acc_data[:, cfg.COL_SIGNAL][idx_start:idx_end],
+                        acc_data[:, cfg.COL_TIME][idx_start:idx_end]))
+
+    return windows
 
-    return data_extract, data_raw_extract, time_extract
 
+def window_indices(acc_data, time_ranges):
+    """
+    Returns the start and end indices of every time range (the entire record if the range is 0)
 
-def analyse_data_freq(data_extract, time_extract, str_title, str_subtitle):
+    Time ranges are widened by OFFSET. The start is the first sample after the lower time and the
+    end is the last sample before the upper time. All boundaries are found together with a binary
+    search of the time column (which must be increasing).
+    """
+
+    time = acc_data[:, cfg.COL_TIME]
+
+    idx_starts = np.zeros(len(time_ranges), dtype=np.int64)
+    idx_ends = np.full(len(time_ranges), len(acc_data), dtype=np.int64)
+
+    idx_ranges = [idx_range for idx_range in range(len(time_ranges)) if time_ranges[idx_range] != 0]
+
+    if len(idx_ranges) > 0:
+
+        if cfg_analysis.DATA_FORMAT == 0:
+            sys.exit("ERROR - DATA_FORMAT and TIME_RANGES mismatch")
+
+        times = np.array([time_ranges[idx_range] for idx_range in idx_ranges], dtype=np.float64)
+
+        time_lower = times[:, 0] - cfg_analysis.OFFSET
+        time_upper = times[:, 1] + cfg_analysis.OFFSET
+
+        idx_starts[idx_ranges] = np.searchsorted(time, time_lower, side="right")
+        idx_ends[idx_ranges] = np.searchsorted(time, time_upper, side="left") - 1
+
+        if np.any(idx_starts[idx_ranges] >= len(time)) or np.any(idx_ends[idx_ranges] < 0):
+            sys.exit("ERROR - TIME_EXTRACT range is outside the recorded times")
+
+    return idx_starts, idx_ends
+
+
+def analyse_data_freq(data_extract, time_extract, str_title, str_subtitle, psd=None):
     """
     Frequency analysis of data
+    psd = (f, Gxx) of the data if already calculated
 
     Returns:
     - f_max = peaks in the frequency domain of data from the FFT (Hz)
     - f, Gxx = Welch FFT results
+    - zoom = list of (f, Gxx) around each peak at fine resolution (None unless ZOOM_REFINE)
     """
 
     samp_freq = cfg_analysis.SAMP_RATE
 
     f_max, f, Gxx = welch_calc(data=data_extract, samp_freq=samp_freq, time=time_extract,
-                               title=str_title, subtitle=str_subtitle)
+                               title=str_title, subtitle=str_subtitle, psd=psd)
+
+    zoom = None
+    if cfg.ZOOM_REFINE and len(f_max) > 0:
+        f_max, zoom = refine_peaks_zoom(data_extract, f_max, f[1] - f[0], samp_freq)
+
     print("Peak frequencies for {} are {}Hz".format(str_title, np.round(f_max, 2)))
     print("Refer to graph to verify all detected peaks")
 
-    return f_max, f, Gxx
+    return f_max, f, Gxx, zoom
 
 
 def analyse_data_damping(data_extract, data_raw_extract, time_extract, str_title):
@@ -127,14 +204,21 @@ def analyse_data_damping(data_extract, data_raw_extract, time_extract, str_title
 
     Returns:
     - damping_modal_ratio = damping ratio of data at specific mode
+    - damping_details = dict of the diagnostic codes ("diagnostics"), and with DAMPING_LSTSQ the
+      confidence intervals ("ci") and fit residuals ("residual") of each damping ratio
+      (empty unless DAMPING_HEADLESS or DAMPING_LSTSQ)
 
     TODO:
     - review if this needs to be the raw data
     """
 
     damping_modal_ratio = []
+    damping_details = {}
 
-    if cfg.FILTER_DAMPING:
+    if cfg.DAMPING_HEADLESS or cfg.DAMPING_LSTSQ:
+        damping_modal_ratio, damping_details = analyse_data_damping_headless(data_extract, data_raw_extract)
+
+    elif cfg.FILTER_DAMPING:
 
         if len(cfg_analysis.FREQ_FILTER_REF) == 0:
             low_freq_filter = float(input("Enter low frequency for band-pass filter: "))
@@ -145,11 +229,14 @@ def analyse_data_damping(data_extract, data_raw_extract, time_extract, str_title
             freq_filter = cfg_analysis.FREQ_FILTER_REF
             print("Filtering between: {} Hz".format(freq_filter))
 
+        # all bands filtered together (one row per band) with the mean of each row removed
+        filtered_data_bank = acc_filter_butter_bank(data=data_raw_extract, freq_bands=freq_filter,
+                                                    filter_type='bandpass')
+        filtered_data_bank -= np.mean(filtered_data_bank, axis=1, keepdims=True)
+
         for idx in range(len(freq_filter)):
             str_damp_subtitle = str(freq_filter[idx])
-            filtered_data_extract = acc_filter_butter(data=data_raw_extract, freq=freq_filter[idx],
-                                                      filter_type='bandpass')
-            damping_modal_ratio.append(calc_damping_ratio_log_dec(data=filtered_data_extract - np.mean(filtered_data_extract),
+            damping_modal_ratio.append(calc_damping_ratio_log_dec(data=filtered_data_bank[idx],
                                                                   time=time_extract,  title=str_title, subtitle=str_damp_subtitle))
 
     else:
@@ -159,16 +246,64 @@ def analyse_data_damping(data_extract, data_raw_extract, time_extract, str_title
     if damping_modal_ratio is not []:
         print("Damping ratio from logarithmic decrement method for identified mode in {} is {}".format(str_title, damping_modal_ratio))
 
-    return damping_modal_ratio
+    return damping_modal_ratio, damping_details
+
+
+def analyse_data_damping_headless(data_extract, data_raw_extract):
+    """
+    Damping analysis of data without any input or plots (DAMPING_HEADLESS or DAMPING_LSTSQ)
+    Bands are taken from FREQ_FILTER_REF and peaks are selected by DAMPING_PEAK_POLICY
+    With DAMPING_LSTSQ every selected peak of every band is fitted together (calc_damping_ratio_log_dec_lstsq)
+
+    Returns:
+    - damping_modal_ratio = damping ratio for each band (None where it could not be calculated)
+    - damping_details = dict of the diagnostic code (DAMPING_*) for each band ("diagnostics") and
+      with DAMPING_LSTSQ the confidence interval ("ci") and fit residual ("residual") for each band
+    """
+
+    if cfg.FILTER_DAMPING:
+
+        if len(cfg_analysis.FREQ_FILTER_REF) == 0:
+            if cfg.DAMPING_LSTSQ:
+                return [None], {"diagnostics": [DAMPING_NO_BANDS], "ci": [None], "residual": [None]}
+            return [None], {"diagnostics": [DAMPING_NO_BANDS]}
+
+        data_bank = acc_filter_butter_bank(data=data_raw_extract, freq_bands=cfg_analysis.FREQ_FILTER_REF,
+                                           filter_type='bandpass')
+        data_bank -= np.mean(data_bank, axis=1, keepdims=True)
+
+    else:
+        data_bank = (data_extract - np.mean(data_extract))[np.newaxis]
+
+    if cfg.DAMPING_LSTSQ:
+        damp_ratio, damp_ratio_ci, residual, damping_diagnostics = calc_damping_ratio_log_dec_lstsq(data_bank)
+
+        calculated = [diagnostic == DAMPING_OK for diagnostic in damping_diagnostics]
+        damping_modal_ratio = [float(damp_ratio[idx]) if calculated[idx] else None for idx in range(len(data_bank))]
+        damping_ci = [tuple(damp_ratio_ci[idx].tolist()) if calculated[idx] else None for idx in range(len(data_bank))]
+        damping_residual = [float(residual[idx]) if calculated[idx] else None for idx in range(len(data_bank))]
+
+        return damping_modal_ratio, {"diagnostics": damping_diagnostics, "ci": damping_ci, "residual": damping_residual}
+
+    damping_modal_ratio = []
+    damping_diagnostics = []
+
+    for data in data_bank:
+        damp_ratio, diagnostic = calc_damping_ratio_log_dec_headless(data)
+        damping_modal_ratio.append(damp_ratio)
+        damping_diagnostics.append(diagnostic)
+
+    return damping_modal_ratio, {"diagnostics": damping_diagnostics}
 
 # ---------------------------------
 # FUNCTIONS - FREQUENCY ANALYSIS
 # ---------------------------------
 
 
-def welch_calc(data, time, samp_freq, title=None, subtitle=None):
+def welch_calc(data, time, samp_freq, title=None, subtitle=None, psd=None):
     """
     Estimate the power spectral density (signal relative power at different frequencies) with Fourier transform
+    psd = (f, Gxx) of the data if already calculated (only the peaks are found)
 
     TODO - time unused currently, may be used in case of unequal time spacing in future
     """
@@ -182,7 +317,16 @@ def welch_calc(data, time, samp_freq, title=None, subtitle=None):
     # main magic here
     # https://docs.scipy.org/doc/scipy-0.14.0/reference/generated/scipy.signal.welch.html
     # https://docs.scipy.org/doc/scipy/reference/signal.windows.html?highlight=window#module-scipy.signal.windows
-    [f, Gxx] = signal.welch(x=data, fs=samp_freq, nperseg=cfg_analysis.BIN_SIZE, window='hann')
+    nperseg = samples_at_samp_rate(cfg_analysis.BIN_SIZE)
+
+    if psd is not None:
+        f, Gxx = psd
+    elif len(data) >= nperseg:
+        f, Gxx = welch_batch([data], samp_freq)
+        Gxx = Gxx[0]
+    else:
+        # signal.welch shortens the segments (with a warning) for data shorter than BIN_SIZE
+        [f, Gxx] = signal.welch(x=data, fs=samp_freq, nperseg=nperseg, window='hann')
 
     if cfg.SHOW_DETAIL:
         print(f"Length of data sample is {len(data)}")
@@ -197,6 +341,160 @@ def welch_calc(data, time, samp_freq, title=None, subtitle=None):
 
     return f_max, f, Gxx
 
+
+def welch_test_points(acc_data, time_ranges):
+    """
+    Estimate the power spectral density of every time range in a file in one batch (welch_batch)
+
+    Returns:
+    - f, Gxx = Welch results with one row of Gxx per time range
+    - None if any time range is shorter than BIN_SIZE (each is then estimated separately)
+    """
+
+    windows = [data_extract for data_extract, _, _ in extract_windows(acc_data, time_ranges)]
+
+    if min(len(window) for window in windows) < samples_at_samp_rate(cfg_analysis.BIN_SIZE):
+        return None
+
+    return welch_batch(windows, cfg_analysis.SAMP_RATE)
+
+
+def welch_batch(windows, samp_freq, nperseg=None):
+    """
+    Estimate the power spectral density of several windows of data at once with Welch's method
+
+    Each window is split into half overlapping segments of nperseg (default BIN_SIZE at the recorded
+    sample rate) samples with strided views, all segments are transformed in one stacked rfft and
+    the segment spectra are averaged for each window. Matches signal.welch (hann window, constant detrend, density scaling)
+    for each window. Windows can be from different test points or files with the same sample rate.
+
+    Returns:
+    - f = frequencies shared by all windows (Hz)
+    - Gxx = power spectral density with one row per window
+    """
+
+    if nperseg is None:
+        nperseg = samples_at_samp_rate(cfg_analysis.BIN_SIZE)
+
+    segments, num_segments, scale = _welch_segments(windows, nperseg, samp_freq)
+    psd = _segment_psd(segments, scale)
+
+    Gxx = np.add.reduceat(psd, np.cumsum(num_segments) - num_segments, axis=0)/num_segments[:, np.newaxis]
+    f = np.fft.rfftfreq(nperseg, 1/samp_freq)
+
+    return f, Gxx.astype(segments.dtype, copy=False)
+
+
+def refine_peaks_zoom(data, f_max, freq_step, samp_freq):
+    """
+    Refines peak frequencies with a fine resolution PSD over a narrow band around each peak
+
+    The band covers ZOOM_HALF_WIDTH_BINS coarse bins (freq_step) either side of each peak. Welch's
+    method is used with segments ZOOM_SEGMENT_FACTOR times longer than BIN_SIZE (limited to the
+    data length) for finer resolution, but each segment is only evaluated at ZOOM_NUM_POINTS
+    frequencies in the band (_zoom_dft) rather than with a full FFT.
+
+    Returns:
+    - f_max = refined peak frequencies (Hz)
+    - zoom = list of (f, Gxx) for the band around each peak
+    """
+
+    nperseg = min(cfg.ZOOM_SEGMENT_FACTOR*samples_at_samp_rate(cfg_analysis.BIN_SIZE), len(data))
+    segments, _, scale = _welch_segments([data], nperseg, samp_freq)
+
+    f_max_refined = []
+    zoom = []
+
+    for f_peak in f_max:
+        f_band = [max(f_peak - cfg.ZOOM_HALF_WIDTH_BINS*freq_step, 0),
+                  min(f_peak + cfg.ZOOM_HALF_WIDTH_BINS*freq_step, samp_freq/2)]
+
+        f_zoom = np.linspace(f_band[0], f_band[1], cfg.ZOOM_NUM_POINTS)
+
+        # one sided density (averaged over segments) as in welch_batch
+        Gxx_zoom = 2*scale*np.mean(np.abs(_zoom_dft(segments, f_zoom, samp_freq))**2, axis=0)
+        Gxx_zoom[(f_zoom == 0) | (f_zoom == samp_freq/2)] /= 2
+
+        f_max_refined.append(f_zoom[np.argmax(Gxx_zoom)])
+        zoom.append((f_zoom, Gxx_zoom))
+
+    if cfg.SHOW_DETAIL:
+        print(f"Frequency step around peaks refined from {freq_step:.3f}Hz to {samp_freq/nperseg:.3f}Hz "
+              f"(evaluated every {(f_zoom[1] - f_zoom[0]):.4f}Hz)")
+
+    return np.array(f_max_refined), zoom
+
+
+def _zoom_dft(segments, f_zoom, samp_freq):
+    """Returns the DFT of each segment (one per row) at the frequencies f_zoom only
+
+    Evaluated directly as a matrix product with the DFT kernel of the band, which is cheaper than
+    a full FFT for the few frequencies in a narrow band
+    """
+
+    time_segment = np.arange(segments.shape[1])/samp_freq
+    kernel = np.exp(-2j*np.pi*np.outer(time_segment, f_zoom))
+
+    return segments @ kernel
+
+
+def _segment_psd(segments, scale):
+    """Returns the one sided power spectral density of each (windowed) segment in one stacked rfft"""
+
+    spectra = scipy.fft.rfft(segments, axis=1)
+    psd = np.abs(spectra)**2*scale
+
+    # one sided spectrum (DC and Nyquist are not doubled)
+    if segments.shape[1] % 2:
+        psd[:, 1:] *= 2
+    else:
+        psd[:, 1:-1] *= 2
+
+    return psd
+
+
+def _welch_segments(windows, nperseg, samp_freq):
+    """Splits windows into half overlapping detrended and windowed segments for Welch's method
+
+    Returns:
+    - segments = segments of all windows (one per row) - the only copy of the data
+    - num_segments = number of segments of each window
+    - scale = density scaling of the segment spectra
+    """
+
+    step = nperseg - nperseg//2
+
+    segments = []
+    for window in windows:
+        if len(window) < nperseg:
+            sys.exit(f"ERROR - Window of {len(window)} samples is shorter than the Welch segment length ({nperseg})")
+        segments.append(np.lib.stride_tricks.sliding_window_view(np.asarray(window), nperseg)[::step])
+
+    num_segments = np.array([len(segments_window) for segments_window in segments])
+
+    # detrended and windowed in place
+    dtype = np.result_type(*[segments_window.dtype for segments_window in segments], np.float32)
+    segments = np.concatenate(segments).astype(dtype, copy=False)
+    segments -= np.mean(segments, axis=1, keepdims=True)
+
+    hann_window, scale = _welch_window(nperseg, samp_freq)
+    segments *= hann_window.astype(dtype, copy=False)
+
+    return segments, num_segments, scale
+
+
+@functools.lru_cache(maxsize=WELCH_WINDOW_CACHE_SIZE)
+def _welch_window(nperseg, samp_freq):
+    """Returns the hann window and density scaling for Welch's method (memoised)
+
+    The returned window is shared between calls and must not be modified
+    """
+
+    hann_window = signal.get_window('hann', nperseg)
+    scale = 1/(samp_freq*np.sum(hann_window**2))
+
+    return hann_window, scale
+
 # ---------------------------------
 # FUNCTIONS - DAMPING ANALYSIS
 # ---------------------------------
@@ -209,7 +507,8 @@ def calc_damping_ratio_log_dec(data, time, title=None, subtitle=None):
     Only valid for damping ratio < 1 and less accurate for damping ratio > 0.5
     """
 
-    max_idx = signal.find_peaks(data, height=0.25*max(data), distance=20)
+    max_idx = signal.find_peaks(data, height=cfg.DAMPING_PEAK_HEIGHT*max(data),
+                                distance=samples_at_samp_rate(cfg.DAMPING_PEAK_DISTANCE))
 
     plot_acc(data=data, time=time,  title=title, peaks_idx=max_idx,
              subtitle=subtitle, save_image=True, filtered_image=True)
@@ -265,6 +564,252 @@ def calc_damping_ratio_log_dec(data, time, title=None, subtitle=None):
     return damp_ratio
 
 
+def analyse_damping_half_power(results):
+    """
+    Half-power bandwidth damping of every peak of every test point from the PSD in its results
+    Test points with the same frequencies are estimated together
+
+    Returns the results with "damping_half_power" added (damping ratio of each "modal_freq")
+    """
+
+    print("\nStarting half-power bandwidth method of determining damping ratio...")
+
+    # indices of the test points sharing each frequency array
+    groups = []
+    for idx_result, result in enumerate(results):
+        for f_group, idx_group in groups:
+            if np.array_equal(result["f"], f_group):
+                idx_group.append(idx_result)
+                break
+        else:
+            groups.append((result["f"], [idx_result]))
+
+    for f_group, idx_group in groups:
+        Gxx = np.vstack([results[idx_result]["Gxx"] for idx_result in idx_group])
+        f_peaks = [results[idx_result]["modal_freq"] for idx_result in idx_group]
+
+        damping_ratios = calc_damping_ratio_half_power(f_group, Gxx, f_peaks)
+
+        for idx_result, damping_ratio in zip(idx_group, damping_ratios):
+            results[idx_result]["damping_half_power"] = damping_ratio
+
+            if cfg.SHOW_DETAIL:
+                print(f"Damping ratio from half-power method at {results[idx_result]['airspeed']} @ "
+                      f"{results[idx_result]['altitude']}K for {np.round(results[idx_result]['modal_freq'], 2)}Hz "
+                      f"is {np.round(damping_ratio, 4)}")
+
+    return results
+
+
+def calc_damping_ratio_half_power(f, Gxx, f_peaks):
+    """
+    Calculate the damping ratio of PSD peaks from their half-power (-3dB) bandwidth
+    damping ratio = (f_upper - f_lower)/(2*f_peak)
+    Only valid for lightly damped, well separated modes and requires several frequency steps across each peak
+
+    f = frequencies shared by every row of Gxx
+    Gxx = PSD (one row per test point, or a single PSD)
+    f_peaks = peak frequencies for each row (the nearest frequency step is used as the peak)
+
+    Returns an array of damping ratios for each row (nan where a half-power point is not found)
+    """
+
+    if np.ndim(Gxx) == 1:
+        return calc_damping_ratio_half_power(f, np.asarray(Gxx)[np.newaxis], [f_peaks])[0]
+
+    f = np.asarray(f, dtype=np.float64)
+    Gxx = np.asarray(Gxx, dtype=np.float64)
+
+    num_peaks = [len(f_peaks_row) for f_peaks_row in f_peaks]
+    if sum(num_peaks) == 0:
+        return [np.array([]) for _ in f_peaks]
+
+    # every peak of every row together
+    rows = np.repeat(np.arange(len(f_peaks)), num_peaks)
+    idx_peak = np.round(np.interp(np.concatenate(f_peaks), f, np.arange(len(f)))).astype(int)
+
+    Gxx_peaks = Gxx[rows]
+    half_power = Gxx_peaks[np.arange(len(rows)), idx_peak]/2
+    below = Gxx_peaks < half_power[:, np.newaxis]
+
+    # last step below half power before each peak and first step below after it
+    idx_freq = np.arange(len(f))
+    idx_lower = np.max(np.where(below & (idx_freq < idx_peak[:, np.newaxis]), idx_freq, -1), axis=1)
+    idx_upper = np.min(np.where(below & (idx_freq > idx_peak[:, np.newaxis]), idx_freq, len(f)), axis=1)
+
+    valid = (idx_lower >= 0) & (idx_upper < len(f))
+    idx_lower = np.where(valid, idx_lower, 0)
+    idx_upper = np.where(valid, idx_upper, 1)
+    rows_peaks = np.arange(len(rows))
+
+    # linear interpolation of the crossings
+    f_lower = _interp_crossing(f[idx_lower], f[idx_lower + 1],
+                               Gxx_peaks[rows_peaks, idx_lower], Gxx_peaks[rows_peaks, idx_lower + 1], half_power)
+    f_upper = _interp_crossing(f[idx_upper - 1], f[idx_upper],
+                               Gxx_peaks[rows_peaks, idx_upper - 1], Gxx_peaks[rows_peaks, idx_upper], half_power)
+
+    damp_ratio = np.where(valid, (f_upper - f_lower)/(2*f[idx_peak]), np.nan)
+
+    return np.split(damp_ratio, np.cumsum(num_peaks)[:-1])
+
+
+def _interp_crossing(f_1, f_2, Gxx_1, Gxx_2, level):
+    """Frequency where the PSD crosses level between two frequency steps (linear interpolation)"""
+
+    return f_1 + (level - Gxx_1)*(f_2 - f_1)/(Gxx_2 - Gxx_1)
+
+
+def calc_damping_ratio_log_dec_headless(data):
+    """
+    Calculate the damping ratio by logarithmic decrement without any input or plots
+    Peaks are detected with DAMPING_PEAK_HEIGHT and DAMPING_PEAK_DISTANCE and selected by DAMPING_PEAK_POLICY
+
+    Returns:
+    - damp_ratio = damping ratio (None if it could not be calculated)
+    - diagnostic = diagnostic code (DAMPING_*)
+    """
+
+    peaks, diagnostic = _log_dec_peaks(data)
+
+    if diagnostic != DAMPING_OK:
+        return None, diagnostic
+
+    num_cycles = len(peaks) - 1
+    log_dec = (1/num_cycles)*math.log(peaks[0]/peaks[-1])
+
+    if log_dec <= 0:
+        return None, DAMPING_NO_DECAY
+
+    damp_ratio = 1/math.sqrt(1 + (2*math.pi/log_dec)**2)
+
+    return damp_ratio, DAMPING_OK
+
+
+def calc_damping_ratio_log_dec_lstsq(data_bank):
+    """
+    Calculate the damping ratio by logarithmic decrement from a least squares fit of every peak
+    log(peak amplitude) is fitted against cycle number over the peaks selected by DAMPING_PEAK_POLICY
+    (logarithmic decrement = -slope) for every band (row of data_bank) in one vectorised solve
+
+    Returns:
+    - damp_ratio = damping ratio of each band (nan where not calculated)
+    - damp_ratio_ci = DAMPING_CONFIDENCE confidence interval of each damping ratio (nan with only two peaks)
+    - residual = RMS residual of the fit of log(peak amplitude) for each band
+    - diagnostics = diagnostic code (DAMPING_*) for each band
+    """
+
+    peaks_bands = []
+    diagnostics = []
+    for data in data_bank:
+        peaks, diagnostic = _log_dec_peaks(data)
+        peaks_bands.append(peaks if diagnostic == DAMPING_OK else np.array([]))
+        diagnostics.append(diagnostic)
+
+    num_bands = len(data_bank)
+    num_peaks = np.array([len(peaks) for peaks in peaks_bands])
+
+    # log peak amplitudes padded to the same number of peaks (mask marks real peaks)
+    cycles = np.arange(max(np.max(num_peaks, initial=0), 2))
+    mask = cycles < num_peaks[:, np.newaxis]
+    log_peaks = np.zeros((num_bands, len(cycles)))
+    log_peaks[mask] = np.log(np.concatenate(peaks_bands + [np.array([])]))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cycles_mean = np.sum(cycles*mask, axis=1)/num_peaks
+        log_peaks_mean = np.sum(log_peaks*mask, axis=1)/num_peaks
+
+        cycles_dev = (cycles - cycles_mean[:, np.newaxis])*mask
+        log_peaks_dev = (log_peaks - log_peaks_mean[:, np.newaxis])*mask
+
+        sum_cycles_sq = np.sum(cycles_dev**2, axis=1)
+        slope = np.sum(cycles_dev*log_peaks_dev, axis=1)/sum_cycles_sq
+
+        sum_residual_sq = np.sum((log_peaks_dev - slope[:, np.newaxis]*cycles_dev)**2, axis=1)
+        residual = np.sqrt(sum_residual_sq/num_peaks)
+
+        # standard error of the slope and confidence interval (t distribution)
+        dof = num_peaks - 2
+        slope_error = np.sqrt(sum_residual_sq/dof/sum_cycles_sq)
+        t_value = np.where(dof > 0, stats.t.ppf(0.5 + cfg.DAMPING_CONFIDENCE/2, np.maximum(dof, 1)), np.nan)
+
+        log_dec = -slope
+        log_dec_ci = np.column_stack((log_dec - t_value*slope_error, log_dec + t_value*slope_error))
+
+    damp_ratio = _log_dec_to_damping_ratio(log_dec)
+    damp_ratio_ci = _log_dec_to_damping_ratio(log_dec_ci)
+
+    for idx in range(num_bands):
+        if diagnostics[idx] == DAMPING_OK and not log_dec[idx] > 0:
+            diagnostics[idx] = DAMPING_NO_DECAY
+
+    calculated = np.array([diagnostic == DAMPING_OK for diagnostic in diagnostics], dtype=bool)
+    damp_ratio[~calculated] = np.nan
+    damp_ratio_ci[~calculated] = np.nan
+    residual[~calculated] = np.nan
+
+    return damp_ratio, damp_ratio_ci, residual, diagnostics
+
+
+def _log_dec_to_damping_ratio(log_dec):
+    """Damping ratio from the logarithmic decrement (negative for growing oscillations)"""
+
+    return log_dec/np.sqrt(4*math.pi**2 + log_dec**2)
+
+
+def _log_dec_peaks(data):
+    """
+    Detects peaks with DAMPING_PEAK_HEIGHT and DAMPING_PEAK_DISTANCE and selects them by DAMPING_PEAK_POLICY
+
+    Returns:
+    - peaks = amplitudes of the selected peaks (initial to later peak)
+    - diagnostic = diagnostic code (DAMPING_*)
+    """
+
+    if len(data) == 0 or not np.all(np.isfinite(data)):
+        return None, DAMPING_INVALID_DATA
+
+    if np.max(data) <= 0:
+        return None, DAMPING_TOO_FEW_PEAKS
+
+    max_idx, _ = signal.find_peaks(data, height=cfg.DAMPING_PEAK_HEIGHT*np.max(data),
+                                   distance=samples_at_samp_rate(cfg.DAMPING_PEAK_DISTANCE))
+
+    if len(max_idx) < 2:
+        return None, DAMPING_TOO_FEW_PEAKS
+
+    idx_1, idx_2 = select_log_dec_peaks(data[max_idx])
+
+    if idx_2 - idx_1 < 1:
+        return None, DAMPING_NO_CYCLES
+
+    return data[max_idx[idx_1:idx_2 + 1]], DAMPING_OK
+
+
+def select_log_dec_peaks(peaks):
+    """
+    Selects the initial and later peak for the logarithmic decrement by DAMPING_PEAK_POLICY
+    - "max_to_last" = largest peak to the last peak (as DAMPING_AUTOMATIC)
+    - "max_cycles" = largest peak to DAMPING_NUM_CYCLES peaks later (or the last peak)
+    - "first_to_last" = first peak to the last peak
+
+    Returns the indices of the initial and later peak
+    """
+
+    if cfg.DAMPING_PEAK_POLICY == "max_to_last":
+        idx_1 = int(np.argmax(peaks))
+        idx_2 = len(peaks) - 1
+    elif cfg.DAMPING_PEAK_POLICY == "max_cycles":
+        idx_1 = int(np.argmax(peaks))
+        idx_2 = min(idx_1 + cfg.DAMPING_NUM_CYCLES, len(peaks) - 1)
+    elif cfg.DAMPING_PEAK_POLICY == "first_to_last":
+        idx_1 = 0
+        idx_2 = len(peaks) - 1
+    else:
+        sys.exit(f"ERROR - Invalid DAMPING_PEAK_POLICY (Policy selected: {cfg.DAMPING_PEAK_POLICY})")
+
+    return idx_1, idx_2
+
+
 def validate_log_dec_peak_selection(idx, ref_idx):
     """
     Checks that user input damping peak indicies are valid and coverts them to integers
@@ -279,3 +824,106 @@ def validate_log_dec_peak_selection(idx, ref_idx):
         sys.exit()
 
     return idx_corr
+
+# ---------------------------------
+# FUNCTIONS - TEST POINT DETECTION
+# ---------------------------------
+
+
+def detect_test_points(acc_data, atmos_data=None):
+    """
+    Detects test points in an entire recording from the RMS envelope of the signal and the pressure altitude
+
+    Excitation events (stick raps, pulses) are RMS windows above DETECT_EVENT_FACTOR times the median RMS.
+    A test point of DETECT_WINDOW_TIME is proposed from the start of each event (shortened at the next
+    event) and dropped if shorter than DETECT_MIN_WINDOW_TIME. Test points are stable if the pressure
+    altitude varies by no more than DETECT_ALT_TOLERANCE (ft) over them.
+
+    Returns a list of test points (dicts of start, end, airspeed, altitude, altitude_ft,
+    altitude_range_ft, stable and rms_peak). Airspeed is None as there is no airspeed channel and
+    altitude is in thousands of ft (as ALTITUDE) - both are None without atmospheric data.
+    """
+
+    time_rms, rms = rms_envelope(acc_data)
+
+    if len(rms) == 0:
+        return []
+
+    above = rms > cfg.DETECT_EVENT_FACTOR*np.median(rms)
+
+    # first and last RMS window of each event
+    above_padded = np.concatenate(([False], above, [False]))
+    idx_event_starts = np.flatnonzero(above_padded[1:-1] & ~above_padded[:-2])
+    idx_event_ends = np.flatnonzero(above_padded[1:-1] & ~above_padded[2:])
+
+    time_end_record = acc_data[:, cfg.COL_TIME][-1]
+    time_event_starts = time_rms[idx_event_starts]
+    time_next_events = np.append(time_event_starts[1:], time_end_record)
+
+    test_points = []
+
+    for idx_event in range(len(idx_event_starts)):
+        time_start = float(time_event_starts[idx_event])
+        time_end = float(min(time_start + cfg.DETECT_WINDOW_TIME, time_next_events[idx_event]))
+
+        if time_end - time_start < cfg.DETECT_MIN_WINDOW_TIME:
+            continue
+
+        rms_peak = np.max(rms[idx_event_starts[idx_event]:idx_event_ends[idx_event] + 1])
+
+        test_point = {"start": round(time_start, 3), "end": round(time_end, 3), "airspeed": None,
+                      "altitude": None, "altitude_ft": None, "altitude_range_ft": None, "stable": None,
+                      "rms_peak": round(float(rms_peak), 4)}
+
+        if atmos_data is not None:
+            test_point.update(_test_point_altitude(atmos_data, time_start, time_end))
+
+        test_points.append(test_point)
+
+    if cfg.SHOW_DETAIL:
+        print(f"{len(idx_event_starts)} excitation events and {len(test_points)} test points detected")
+
+    return test_points
+
+
+def rms_envelope(acc_data):
+    """
+    RMS (about the mean) of the signal in consecutive windows of DETECT_RMS_TIME
+    The signal is read DETECT_BLOCK_WINDOWS windows at a time so memory use does not depend on its length
+
+    Returns the start time and RMS of each window
+    """
+
+    window = max(int(round(cfg.DETECT_RMS_TIME*cfg_analysis.SAMP_RATE)), 1)
+    num_windows = len(acc_data)//window
+
+    data = acc_data[:, cfg.COL_SIGNAL]
+    rms = np.empty(num_windows)
+
+    for window_start in range(0, num_windows, cfg.DETECT_BLOCK_WINDOWS):
+        window_end = min(window_start + cfg.DETECT_BLOCK_WINDOWS, num_windows)
+
+        block = np.asarray(data[window_start*window:window_end*window], dtype=np.float64).reshape(-1, window)
+        rms[window_start:window_end] = np.std(block, axis=1)
+
+    time_rms = acc_data[:, cfg.COL_TIME][:num_windows*window:window]
+
+    return time_rms, rms
+
+
+def _test_point_altitude(atmos_data, time_start, time_end):
+    """Mean and range of the pressure altitude (ft) over a test point and whether it is stable"""
+
+    time_atmos = atmos_data[:, cfg.COL_TIME]
+    idx_start, idx_end = np.searchsorted(time_atmos, [time_start, time_end], side="left")
+
+    # nearest sample if the atmospheric data is sampled slower than the test point
+    if idx_end <= idx_start:
+        idx_start = min(idx_start, len(time_atmos) - 1)
+        idx_end = idx_start + 1
+
+    altitude = np.asarray(atmos_data[:, cfg.COL_ALT][idx_start:idx_end], dtype=np.float64)
+    altitude_range = float(np.max(altitude) - np.min(altitude))
+
+    return {"altitude": int(round(np.mean(altitude)/1000)), "altitude_ft": round(float(np.mean(altitude)), 1),
+            "altitude_range_ft": round(altitude_range, 1), "stable": altitude_range <= cfg.DETECT_ALT_TOLERANCE}
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""flutter_benchmark
+
+Benchmarks of the data processing stages against their reference implementations.
+
+Uses synthetic data so no dataset or configuration beyond flutter_config is required.
+
+  Typical usage example:
+
+  python flutter_benchmark.py
+"""
+
+# ---------------------------------
+# IMPORTS
+# ---------------------------------
+
+from datetime import datetime, timedelta
+import numpy as np
+import os
+import tempfile
+import time
+import tracemalloc
+
+import flutter_config as cfg
+from flutter_config import cfg_analysis
+
+from flutter_analysis import window_indices
+from flutter_input import _convert_times, _identify_time_format, read_csv_endevco, make_acc_data
+from flutter_other import stationary_check_autocorrelation
+
+# ---------------------------------
+# CONSTANTS
+# ---------------------------------
+
+# number of rows of synthetic data used in each benchmark
+NUM_ROWS_BENCHMARK = 200000
+
+# ---------------------------------
+# FUNCTIONS - DATA
+# ---------------------------------
+
+
+def make_time_strings(num_rows, time_format, samp_rate=1000):
+    """Makes an array of time strings at a constant sample rate that crosses a rollover"""
+
+    # starts just before midnight (and the hour) so every format wraps
+    time_start = datetime(2019, 11, 28, 23, 59, 30)
+    times = [time_start + timedelta(seconds=idx/samp_rate) for idx in range(num_rows)]
+
+    if time_format == "%d/%m/%Y %H:%M:%S.%f %p":
+        # 12 hour clock as exported by the DAQ
+        time_str = [t.strftime("%d/%m/%Y %I:%M:%S.") + f"{t.microsecond//1000:03d}" + t.strftime(" %p") for t in times]
+    else:
+        time_str = [t.strftime(time_format)[:-3] for t in times]
+
+    return np.array(time_str), np.arange(num_rows)/samp_rate
+
+
+def make_csv_endevco(filepath, num_rows):
+    """Writes a synthetic Endevco style csv (quoted fields, index, time and voltage columns)"""
+
+    time_str, _ = make_time_strings(num_rows, "%d/%m/%Y %H:%M:%S.%f %p")
+    voltage = 2.5 + 0.01*np.sin(2*np.pi*5*np.arange(num_rows)/1000)
+
+    with open(filepath, "w") as csv_file:
+        csv_file.write("\"Sample\",\"Time\",\"Voltage\"\n")
+        for idx in range(num_rows):
+            csv_file.write(f"\"{idx}\",\"{time_str[idx]}\",\"{voltage[idx]:.6f}\"\n")
+
+
+def convert_times_loop(data, time_format):
+    """Original time conversion (strptime one row at a time) - kept as a reference for benchmarking"""
+
+    time_basis = np.zeros(data.size)
+
+    time_start = datetime.strptime(data[0], time_format)
+
+    for idx in range(1, len(data)):
+        tmp_conv = datetime.strptime(data[idx], time_format)
+        time_conv = tmp_conv - time_start
+        time_conv = time_conv.seconds + time_conv.microseconds*1e-6
+        time_basis[idx] = time_conv
+
+    return time_basis
+
+
+def read_csv_endevco_genfromtxt(filepath):
+    """Original Endevco csv import (whole file as strings) - kept as a reference for benchmarking"""
+
+    acc_data_raw = np.genfromtxt(filepath, delimiter=",", dtype='unicode', skip_header=1)
+    acc_data_cleaned = np.char.strip(acc_data_raw, "\"")
+
+    sample_conv = acc_data_cleaned[:, 0].astype(int)
+    time_basis = acc_data_cleaned[:, 1]
+    time_conv = _convert_times(time_basis, _identify_time_format(time_basis[1]))
+    voltage_conv = acc_data_cleaned[:, 2].astype(float)
+
+    return sample_conv, time_conv, voltage_conv
+
+
+def stationary_check_autocorrelation_correlate(data):
+    """Original autocorrelation stationary check (np.correlate) - kept as a reference for benchmarking"""
+
+    num_segments = 3
+    num_points = len(data)//num_segments
+
+    autocorr_norm = np.zeros([num_segments, num_points-1])
+
+    for idx in range(num_segments):
+        x = data[idx*num_points:(idx+1)*num_points]
+        x = x - x.mean()
+
+        autocorr = np.correlate(x, x, mode='full')
+        autocorr = autocorr[x.size:]
+        autocorr /= autocorr.max()
+
+        autocorr_norm[idx, :] = autocorr
+
+    return autocorr_norm
+
+
+def window_indices_where(acc_data, time_ranges):
+    """Original time range search (np.where over the time column for each range) - kept as a reference for benchmarking"""
+
+    idx_starts = []
+    idx_ends = []
+
+    for idx_range in range(len(time_ranges)):
+        if time_ranges[idx_range] != 0:
+            times = time_ranges[idx_range]
+
+            time_lower = times[0] - cfg_analysis.OFFSET
+            time_upper = times[1] + cfg_analysis.OFFSET
+            idx_start = min(np.where(acc_data[:, cfg.COL_TIME] > time_lower)[0])
+            idx_end = max(np.where(acc_data[:, cfg.COL_TIME] < time_upper)[0])
+        else:
+            idx_start = 0
+            idx_end = len(acc_data)
+
+        idx_starts.append(idx_start)
+        idx_ends.append(idx_end)
+
+    return np.array(idx_starts), np.array(idx_ends)
+
+
+def measure(func, *args):
+    """Runs a function and returns its result, duration (s) and peak traced memory (bytes)"""
+
+    tracemalloc.start()
+    time_start = time.perf_counter()
+    result = func(*args)
+    duration = time.perf_counter() - time_start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, duration, peak_memory
+
+# ---------------------------------
+# FUNCTIONS - BENCHMARKS
+# ---------------------------------
+
+
+def benchmark_convert_times(num_rows=NUM_ROWS_BENCHMARK):
+    """Compares rows/second of the vectorised time conversion against the row by row loop"""
+
+    print("\nBenchmarking time conversion...")
+
+    for time_format in ["%d/%m/%Y %H:%M:%S.%f %p", "%M:%S.%f", "%S.%f"]:
+
+        time_str, time_expected = make_time_strings(num_rows, time_format)
+
+        time_start = time.perf_counter()
+        time_loop = convert_times_loop(time_str, time_format)
+        duration_loop = time.perf_counter() - time_start
+
+        time_start = time.perf_counter()
+        time_vector = _convert_times(time_str, time_format)
+        duration_vector = time.perf_counter() - time_start
+
+        error_loop = np.max(np.abs(time_loop - time_expected))
+        error_vector = np.max(np.abs(time_vector - time_expected))
+
+        print(f"Format {time_format}:")
+        print(f"  Loop:       {num_rows/duration_loop:12.0f} rows/s (max. error {error_loop:.3f}s)")
+        print(f"  Vectorised: {num_rows/duration_vector:12.0f} rows/s (max. error {error_vector:.3f}s)")
+        print(f"  Speedup:    {duration_loop/duration_vector:12.1f}x")
+
+
+def benchmark_read_csv_endevco(num_rows=NUM_ROWS_BENCHMARK):
+    """Compares time and peak memory of the streaming Endevco csv reader against genfromtxt"""
+
+    print("\nBenchmarking Endevco csv import...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, "endevco.csv")
+        make_csv_endevco(filepath, num_rows)
+        file_size = os.path.getsize(filepath)
+
+        result_ref, duration_ref, memory_ref = measure(read_csv_endevco_genfromtxt, filepath)
+        result_new, duration_new, memory_new = measure(read_csv_endevco, filepath, 0, 1, 2, 1)
+
+    for col_ref, col_new in zip(result_ref, result_new):
+        assert np.allclose(col_ref, col_new)
+
+    print(f"File size: {file_size/1e6:.1f}MB")
+    print(f"  genfromtxt: {num_rows/duration_ref:12.0f} rows/s, peak memory {memory_ref/1e6:8.1f}MB")
+    print(f"  Streaming:  {num_rows/duration_new:12.0f} rows/s, peak memory {memory_new/1e6:8.1f}MB")
+
+
+def benchmark_autocorrelation(num_rows=NUM_ROWS_BENCHMARK//4):
+    """Compares the FFT autocorrelation stationary check against np.correlate"""
+
+    print("\nBenchmarking autocorrelation stationary check...")
+
+    data = np.sin(2*np.pi*5*np.arange(num_rows)/1000) + np.random.default_rng(0).standard_normal(num_rows)
+
+    time_start = time.perf_counter()
+    autocorr_ref = stationary_check_autocorrelation_correlate(data)
+    duration_ref = time.perf_counter() - time_start
+
+    time_start = time.perf_counter()
+    autocorr_new, _ = stationary_check_autocorrelation(data)
+    duration_new = time.perf_counter() - time_start
+
+    error = np.max(np.abs(autocorr_ref - autocorr_new))
+
+    print(f"  np.correlate: {duration_ref:8.3f}s")
+    print(f"  FFT:          {duration_new:8.3f}s (max. difference {error:.1e})")
+    print(f"  Speedup:      {duration_ref/duration_new:8.1f}x")
+
+
+def benchmark_window_indices(num_rows=NUM_ROWS_BENCHMARK, num_ranges=50):
+    """Compares the searchsorted time range boundaries against np.where for each range"""
+
+    print("\nBenchmarking time range boundaries...")
+
+    if cfg_analysis.DATA_FORMAT == 0:
+        print("  Skipped - time ranges are not used with DATA_FORMAT 0")
+        return
+
+    time_conv = np.arange(num_rows)/1000
+    acc_data = make_acc_data(np.arange(num_rows), time_conv, np.zeros(num_rows))
+
+    time_starts = np.linspace(1, time_conv[-1] - 10, num_ranges)
+    time_ranges = [[time_start, time_start + 5] for time_start in time_starts]
+
+    time_start = time.perf_counter()
+    idx_ref = window_indices_where(acc_data, time_ranges)
+    duration_ref = time.perf_counter() - time_start
+
+    time_start = time.perf_counter()
+    idx_new = window_indices(acc_data, time_ranges)
+    duration_new = time.perf_counter() - time_start
+
+    assert np.array_equal(idx_ref, idx_new)
+
+    print(f"  np.where:     {duration_ref:8.3f}s")
+    print(f"  searchsorted: {duration_new:8.3f}s")
+    print(f"  Speedup:      {duration_ref/duration_new:8.1f}x")
+
+
+def main():
+    benchmark_convert_times()
+    benchmark_read_csv_endevco()
+    benchmark_autocorrelation()
+    benchmark_window_indices()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""flutter_cache
+
+Persistent cache of imported data so raw csv's are only parsed once.
+
+Each column of the converted data is saved as a .npy file in a directory keyed by a hash of the raw
+file contents and the configuration fields that affect the import. Later runs memory map the cached
+columns instead of parsing the csv. Cached data is mapped copy-on-write so it can be modified in
+memory without changing the cache. Least recently used
+entries are removed once the cache exceeds CACHE_MAX_SIZE_MB.
+
+  Typical usage example:
+
+  data = load_cache(filepath, "acc")
+  if data is None:
+      data = import_csv_acc(filename, data_format)
+      save_cache(filepath, "acc", data)
+"""
+
+# ---------------------------------
+# IMPORTS
+# ---------------------------------
+
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+
+import flutter_config as cfg
+from flutter_config import cfg_analysis
+
+from flutter_other import ColumnData
+
+# ---------------------------------
+# CONSTANTS
+# ---------------------------------
+
+# increment when the import changes so old cached data is no longer used
+CACHE_VERSION = 5
+
+# cfg_analysis fields that change the imported data
+CACHE_KEY_FIELDS = ["DATA_FORMAT", "NUM_HEADER_ROWS", "COL_IDX_MEASURE", "COL_TIME_MEASURE",
+                    "COL_SIGNAL_MEASURE", "COL_PRESSURE_MEASURE", "COL_TEMP_MEASURE", "CALIBRATION",
+                    "IDE_CHANNEL_ACC", "IDE_PARSER_ACC", "IDE_CHANNEL_ATMOS", "IDE_PARSER_ATMOS",
+                    "IDE_CAL_ACC", "IDE_CAL_PRESSURE", "IDE_CAL_TEMP", "TIMESTEP"]
+
+# flutter_config fields that change the imported data
+CACHE_KEY_FIELDS_GENERAL = ["SYNTH_TIME", "SYNTH_TIME_CHECK_ROWS", "SYNTH_TIME_TOLERANCE", "PRECISION"]
+
+# stores the content hash of each raw file so unchanged files are not hashed again
+CACHE_INDEX_FILE = "index.json"
+
+# bytes read at a time when hashing raw files
+HASH_BLOCK_SIZE = 2**20
+
+BYTES_PER_MB = 2**20
+
+# ---------------------------------
+# FUNCTIONS
+# ---------------------------------
+
+
+def load_cache(filepath, data_kind):
+    """Returns the cached data for a raw file as ColumnData of copy-on-write memory mapped columns
+    Returns None if caching is disabled or there is no valid cached data
+    """
+
+    if not cfg.USE_CACHE:
+        return None
+
+    cache_path = _cache_path(filepath, data_kind)
+
+    if not os.path.isdir(cache_path):
+        return None
+
+    try:
+        # files are named by column number (unset columns are not saved)
+        col_numbers = [int(filename[:-4]) for filename in os.listdir(cache_path) if filename.endswith(".npy")]
+        columns = [None]*(max(col_numbers) + 1)
+        for col in col_numbers:
+            columns[col] = np.load(os.path.join(cache_path, f"{col}.npy"), mmap_mode="c")
+    except (OSError, ValueError) as error:
+        print(f"WARNING - cached data for {filepath} could not be read ({error}), importing again")
+        shutil.rmtree(cache_path, ignore_errors=True)
+        return None
+
+    # access time used for least recently used eviction
+    os.utime(cache_path)
+
+    if cfg.SHOW_DETAIL:
+        print(f"Loaded cached {data_kind} data for {filepath}")
+
+    return ColumnData(columns)
+
+
+def save_cache(filepath, data_kind, data):
+    """Saves imported data (ColumnData) for a raw file to the cache and evicts old entries if over size"""
+
+    if not cfg.USE_CACHE or data is None:
+        return None
+
+    cache_path = _cache_path(filepath, data_kind)
+
+    # write to a temporary directory first so an interrupted run never leaves a partial entry
+    # (unique to this process as files may be imported in parallel with --jobs)
+    cache_path_tmp = tempfile.mkdtemp(prefix=os.path.basename(cache_path) + "_", suffix=".tmp",
+                                      dir=os.path.dirname(cache_path))
+    for col, column in enumerate(data.columns):
+        if column is not None:
+            np.save(os.path.join(cache_path_tmp, f"{col}.npy"), column)
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(cache_path_tmp, cache_path)
+
+    evict_cache(cfg.CACHE_MAX_SIZE_MB)
+
+    return cache_path
+
+
+def evict_cache(max_size_mb):
+    """Removes least recently used cached data until the cache is no larger than max_size_mb"""
+
+    entries = _cache_entries()
+    cache_size = sum(entry[2] for entry in entries)
+
+    # oldest access first
+    for path, _, size in sorted(entries, key=lambda entry: entry[1]):
+        if cache_size <= max_size_mb*BYTES_PER_MB:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        cache_size -= size
+
+        if cfg.SHOW_DETAIL:
+            print(f"Removed cached data {os.path.basename(path)} ({size/BYTES_PER_MB:.1f}MB)")
+
+    return cache_size
+
+
+def clear_cache():
+    """Removes all cached data"""
+
+    cache_directory = _cache_directory()
+
+    # includes temporary files and entries left by interrupted runs
+    for filename in os.listdir(cache_directory):
+        path = os.path.join(cache_directory, filename)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+    return 1
+
+
+def _cache_entries():
+    """Returns the path, last access time and size of every cache entry"""
+
+    cache_directory = _cache_directory()
+    entries = []
+
+    for filename in os.listdir(cache_directory):
+        path = os.path.join(cache_directory, filename)
+        if os.path.isdir(path) and not filename.endswith(".tmp"):
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((path, os.stat(path).st_mtime, size))
+
+    return entries
+
+
+def _cache_directory():
+    """Returns the cache directory, creating it if required"""
+
+    dirname = os.path.dirname(__file__)
+    cache_directory = os.path.join(dirname, cfg.CACHE_FILE_ROOT)
+    os.makedirs(cache_directory, exist_ok=True)
+
+    return cache_directory
+
+
+def _cache_path(filepath, data_kind):
+    """Returns the cache path for a raw file, data kind and the current analysis configuration"""
+
+    key = hashlib.sha256()
+    key.update(f"{CACHE_VERSION}:{data_kind}:{_file_hash(filepath)}".encode())
+
+    for field in CACHE_KEY_FIELDS:
+        key.update(f":{field}={getattr(cfg_analysis, field, None)!r}".encode())
+
+    for field in CACHE_KEY_FIELDS_GENERAL:
+        key.update(f":{field}={getattr(cfg, field, None)!r}".encode())
+
+    return os.path.join(_cache_directory(), data_kind + "_" + key.hexdigest()[:32])
+
+
+def _file_hash(filepath):
+    """Returns the sha256 of a raw file
+    Reuses the stored hash if the file size and modification time are unchanged
+    """
+
+    stat = os.stat(filepath)
+    index_path = os.path.join(_cache_directory(), CACHE_INDEX_FILE)
+
+    try:
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        index = {}
+
+    filepath_abs = os.path.abspath(filepath)
+    entry = index.get(filepath_abs)
+
+    if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    file_hash = hashlib.sha256()
+    with open(filepath, "rb") as raw_file:
+        for block in iter(lambda: raw_file.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+
+    index[filepath_abs] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash.hexdigest()}
+
+    # replaced in one step through a temporary file unique to this process so workers importing
+    # files in parallel (--jobs) never read a partially written index
+    index_file_tmp, index_path_tmp = tempfile.mkstemp(prefix=CACHE_INDEX_FILE + "_", suffix=".tmp",
+                                                      dir=os.path.dirname(index_path))
+    with os.fdopen(index_file_tmp, "w") as index_file:
+        json.dump(index, index_file)
+    os.replace(index_path_tmp, index_path)
+
+    return file_hash.hexdigest()
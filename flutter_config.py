@@ -19,36 +19,126 @@ SHOW_DETAIL = True  # shows additional vibration data
 
 FILTER_DAMPING = True  # filters data
 CALC_DAMPING = False  # calculates damping
+DAMPING_HEADLESS = False  # calculates damping without any input (diagnostic code for each result) and figures are saved but not shown
+DAMPING_LSTSQ = False  # fits every selected peak for damping (no input and figures not shown) with a confidence interval
+DAMPING_CONFIDENCE = 0.95  # confidence level of the DAMPING_LSTSQ confidence interval
+CALC_DAMPING_HALF_POWER = False  # calculates damping of every PSD peak from its half-power bandwidth (no input required)
 CALC_FREQ = True  # calculate peak frequencies from FFT
 
 PLOT_FFT = True  # plots the FFT
 PLOT_DATA = False  # plots the actual data
 
+SPECTROGRAM = False  # calculates (incrementally) and plots the spectrogram of each entire recording
+
 CHECK_STAT = False  # checks some statistical measures on data (stationary)
+AUTOCORR_MAX_LAG_TIME = None  # maximum lag (s) in the autocorrelation stationary check (None for every lag)
 
 SAVE_FIG = True  # saves all plotted figures to png in the working directory
 SAVE_OUTPUT = True  # saves frequencies in a csv
 
+USE_CACHE = False  # reuses imported data from previous runs (saved in CACHE_FILE_ROOT, up to CACHE_MAX_SIZE_MB)
+CACHE_MAX_SIZE_MB = 4000  # least recently used cached data is removed above this size
+
 # Folder relative to program
 # TODO - automatically generate folders if they are not already present in the directory
 CSV_FILE_ROOT = "Data"  # input CSV's
 IMAGE_FILE_ROOT = "Images"  # output images
 OUTPUT_FILE_ROOT = "Results"  # output csv summaries
 FILTERED_IMAGE_FILE_ROOT = "Filtered"
+SPECTROGRAM_FILE_ROOT = "Spectrogram"  # memory mapped spectrograms
+CACHE_FILE_ROOT = "Cache"  # imported data cached between runs
+
+# number of csv rows parsed at a time when streaming large input files
+CSV_CHUNK_ROWS = 10000
+
+# synthesise the time axis from SAMP_RATE instead of parsing every timestamp (Endevco csv only)
+# every SYNTH_TIME_CHECK_ROWS'th timestamp is still parsed and all timestamps are parsed if any
+# of these differ from the synthesised time by more than SYNTH_TIME_TOLERANCE seconds
+SYNTH_TIME = False
+SYNTH_TIME_CHECK_ROWS = 1000
+SYNTH_TIME_TOLERANCE = 0.005
+
+# lazy loading only reads the data around each TIME_EXTRACT range (Slam Stick/Endaq csv only)
+LAZY_LOAD = False
+CSV_INDEX_ROWS = 5000  # rows between entries in the sparse time index used to seek in the csv
+FILTER_PAD_TIME = 2  # seconds loaded either side of each range (after OFFSET) for filter transients to settle
 
 # matplotlib figure sizes in inches
 FIGURE_WIDTH = 8
 FIGURE_HEIGHT = 5
 LIMITS = [-1.5, 3]
 
+# precision of signal data through import, filtering and analysis ("float64" or "float32")
+# time is always float64 and filters are run in float64
+PRECISION = "float64"
+
 # standard high order for Butterworth filters
 FILTER_ORDER = 4
 
+# logarithmic decrement peak detection and selection in DAMPING_HEADLESS mode
+# DAMPING_PEAK_HEIGHT = minimum peak height as a fraction of the maximum
+# DAMPING_PEAK_DISTANCE = minimum samples between peaks (at the recorded sample rate if decimated)
+# DAMPING_PEAK_POLICY = "max_to_last", "max_cycles" (DAMPING_NUM_CYCLES after the max) or "first_to_last"
+DAMPING_PEAK_HEIGHT = 0.25
+DAMPING_PEAK_DISTANCE = 20
+DAMPING_PEAK_POLICY = "max_to_last"
+DAMPING_NUM_CYCLES = 5
+
+# spectrogram frames are BIN_SIZE segments (half overlapping) up to SPECTROGRAM_MAX_FREQ (Hz, None for all)
+# SPECTROGRAM_BLOCK_FRAMES = frames calculated (and read when plotting) at a time
+# SPECTROGRAM_PLOT_SIZE = maximum (times, frequencies) plotted - the spectrogram is averaged down to this
+SPECTROGRAM_MAX_FREQ = 50
+SPECTROGRAM_BLOCK_FRAMES = 1024
+SPECTROGRAM_PLOT_SIZE = (2000, 500)
+
+# refine peak frequencies with a zoom FFT over a narrow band around each peak
+# ZOOM_HALF_WIDTH_BINS = coarse (BIN_SIZE) frequency steps either side of the peak in each band
+# ZOOM_SEGMENT_FACTOR = Welch segments for the band are this many times BIN_SIZE (finer resolution)
+# ZOOM_NUM_POINTS = frequencies evaluated in each band
+ZOOM_REFINE = False
+ZOOM_HALF_WIDTH_BINS = 2
+ZOOM_SEGMENT_FACTOR = 8
+ZOOM_NUM_POINTS = 128
+
+# low-pass filter only the analysed windows (plus FILTER_PAD_TIME either side) when they are
+# extracted instead of the entire record
+FILTER_PER_WINDOW = False
+
+# decimate data after the low-pass filter to this analysis bandwidth (Hz) so later analysis
+# processes fewer samples (None for no decimation)
+# SAMP_RATE and TIMESTEP are updated to the decimated values and settings counted in samples
+# (BIN_SIZE, DAMPING_PEAK_DISTANCE) are scaled so they cover the same time
+DECIMATE_BANDWIDTH = None
+
+# csv of test points (file, start, end, airspeed, altitude, subtitle) used instead of TIME_EXTRACT,
+# AIRSPEED, ALTITUDE and SUBTITLE in the analysis config file (None to use the config file)
+# a table can be generated with flutter_main.py --detect-test-points
+TEST_POINT_TABLE = None
+
+# test point detection (--detect-test-points) from the RMS envelope and pressure altitude
+# DETECT_RMS_TIME = length (s) of each window of the RMS envelope
+# DETECT_EVENT_FACTOR = excitation events are where the RMS is above this many times its median
+# DETECT_WINDOW_TIME = length (s) of the test point proposed after each event (shortened at the next event)
+# DETECT_MIN_WINDOW_TIME = shorter test points are discarded
+# DETECT_ALT_TOLERANCE = maximum pressure altitude variation (ft) over a stable test point
+# DETECT_BLOCK_WINDOWS = RMS windows read from the record at a time
+DETECT_RMS_TIME = 0.25
+DETECT_EVENT_FACTOR = 4
+DETECT_WINDOW_TIME = 20
+DETECT_MIN_WINDOW_TIME = 5
+DETECT_ALT_TOLERANCE = 200
+DETECT_BLOCK_WINDOWS = 4096
+
+# filter long records in blocks of this many samples with the filtered signal in a temporary file
+# (None filters the entire record in memory)
+FILTER_BLOCK_SIZE = None
+
 # columns in numpy array for storing vibration data in program memory
 COL_IDX = 0
 COL_TIME = 1
 COL_SIGNAL = 2
 COL_FILTERED = 3
+NUM_COL_ACC = 4
 
 # columns in numpy array for storing atmospheric data in program memory
 # maintains COL_IDX and COL_TIME as before
@@ -56,10 +146,12 @@ COL_FILTERED = 3
 COL_PRESSURE = 2
 COL_TEMP = 3
 COL_ALT = 4
+NUM_COL_ATMOS = 5
 
 # columns in output csv
 COL_OUT_SOURCE = 0
 COL_OUT_TEST = 1
 COL_OUT_FREQ = 2
 COL_OUT_DAMPING = 3
-COL_OUT_DAMPING_FREQ = 4
+COL_OUT_DAMPING_HALF_POWER = 4
+COL_OUT_DAMPING_FREQ = 5
@@ -18,18 +18,26 @@ TODO
 # IMPORTS
 # ---------------------------------
 
+import csv
 from datetime import datetime
+import itertools
 import numpy as np
+import os
 import re
+import scipy.signal as signal
 import sys
+import tempfile
 
 import flutter_config as cfg
 from flutter_config import cfg_analysis
 
-from flutter_other import stationary_check, acc_filter_butter
+from flutter_cache import load_cache, save_cache
+from flutter_other import stationary_check, acc_filter_butter, acc_filter_butter_blocks, ColumnData, data_dtype, \
+    SAMP_RATE_RECORDED, TIMESTEP_RECORDED
 from flutter_output import plot_acc, plot_atmosphere, plot_histogram
 
 from atmosphere import altitude_from_height
+from endaq_ide import read_ide_channels
 
 # ---------------------------------
 # CONSTANTS
@@ -40,7 +48,7 @@ from atmosphere import altitude_from_height
 TIME_FORMAT_DICT = {}
 
 # Format: 28/11/2019 10:46:01.099 AM
-TIME_FORMAT_DICT.update({r"\d{1}\/\d{2}\/\d{4} \d{1}:\d{2}:\d{2}\.\d{3} (AM|PM)$":"%d/%m/%Y %H:%M:%S.%f %p"})
+TIME_FORMAT_DICT.update({r"\d{1,2}\/\d{2}\/\d{4} \d{1,2}:\d{2}:\d{2}\.\d{3} (AM|PM)$":"%d/%m/%Y %H:%M:%S.%f %p"})
 
 # Format: 42:36.335
 TIME_FORMAT_DICT.update({r"\d{2}:\d{2}.\d{3}$":"%M:%S.%f"})
@@ -48,30 +56,88 @@ TIME_FORMAT_DICT.update({r"\d{2}:\d{2}.\d{3}$":"%M:%S.%f"})
 # Format: 36.335
 TIME_FORMAT_DICT.update({r"\d{2}.\d{3}$":"%S.%f"})
 
+# period (ms) after which each time format wraps back to zero (None if it includes the date)
+TIME_WRAP_PERIOD_MS = {"%d/%m/%Y %H:%M:%S.%f %p": None,
+                       "%M:%S.%f": 60*60*1000,
+                       "%S.%f": 60*1000}
+
 # conversion factor for V to mV
 V_TO_MV = 1000
 
+# empty csv fields (at the start or end of a line or between two delimiters)
+CSV_EMPTY_FIELD_REGEX = re.compile(rb"(?<=,)(?=,|\r?$)|^(?=,)", re.MULTILINE)
+
+# bytes read at a time when finding line endings to build a csv time index
+CSV_INDEX_BLOCK_SIZE = 2**24
+
+# results of the sparse timestamp check for files imported with a synthesised time axis
+# keys are the file path
+TIME_CHECK_RESULTS = {}
+
+# Nyquist frequency after decimation is at least this multiple of DECIMATE_BANDWIDTH
+# (leaves room for the transition band of the anti-aliasing filter)
+DECIMATE_NYQUIST_MARGIN = 1.25
+
+# analysis config fields required to read .IDE recordings (DATA_FORMAT 2)
+IDE_CONFIG_FIELDS = ["IDE_CHANNEL_ACC", "IDE_PARSER_ACC", "IDE_CAL_ACC",
+                     "IDE_CHANNEL_ATMOS", "IDE_PARSER_ATMOS", "IDE_CAL_PRESSURE", "IDE_CAL_TEMP"]
+
 # ---------------------------------
 # FUNCTIONS
 # ---------------------------------
 
 
-def import_data_acc(analysis_files, idx_file):
-    """Imports and preprocesses accelereometer data"""
+def import_data_acc(analysis_files, idx_file, time_ranges=None):
+    """Imports and preprocesses accelereometer data
+
+    With LAZY_LOAD set and time_ranges given, only the data around each time range is loaded
+    With DECIMATE_BANDWIDTH set, the data is decimated and SAMP_RATE/TIMESTEP are updated to match
+    """
+
+    # previous files may have been decimated
+    _set_samp_rate(SAMP_RATE_RECORDED, TIMESTEP_RECORDED)
+
+    if _use_lazy_load(time_ranges):
+        acc_data, segments = import_csv_acc_windows(analysis_files[idx_file], time_ranges)
+
+    else:
+        # parsed data is reused from the cache if neither the file nor the configuration has changed
+        acc_data = load_cache(cfg.CSV_FILE_ROOT + analysis_files[idx_file], "acc")
+        if acc_data is None:
+            acc_data = import_csv_acc(analysis_files[idx_file], cfg_analysis.DATA_FORMAT)
+            save_cache(cfg.CSV_FILE_ROOT + analysis_files[idx_file], "acc", acc_data)
 
-    acc_data = import_csv_acc(analysis_files[idx_file], cfg_analysis.DATA_FORMAT)
+        segments = [slice(0, len(acc_data))]
 
     # butterworth filter doesn't do much here
     # most daq's and accelerometers have inbuilt low pass filters
     # data_filter = acc_data[:, cfg.COL_SIGNAL]
-    data_filter = acc_filter_butter(acc_data[:, cfg.COL_SIGNAL], cfg_analysis.FREQ_LOWPASS, 'lowpass')
-    acc_data = np.c_[acc_data, data_filter]
+    # each contiguous segment of data is filtered separately
+    if cfg.FILTER_PER_WINDOW:
+        # only the analysed windows are filtered when extracted (filter_window_lowpass)
+        pass
+
+    elif cfg.FILTER_BLOCK_SIZE is None:
+        acc_data.set_column(cfg.COL_FILTERED, np.empty(len(acc_data), dtype=acc_data[:, cfg.COL_SIGNAL].dtype))
+        for segment in segments:
+            acc_data[segment, cfg.COL_FILTERED] = acc_filter_butter(acc_data[segment, cfg.COL_SIGNAL],
+                                                                    cfg_analysis.FREQ_LOWPASS, 'lowpass')
+    else:
+        # filtered signal is kept in a temporary file so memory use is bounded by the block size
+        acc_data.set_column(cfg.COL_FILTERED, np.memmap(tempfile.TemporaryFile(), mode="w+", shape=(len(acc_data),),
+                                                        dtype=acc_data[:, cfg.COL_SIGNAL].dtype))
+        for segment in segments:
+            acc_filter_butter_blocks(acc_data[segment, cfg.COL_SIGNAL], cfg_analysis.FREQ_LOWPASS, 'lowpass',
+                                     out=acc_data[segment, cfg.COL_FILTERED])
+
+    if cfg.DECIMATE_BANDWIDTH is not None:
+        acc_data, segments = decimate_acc_data(acc_data, segments)
 
     if cfg.SHOW_DETAIL:
         print("\nData overview sample: ")
         print(acc_data)
 
-        _check_timestep(acc_data[:, cfg.COL_TIME])
+        _check_timestep(acc_data[:, cfg.COL_TIME], TIME_CHECK_RESULTS.get(cfg.CSV_FILE_ROOT + analysis_files[idx_file]))
 
     if cfg.CHECK_STAT:
         stationary_check(acc_data[:, cfg.COL_SIGNAL],
@@ -87,7 +153,7 @@ def import_data_acc(analysis_files, idx_file):
 
         if cfg_analysis.DATA_FORMAT == 0:
             fileref = cfg_analysis.ACC_BASIS_STR + " " + analysis_files[idx_file].split(".")[0] + " RAW "
-        elif cfg_analysis.DATA_FORMAT == 1:
+        elif cfg_analysis.DATA_FORMAT in (1, 2):
             fileref = cfg_analysis.ACC_BASIS_STR + "_TOTAL"
 
         plot_acc(data=acc_data[:, cfg.COL_SIGNAL],
@@ -100,7 +166,10 @@ def import_data_acc(analysis_files, idx_file):
 def import_data_atmos(analysis_files, idx_file):
     """Imports and preprocesses atmospheric data"""
 
-    atmos_data = import_csv_atmos(analysis_files[idx_file], cfg_analysis.DATA_FORMAT)
+    atmos_data = load_cache(cfg.CSV_FILE_ROOT + analysis_files[idx_file], "atmos")
+    if atmos_data is None:
+        atmos_data = import_csv_atmos(analysis_files[idx_file], cfg_analysis.DATA_FORMAT)
+        save_cache(cfg.CSV_FILE_ROOT + analysis_files[idx_file], "atmos", atmos_data)
 
     if cfg.PLOT_DATA:
 
@@ -108,7 +177,7 @@ def import_data_atmos(analysis_files, idx_file):
 
         if cfg_analysis.DATA_FORMAT == 0:
             fileref = cfg_analysis.ACC_BASIS_STR + " " + analysis_files[idx_file].split(".")[0] + " RAW "
-        if cfg_analysis.DATA_FORMAT == 1:
+        if cfg_analysis.DATA_FORMAT in (1, 2):
             fileref = cfg_analysis.ACC_BASIS_STR + "_TOTAL"
 
         plot_atmosphere(altitude=atmos_data[:, cfg.COL_ALT],
@@ -129,39 +198,41 @@ def import_csv_acc(filename, data_format):
     # Endevco 7257AT data
     # https://buy.endevco.com/contentstore/mktgcontent/endevco/datasheet/7257at_ds_091819.pdf
     if data_format == 0:
-        # import from csv
-        acc_data_raw = np.genfromtxt(cfg.CSV_FILE_ROOT + filename, delimiter=",",
-                                     dtype='unicode', skip_header=cfg_analysis.NUM_HEADER_ROWS)
-        # remove leading and trailing quotation marks if present
-        acc_data_cleaned = np.char.strip(acc_data_raw, "\"")
-
-        # extract columns from csv
-        sample_conv = acc_data_cleaned[:, cfg_analysis.COL_IDX_MEASURE].astype(int)
-        time_basis = acc_data_cleaned[:, cfg_analysis.COL_TIME_MEASURE]
-        time_format = _identify_time_format(time_basis[1])
-        # convert time from string to float
-        time_conv = _convert_times(time_basis, time_format)
-        voltage_conv = acc_data_cleaned[:, cfg_analysis.COL_SIGNAL_MEASURE].astype(float)
+        csv_args = (cfg.CSV_FILE_ROOT + filename, cfg_analysis.COL_IDX_MEASURE, cfg_analysis.COL_TIME_MEASURE,
+                    cfg_analysis.COL_SIGNAL_MEASURE, cfg_analysis.NUM_HEADER_ROWS)
+        time_conv = None
+
+        # time axis from the sample rate if a sparse check of the timestamps agrees
+        if cfg.SYNTH_TIME:
+            sample_conv, time_conv, voltage_conv, time_check = read_csv_endevco_synth_time(*csv_args)
+            TIME_CHECK_RESULTS[cfg.CSV_FILE_ROOT + filename] = time_check
+
+            if time_conv is None:
+                print(f"WARNING - timestamps differ from SAMP_RATE by up to {time_check['max_error']:.4f}s, "
+                      "parsing all timestamps")
+
+        # stream only the required columns from csv
+        if time_conv is None:
+            sample_conv, time_conv, voltage_conv = read_csv_endevco(*csv_args)
 
         # remove the DC bias offset
         # 2.5 DC bias specified in datasheet - this gets an average of approximately 0.7g
-        voltage_conv = voltage_conv - np.mean(voltage_conv)
-        acc_conv = voltage_conv * cfg_analysis.CALIBRATION * V_TO_MV
+        # done in place as the voltage is not needed after conversion
+        voltage_conv -= np.mean(voltage_conv, dtype=np.float64)
+        voltage_conv *= cfg_analysis.CALIBRATION * V_TO_MV
+        acc_conv = voltage_conv
 
         # form numpy array
-        acc_data_conv = np.transpose(np.array([sample_conv, time_conv, acc_conv]))
+        acc_data_conv = make_acc_data(sample_conv, time_conv, acc_conv)
 
     # Slam Stick or Endaq data
+    # only the acceleration column is parsed even if the file also holds the atmospheric data
     elif data_format == 1:
-        # import from csv
-        acc_data_raw = np.genfromtxt(cfg.CSV_FILE_ROOT + filename, delimiter=",",
-                                     dtype='float', skip_header=cfg_analysis.NUM_HEADER_ROWS)
-        time_basis = acc_data_raw[:, cfg_analysis.COL_TIME_MEASURE]
-        acc_conv = acc_data_raw[:, cfg_analysis.COL_SIGNAL_MEASURE]
-        sample_conv = np.array(range(len(acc_data_raw)))
+        acc_data_conv, _ = import_csv_slam_stick(filename, read_atmos=False)
 
-        # form numpy array
-        acc_data_conv = np.transpose(np.array([sample_conv, time_basis, acc_conv]))
+    # Slam Stick or Endaq recording (.IDE) read directly
+    elif data_format == 2:
+        acc_data_conv, _ = import_ide(filename, read_atmos=False)
 
     else:
         print("In function import_csv_acc...")
@@ -180,18 +251,13 @@ def import_csv_atmos(filename, data_format):
         atmos_data_conv = None
 
     # Slam Stick or Endaq data
+    # only the pressure and temperature columns are parsed
     elif data_format == 1:
-        # import from csv
-        atmos_data_raw = np.genfromtxt(cfg.CSV_FILE_ROOT + filename, delimiter=",",
-                                       dtype='float', skip_header=cfg_analysis.NUM_HEADER_ROWS)
-        time_basis = atmos_data_raw[:, cfg_analysis.COL_TIME_MEASURE]
-        pressure_conv = atmos_data_raw[:, cfg_analysis.COL_PRESSURE_MEASURE]
-        alt_conv = altitude_from_height(pressure_conv, "Pa")
-        temp_conv = atmos_data_raw[:, cfg_analysis.COL_TEMP_MEASURE]
-        sample_conv = np.array(range(len(atmos_data_raw)))
+        _, atmos_data_conv = import_csv_slam_stick(filename, read_acc=False)
 
-        # form numpy array
-        atmos_data_conv = np.transpose(np.array([sample_conv, time_basis, pressure_conv, temp_conv, alt_conv]))
+    # Slam Stick or Endaq recording (.IDE) read directly
+    elif data_format == 2:
+        _, atmos_data_conv = import_ide(filename, read_acc=False)
 
     else:
         print("In function import_csv_atmos...")
@@ -203,31 +269,885 @@ def import_csv_atmos(filename, data_format):
     return atmos_data_conv
 
 
+def import_csv_slam_stick(filename, read_acc=True, read_atmos=True):
+    """Imports accelerometer and/or atmospheric data from a Slam Stick or Endaq csv in a single pass
+
+    Only the columns of the data read are parsed (acceleration only exports have no pressure or
+    temperature columns)
+
+    Returns:
+    - acc_data_conv = sample index, time and acceleration (None if not read)
+    - atmos_data_conv = sample index, time, pressure, temperature and pressure altitude (None if not read)
+    """
+
+    usecols = [cfg_analysis.COL_TIME_MEASURE]
+    dtypes = [np.float64]
+
+    if read_acc:
+        usecols += [cfg_analysis.COL_SIGNAL_MEASURE]
+        dtypes += [data_dtype()]
+
+    if read_atmos:
+        usecols += [cfg_analysis.COL_PRESSURE_MEASURE, cfg_analysis.COL_TEMP_MEASURE]
+        dtypes += [data_dtype(), data_dtype()]
+
+    columns = read_csv_columns(cfg.CSV_FILE_ROOT + filename, usecols, cfg_analysis.NUM_HEADER_ROWS, dtypes=dtypes)
+
+    time_basis = columns.pop(0)
+    sample_conv = np.arange(len(time_basis))
+
+    # form numpy arrays
+    acc_data_conv = None
+    if read_acc:
+        acc_conv = columns.pop(0)
+        acc_data_conv = make_acc_data(sample_conv, time_basis, acc_conv)
+
+    atmos_data_conv = None
+    if read_atmos:
+        pressure_conv, temp_conv = columns
+        alt_conv = altitude_from_height(np.asarray(pressure_conv, dtype=np.float64), "Pa")
+        atmos_data_conv = make_atmos_data(sample_conv, time_basis, pressure_conv, temp_conv, alt_conv)
+
+    return acc_data_conv, atmos_data_conv
+
+
+def make_acc_data(sample_conv, time_conv, acc_conv):
+    """Forms the accelerometer data from its columns
+
+    Columns are stored separately (ColumnData) so each acc_data[:, COL_*] is contiguous, time is
+    float64 and the signal is in PRECISION. The filtered signal (COL_FILTERED) is added by
+    import_data_acc unless windows are filtered when extracted (FILTER_PER_WINDOW).
+    """
+
+    columns = [None]*cfg.NUM_COL_ACC
+
+    columns[cfg.COL_IDX] = np.asarray(sample_conv, dtype=np.int64)
+    columns[cfg.COL_TIME] = np.asarray(time_conv, dtype=np.float64)
+    columns[cfg.COL_SIGNAL] = np.asarray(acc_conv, dtype=data_dtype())
+
+    return ColumnData(columns)
+
+
+def make_atmos_data(sample_conv, time_conv, pressure_conv, temp_conv, alt_conv):
+    """Forms the atmospheric data from its columns (time is float64 and all others in PRECISION)"""
+
+    columns = [None]*cfg.NUM_COL_ATMOS
+
+    columns[cfg.COL_IDX] = np.asarray(sample_conv, dtype=np.int64)
+    columns[cfg.COL_TIME] = np.asarray(time_conv, dtype=np.float64)
+    columns[cfg.COL_PRESSURE] = np.asarray(pressure_conv, dtype=data_dtype())
+    columns[cfg.COL_TEMP] = np.asarray(temp_conv, dtype=data_dtype())
+    columns[cfg.COL_ALT] = np.asarray(alt_conv, dtype=data_dtype())
+
+    return ColumnData(columns)
+
+
+def import_ide(filename, read_acc=True, read_atmos=True):
+    """Imports accelerometer and/or atmospheric data directly from a Slam Stick or Endaq .IDE recording
+
+    Channel IDs and sample formats are set in the analysis config (IDE_CHANNEL_*, IDE_PARSER_*).
+    COL_SIGNAL_MEASURE, COL_PRESSURE_MEASURE and COL_TEMP_MEASURE select the subchannel (from 0).
+    Recorded values are converted to g, Pa and degC (as in the csv export) with the calibration
+    polynomials of the recording (IDE_CAL_ACC, IDE_CAL_PRESSURE, IDE_CAL_TEMP).
+    Only the channels of the data read are parsed.
+
+    Returns:
+    - acc_data_conv = sample index, time and acceleration (None if not read)
+    - atmos_data_conv = sample index, time, pressure, temperature and pressure altitude (None if not read)
+    """
+
+    channel_parsers = {}
+
+    if read_acc:
+        channel_parsers[cfg_analysis.IDE_CHANNEL_ACC] = cfg_analysis.IDE_PARSER_ACC
+
+    if read_atmos:
+        channel_parsers[cfg_analysis.IDE_CHANNEL_ATMOS] = cfg_analysis.IDE_PARSER_ATMOS
+
+    channels = read_ide_channels(cfg.CSV_FILE_ROOT + filename, channel_parsers)
+
+    # accelerometer and atmospheric channels have different sample rates
+    acc_data_conv = None
+    if read_acc:
+        time_acc, data_acc = channels[cfg_analysis.IDE_CHANNEL_ACC]
+        acc_conv = _ide_calibrate(data_acc[:, cfg_analysis.COL_SIGNAL_MEASURE], cfg_analysis.IDE_CAL_ACC)
+        acc_data_conv = make_acc_data(np.arange(len(time_acc)), time_acc, acc_conv)
+
+    atmos_data_conv = None
+    if read_atmos:
+        time_atmos, data_atmos = channels[cfg_analysis.IDE_CHANNEL_ATMOS]
+        pressure_conv = _ide_calibrate(data_atmos[:, cfg_analysis.COL_PRESSURE_MEASURE],
+                                       cfg_analysis.IDE_CAL_PRESSURE)
+        temp_conv = _ide_calibrate(data_atmos[:, cfg_analysis.COL_TEMP_MEASURE], cfg_analysis.IDE_CAL_TEMP)
+        alt_conv = altitude_from_height(np.asarray(pressure_conv, dtype=np.float64), "Pa")
+        atmos_data_conv = make_atmos_data(np.arange(len(time_atmos)), time_atmos, pressure_conv, temp_conv,
+                                          alt_conv)
+
+    return acc_data_conv, atmos_data_conv
+
+
+def _ide_calibrate(data_raw, coefficients):
+    """Applies a calibration polynomial (coefficients from the highest power, None if already calibrated)"""
+
+    if coefficients is None:
+        return data_raw
+
+    return np.polyval(coefficients, data_raw)
+
+
+# ---------------------------------
+# FUNCTIONS - CSV STREAMING
+# ---------------------------------
+
+
+def read_csv_endevco(filepath, col_idx, col_time, col_signal, num_header_rows, chunk_rows=None):
+    """Streams the sample index, time and signal columns of an Endevco csv into preallocated arrays
+
+    Only the three columns are parsed and the file is read chunk_rows lines at a time, so peak memory
+    is the output arrays plus a single chunk rather than the whole file as strings.
+
+    Returns:
+    - sample_conv = sample index (int64)
+    - time_conv = seconds since first sample (float64)
+    - voltage_conv = signal (PRECISION)
+    """
+
+    usecols = (col_idx, col_time, col_signal)
+    dtype = [("idx", np.int64), ("time", "U32"), ("signal", np.float64)]
+
+    sample_conv = time_ms = voltage_conv = None
+    time_format = None
+    num_rows = 0
+
+    for chunk, bytes_read, file_size in _iter_csv_chunks(filepath, usecols, dtype, num_header_rows, chunk_rows):
+
+        if sample_conv is None:
+            # time format from the second row as with the full file import
+            time_format = _identify_time_format(chunk["time"][min(1, chunk.size - 1)])
+            if time_format is None:
+                print("ERROR - time_format_idx must be defined, no valid time string match found")
+                sys.exit()
+
+            # size buffers from the bytes per row of the first chunk (grown later if required)
+            num_rows_estimate = int(chunk.size*file_size/bytes_read*1.05) + 1
+            sample_conv = np.empty(num_rows_estimate, dtype=np.int64)
+            time_ms = np.empty(num_rows_estimate, dtype=np.int64)
+            voltage_conv = np.empty(num_rows_estimate, dtype=data_dtype())
+
+        num_rows_next = num_rows + chunk.size
+
+        if num_rows_next > sample_conv.size:
+            _resize_buffers((sample_conv, time_ms, voltage_conv), max(num_rows_next, int(sample_conv.size*1.25)))
+
+        sample_conv[num_rows:num_rows_next] = chunk["idx"]
+        time_ms[num_rows:num_rows_next] = _parse_times_ms(chunk["time"], time_format)
+        voltage_conv[num_rows:num_rows_next] = chunk["signal"]
+
+        num_rows = num_rows_next
+
+    if sample_conv is None:
+        sys.exit(f"ERROR - no data found in {filepath}")
+
+    # release the unused end of the buffers
+    _resize_buffers((sample_conv, time_ms, voltage_conv), num_rows)
+
+    time_conv = _unwrap_times(time_ms, time_format)
+
+    return sample_conv, time_conv, voltage_conv
+
+
+def read_csv_endevco_synth_time(filepath, col_idx, col_time, col_signal, num_header_rows, chunk_rows=None):
+    """Streams an Endevco csv with the time axis synthesised from the sample rate
+
+    Only every SYNTH_TIME_CHECK_ROWS'th timestamp is parsed. These are compared against
+    row*TIMESTEP to check for clock drift or dropped samples.
+
+    Returns:
+    - sample_conv = sample index (int64)
+    - time_conv = seconds since first sample (float64) or None if the check failed
+    - voltage_conv = signal (PRECISION)
+    - time_check = dict of the sparse timestamp check results
+    """
+
+    usecols = (col_idx, col_signal)
+    dtype = [("idx", np.int64), ("signal", np.float64)]
+    check_every = cfg.SYNTH_TIME_CHECK_ROWS
+
+    sample_conv = voltage_conv = None
+    check_rows = []
+    check_ms = []
+    time_format = None
+    num_rows = 0
+
+    for lines, bytes_read, file_size in _iter_csv_lines(filepath, num_header_rows, chunk_rows):
+
+        chunk = _parse_csv_bytes(b"".join(lines), usecols, dtype)
+
+        # rows of the file to be checked within this chunk
+        idx_check = np.arange((-num_rows) % check_every, len(lines), check_every)
+        time_str = _parse_csv_bytes(b"".join(lines[idx] for idx in idx_check), (col_time,), [("time", "U32")])["time"]
+
+        if sample_conv is None:
+            time_format = _identify_time_format(time_str[0])
+            if time_format is None:
+                print("ERROR - time_format_idx must be defined, no valid time string match found")
+                sys.exit()
+
+            num_rows_estimate = int(chunk.size*file_size/bytes_read*1.05) + 1
+            sample_conv = np.empty(num_rows_estimate, dtype=np.int64)
+            voltage_conv = np.empty(num_rows_estimate, dtype=data_dtype())
+
+        num_rows_next = num_rows + chunk.size
+
+        if num_rows_next > sample_conv.size:
+            _resize_buffers((sample_conv, voltage_conv), max(num_rows_next, int(sample_conv.size*1.25)))
+
+        sample_conv[num_rows:num_rows_next] = chunk["idx"]
+        voltage_conv[num_rows:num_rows_next] = chunk["signal"]
+        check_rows.append(num_rows + idx_check)
+        check_ms.append(_parse_times_ms(time_str, time_format))
+
+        num_rows = num_rows_next
+
+    if sample_conv is None:
+        sys.exit(f"ERROR - no data found in {filepath}")
+
+    _resize_buffers((sample_conv, voltage_conv), num_rows)
+
+    # compare the parsed timestamps with the synthesised time axis
+    check_rows = np.concatenate(check_rows)
+    check_times = _unwrap_times(np.concatenate(check_ms), time_format)
+    check_error = check_times - check_rows*cfg_analysis.TIMESTEP
+    max_error = np.max(np.abs(check_error))
+
+    time_check = {"rows_checked": len(check_rows), "check_every": check_every,
+                  "max_error": max_error, "drift": check_error[-1],
+                  "passed": max_error <= cfg.SYNTH_TIME_TOLERANCE}
+
+    time_conv = None
+    if time_check["passed"]:
+        time_conv = np.arange(num_rows)*cfg_analysis.TIMESTEP
+
+    return sample_conv, time_conv, voltage_conv, time_check
+
+
+def read_csv_columns(filepath, usecols, num_header_rows, chunk_rows=None, dtypes=None):
+    """Streams numeric csv columns into preallocated arrays in a single pass
+
+    dtypes gives the dtype of each output array (float64 if not set).
+    Returns a list with one array per column in usecols
+    """
+
+    if dtypes is None:
+        dtypes = [np.float64]*len(usecols)
+
+    dtype = [(f"col_{idx}", np.float64) for idx in range(len(usecols))]
+
+    columns = None
+    num_rows = 0
+
+    for chunk, bytes_read, file_size in _iter_csv_chunks(filepath, usecols, dtype, num_header_rows, chunk_rows):
+
+        if columns is None:
+            num_rows_estimate = int(chunk.size*file_size/bytes_read*1.05) + 1
+            columns = [np.empty(num_rows_estimate, dtype=column_dtype) for column_dtype in dtypes]
+
+        num_rows_next = num_rows + chunk.size
+
+        if num_rows_next > columns[0].size:
+            _resize_buffers(columns, max(num_rows_next, int(columns[0].size*1.25)))
+
+        for idx, column in enumerate(columns):
+            column[num_rows:num_rows_next] = chunk[f"col_{idx}"]
+
+        num_rows = num_rows_next
+
+    if columns is None:
+        sys.exit(f"ERROR - no data found in {filepath}")
+
+    _resize_buffers(columns, num_rows)
+
+    return columns
+
+
+def _resize_buffers(buffers, num_rows):
+    """Resizes preallocated column arrays in place"""
+
+    for buffer in buffers:
+        buffer.resize(num_rows, refcheck=False)
+
+
+def _iter_csv_chunks(filepath, usecols, dtype, num_header_rows, chunk_rows=None):
+    """Yields successive chunks of selected csv columns as numpy structured arrays
+
+    Also yields the bytes read so far and the file size so callers can estimate the total number of rows.
+    """
+
+    for lines, bytes_read, file_size in _iter_csv_lines(filepath, num_header_rows, chunk_rows):
+
+        chunk = _parse_csv_bytes(b"".join(lines), usecols, dtype)
+
+        if chunk.size > 0:
+            yield chunk, bytes_read, file_size
+
+
+def _iter_csv_lines(filepath, num_header_rows, chunk_rows=None):
+    """Yields successive lists of chunk_rows raw csv lines, the bytes read so far and the file size"""
+
+    if chunk_rows is None:
+        chunk_rows = cfg.CSV_CHUNK_ROWS
+
+    file_size = os.path.getsize(filepath)
+
+    with open(filepath, "rb") as csv_file:
+
+        for _ in range(num_header_rows):
+            csv_file.readline()
+
+        while True:
+            lines = list(itertools.islice(csv_file, chunk_rows))
+            if not lines:
+                break
+
+            yield lines, csv_file.tell(), file_size
+
+
+def _parse_csv_bytes(chunk_bytes, usecols, dtype):
+    """Parses selected columns of whole csv lines into a numpy structured array
+
+    Quotation marks are removed from the raw bytes before parsing and empty fields are read as nan
+    (as with genfromtxt)
+    """
+
+    chunk_bytes = CSV_EMPTY_FIELD_REGEX.sub(b"nan", chunk_bytes.replace(b"\"", b""))
+    chunk_text = chunk_bytes.decode("ascii", errors="replace")
+
+    return np.loadtxt(chunk_text.splitlines(), delimiter=",", usecols=usecols, dtype=dtype, ndmin=1)
+
+
+# ---------------------------------
+# FUNCTIONS - LAZY WINDOW IMPORT
+# ---------------------------------
+
+
+def import_csv_acc_windows(filename, time_ranges):
+    """Imports only the accelerometer data around each time range from a Slam Stick or Endaq csv
+
+    Each range is widened by OFFSET and FILTER_PAD_TIME (so filter transients settle before the
+    analysed data) and overlapping ranges are merged. A sparse index of row times and byte offsets
+    is used to seek to and parse only the required rows.
+
+    Returns:
+    - acc_data_conv = sample index, time and acceleration for all ranges (in time order)
+    - segments = slices of acc_data_conv that are each contiguous in time
+    """
+
+    filepath = cfg.CSV_FILE_ROOT + filename
+    pad = cfg_analysis.OFFSET + cfg.FILTER_PAD_TIME
+
+    index_rows, index_times, index_offsets = csv_time_index(filepath, cfg_analysis.NUM_HEADER_ROWS,
+                                                            cfg_analysis.COL_TIME_MEASURE)
+
+    # merge overlapping padded time ranges
+    windows = []
+    for times in sorted(time_ranges):
+        time_lower = times[0] - pad
+        time_upper = times[1] + pad
+        if windows and time_lower <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], time_upper)
+        else:
+            windows.append([time_lower, time_upper])
+
+    sample_conv = []
+    time_conv = []
+    acc_conv = []
+    segments = []
+    num_rows = 0
+
+    usecols = (cfg_analysis.COL_TIME_MEASURE, cfg_analysis.COL_SIGNAL_MEASURE)
+    dtype = [("time", np.float64), ("signal", np.float64)]
+
+    with open(filepath, "rb") as csv_file:
+        for time_lower, time_upper in windows:
+
+            # index entries either side of the window
+            idx_start = max(np.searchsorted(index_times, time_lower, side="right") - 1, 0)
+            idx_end = min(np.searchsorted(index_times, time_upper, side="right"), len(index_times) - 1)
+
+            csv_file.seek(index_offsets[idx_start])
+            chunk = _parse_csv_bytes(csv_file.read(index_offsets[idx_end] - index_offsets[idx_start]), usecols, dtype)
+
+            in_window = (chunk["time"] >= time_lower) & (chunk["time"] <= time_upper)
+            num_window = np.count_nonzero(in_window)
+
+            if num_window == 0:
+                print(f"WARNING - no data between {time_lower:.2f}s and {time_upper:.2f}s in {filename}")
+                continue
+
+            sample_conv.append(index_rows[idx_start] + np.flatnonzero(in_window))
+            time_conv.append(chunk["time"][in_window])
+            acc_conv.append(chunk["signal"][in_window])
+            segments.append(slice(num_rows, num_rows + num_window))
+            num_rows += num_window
+
+    if num_rows == 0:
+        sys.exit(f"ERROR - no data found in time ranges for {filename}")
+
+    if cfg.SHOW_DETAIL:
+        print(f"Loaded {num_rows} of {index_rows[-1]} rows in {len(segments)} windows from {filename}")
+
+    acc_data_conv = make_acc_data(np.concatenate(sample_conv), np.concatenate(time_conv), np.concatenate(acc_conv))
+
+    return acc_data_conv, segments
+
+
+def csv_time_index(filepath, num_header_rows, col_time):
+    """Returns a sparse index of the row number, time and byte offset of every CSV_INDEX_ROWS rows
+
+    The index ends with the total number of rows, an infinite time and the file size. It is saved
+    next to the csv and rebuilt whenever the csv or the header/time column settings change.
+    """
+
+    index_path = filepath + ".index.npz"
+    stat = os.stat(filepath)
+    index_settings = np.array([stat.st_size, stat.st_mtime_ns, num_header_rows, col_time, cfg.CSV_INDEX_ROWS])
+
+    if os.path.isfile(index_path):
+        with np.load(index_path) as index:
+            if np.array_equal(index["settings"], index_settings):
+                return index["rows"], index["times"], index["offsets"]
+
+    print(f"Building time index for {filepath}...")
+
+    with open(filepath, "rb") as csv_file:
+
+        for _ in range(num_header_rows):
+            csv_file.readline()
+
+        # find the offset of every CSV_INDEX_ROWS'th row from the line endings
+        # blank lines are counted as rows
+        line_start = csv_file.tell()
+        num_rows = 0
+        rows = []
+        offsets = []
+
+        while True:
+            block_start = csv_file.tell()
+            block = csv_file.read(CSV_INDEX_BLOCK_SIZE)
+            if not block:
+                break
+
+            line_ends = block_start + np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+            if len(line_ends) == 0:
+                continue
+
+            # rows ending in this block (the first started in an earlier block)
+            line_starts = np.concatenate(([line_start], line_ends[:-1] + 1))
+            line_start = line_ends[-1] + 1
+
+            row_numbers = num_rows + np.arange(len(line_starts))
+            is_indexed = row_numbers % cfg.CSV_INDEX_ROWS == 0
+            rows.append(row_numbers[is_indexed])
+            offsets.append(line_starts[is_indexed])
+            num_rows += len(line_starts)
+
+        # final row without a line ending
+        if line_start < stat.st_size:
+            if num_rows % cfg.CSV_INDEX_ROWS == 0:
+                rows.append([num_rows])
+                offsets.append([line_start])
+            num_rows += 1
+
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        offsets = np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int64)
+
+        # time of each indexed row
+        times = np.zeros(len(offsets))
+        for idx, offset in enumerate(offsets):
+            csv_file.seek(offset)
+            fields = csv_file.readline().replace(b"\"", b"").split(b",")
+            try:
+                times[idx] = float(fields[col_time])
+            except (IndexError, ValueError):
+                times[idx] = np.nan
+
+    # rows without a valid time cannot be used to seek
+    is_valid = ~np.isnan(times)
+    rows = np.append(rows[is_valid], num_rows)
+    times = np.append(times[is_valid], np.inf)
+    offsets = np.append(offsets[is_valid], stat.st_size)
+
+    np.savez(index_path, settings=index_settings, rows=rows, times=times, offsets=offsets)
+
+    return rows, times, offsets
+
+
+def _use_lazy_load(time_ranges):
+    """Checks if only the data in the time ranges can be loaded"""
+
+    if not cfg.LAZY_LOAD or time_ranges is None:
+        return False
+
+    if cfg_analysis.DATA_FORMAT != 1 or any(times == 0 for times in time_ranges):
+        print("NOTE - lazy loading requires DATA_FORMAT 1 and time ranges for every test point, loading entire file")
+        return False
+
+    return True
+
+
+# ---------------------------------
+# FUNCTIONS - DECIMATION
+# ---------------------------------
+
+
+def decimate_acc_data(acc_data, segments):
+    """Decimates accelerometer data down to the DECIMATE_BANDWIDTH analysis bandwidth
+
+    Signal columns are resampled with a polyphase anti-aliasing filter (each segment separately)
+    and the index and time columns keep every nth row. SAMP_RATE and TIMESTEP in cfg_analysis are
+    updated to the decimated values used by everything downstream (settings counted in samples are
+    converted with samples_at_samp_rate).
+
+    Returns the decimated data and its segments
+    """
+
+    factor = decimation_factor(SAMP_RATE_RECORDED, cfg.DECIMATE_BANDWIDTH)
+
+    if factor == 1:
+        if cfg.SHOW_DETAIL:
+            print(f"No decimation - sample rate ({SAMP_RATE_RECORDED}Hz) is already near DECIMATE_BANDWIDTH")
+        return acc_data, segments
+
+    segments_decimated = []
+    idx_start = 0
+    for segment in segments:
+        num_rows = -(-(segment.stop - segment.start)//factor)
+        segments_decimated.append(slice(idx_start, idx_start + num_rows))
+        idx_start += num_rows
+
+    columns = [None]*len(acc_data.columns)
+
+    for col, column in enumerate(acc_data.columns):
+        if column is None:
+            continue
+
+        if col in (cfg.COL_IDX, cfg.COL_TIME):
+            column_segments = [column[segment][::factor] for segment in segments]
+        else:
+            column_segments = [signal.resample_poly(column[segment], 1, factor).astype(column.dtype, copy=False)
+                               for segment in segments]
+
+        columns[col] = np.concatenate(column_segments)
+
+    _set_samp_rate(SAMP_RATE_RECORDED/factor, TIMESTEP_RECORDED*factor)
+
+    if cfg.SHOW_DETAIL:
+        print(f"Decimated by {factor} to {cfg_analysis.SAMP_RATE:.1f}Hz ({len(acc_data)} to {len(columns[0])} rows)")
+
+    return ColumnData(columns), segments_decimated
+
+
+def decimation_factor(samp_rate, bandwidth):
+    """Returns the largest integer decimation factor that keeps the bandwidth (Hz) below the decimated
+    Nyquist frequency (with DECIMATE_NYQUIST_MARGIN)
+    """
+
+    return max(1, int(samp_rate//(2*DECIMATE_NYQUIST_MARGIN*bandwidth)))
+
+
+def _set_samp_rate(samp_rate, timestep):
+    """Sets the sample rate and timestep used in the analysis"""
+
+    cfg_analysis.SAMP_RATE = samp_rate
+    cfg_analysis.TIMESTEP = timestep
+
+# ---------------------------------
+# FUNCTIONS - TEST POINT TABLE
+# ---------------------------------
+
+
+def load_test_point_table(filepath):
+    """Loads the test points of every file from a test point table (TEST_POINT_TABLE)
+
+    Returns a dict of file to its TIME_EXTRACT, AIRSPEED, ALTITUDE and SUBTITLE lists (in the form
+    of the analysis config file). Empty airspeeds and altitudes are None.
+    """
+
+    test_points = {}
+
+    with open(filepath, newline='') as csv_file:
+        for row in csv.DictReader(csv_file):
+            file_test_points = test_points.setdefault(row["file"], {"TIME_EXTRACT": [], "AIRSPEED": [],
+                                                                    "ALTITUDE": [], "SUBTITLE": []})
+
+            file_test_points["TIME_EXTRACT"].append([float(row["start"]), float(row["end"])])
+            file_test_points["AIRSPEED"].append(_table_number(row.get("airspeed")))
+            file_test_points["ALTITUDE"].append(_table_number(row.get("altitude")))
+            file_test_points["SUBTITLE"].append(row.get("subtitle") or "")
+
+    return test_points
+
+
+def _table_number(value):
+    """Converts a cell of the test point table to an int or float (None if empty)"""
+
+    if value is None or value.strip() == "":
+        return None
+
+    number = float(value)
+
+    return int(number) if number.is_integer() else number
+
+
+def _check_test_point_table():
+    """Checks the test point table can be read and every test point has a valid time range"""
+
+    if not os.path.isfile(cfg.TEST_POINT_TABLE):
+        print(f"ERROR - Test point table {cfg.TEST_POINT_TABLE} does not exist")
+        print("Check TEST_POINT_TABLE (a table can be generated with --detect-test-points)")
+        return False
+
+    try:
+        test_points = load_test_point_table(cfg.TEST_POINT_TABLE)
+    except (KeyError, ValueError) as err:
+        print(f"ERROR - Test point table {cfg.TEST_POINT_TABLE} could not be read ({err})")
+        print("Check the table has file, start and end columns with numeric times")
+        return False
+
+    no_errors = True
+
+    for filename, file_test_points in test_points.items():
+        if filename not in cfg_analysis.CSV_FILE:
+            print(f"WARNING - Test points of {filename} are not analysed as it is not in CSV_FILE")
+
+        for time_start, time_end in file_test_points["TIME_EXTRACT"]:
+            if time_start >= time_end:
+                print(f"ERROR - Test point of {filename} starts at {time_start} after it ends at {time_end}")
+                no_errors = False
+
+    return no_errors
+
+
 # ---------------------------------
 # FUNCTIONS - MISC
 # ---------------------------------
 
 
 def _convert_times(data, time_format):
-    """converts string of times to float of seconds since time started"""
+    """converts string of times to float of seconds since time started
+
+    Fields are sliced out of the raw character codes of the whole column at once rather than
+    calling strptime per row. Times that wrap (past midnight, or past the hour for formats
+    without an hour field) are unwrapped so the result is always increasing.
+    """
 
     if time_format is None:
         print("ERROR - time_format_idx must be defined, no valid time string match found")
         sys.exit()
 
-    time_basis = np.zeros(data.size)
+    if cfg.DEBUG:
+        print(data)
+
+    time_ms = _parse_times_ms(data, time_format)
+
+    return _unwrap_times(time_ms, time_format)
+
+
+def _parse_times_ms(data, time_format):
+    """converts string of times to integer milliseconds (from the start of the largest field in the format)
+
+    Can be called on successive chunks of a column as no reference to the first time is needed
+    """
+
+    if time_format not in TIME_PARSE_DICT:
+        print(f"WARNING - no vectorised parser for time format {time_format}, parsing row by row")
+        return _parse_times_ms_loop(data, time_format)
+
+    char_codes, str_len = _time_char_codes(data)
+    time_ms, valid = TIME_PARSE_DICT[time_format](char_codes, str_len)
+
+    if not np.all(valid):
+        print(f"WARNING - {np.count_nonzero(~valid)} times do not match format {time_format}, parsing row by row")
+        return _parse_times_ms_loop(data, time_format)
+
+    return time_ms
+
+
+def _parse_times_ms_loop(data, time_format):
+    """converts string of times to integer milliseconds one row at a time
+
+    Times are from the same origin as the vectorised parsers (TIME_PARSE_DICT) so chunks parsed
+    by either can be combined
+    """
+
+    # strptime dates default to 1 Jan 1900 if the format has no date
+    if "%Y" in time_format:
+        time_epoch = datetime(1970, 1, 1)
+    else:
+        time_epoch = datetime(1900, 1, 1)
+
+    # %p is only applied by strptime to a 12 hour clock (%I)
+    if "%p" in time_format:
+        time_format = time_format.replace("%H", "%I")
+
+    time_ms = np.zeros(data.size, dtype=np.int64)
+
+    for idx in range(len(data)):
+        time_conv = datetime.strptime(str(data[idx]), time_format) - time_epoch
+        time_ms[idx] = round(time_conv.total_seconds()*1000)
+
+    return time_ms
+
+
+def _unwrap_times(time_ms, time_format):
+    """converts integer milliseconds to float seconds since the first time, unwrapping any rollovers"""
+
+    time_ms = time_ms - time_ms[0]
+
+    # times without a full date wrap around and must be unwrapped
+    period_ms = TIME_WRAP_PERIOD_MS.get(time_format)
+    if period_ms is not None:
+        wraps = np.cumsum(np.diff(time_ms) < 0)
+        time_ms[1:] += wraps*period_ms
+
+        if wraps.size > 0 and wraps[-1] > 0:
+            print(f"Unwrapped {wraps[-1]} time rollovers of {period_ms/1000:.0f}s")
+
+    return time_ms*1e-3
+
+
+def _time_char_codes(data):
+    """Returns the character codes of an array of time strings as an (n, width) integer matrix
+    and the length of each string (ignoring trailing whitespace and padding)
+    """
+
+    data = np.ascontiguousarray(data)
+
+    if data.dtype.kind == "U":
+        char_codes = data.view(np.uint32).reshape(data.size, -1).astype(np.int32)
+    elif data.dtype.kind == "S":
+        char_codes = data.view(np.uint8).reshape(data.size, -1).astype(np.int32)
+    else:
+        sys.exit(f"ERROR - times must be strings to be converted (dtype: {data.dtype})")
+
+    # anything at or below a space is padding
+    is_char = char_codes > ord(" ")
+    str_len = char_codes.shape[1] - np.argmax(is_char[:, ::-1], axis=1)
+
+    return char_codes, str_len
+
 
-    print(data)
+def _time_digits(char_codes, rows, idx_end, width):
+    """Converts the fixed width digit field ending at column idx_end (inclusive) of each row to integers
 
-    time_start = datetime.strptime(data[0], time_format)
+    Returns the integer values and whether every character in the field was a digit
+    """
 
-    for idx in range(1, len(data)):
-        tmp_conv = datetime.strptime(data[idx], time_format)
-        time_conv = tmp_conv - time_start
-        time_conv = time_conv.seconds + time_conv.microseconds*1e-6
-        time_basis[idx] = time_conv
+    value = np.zeros(rows.size, dtype=np.int64)
+    valid = np.ones(rows.size, dtype=bool)
 
-    return time_basis
+    for idx in range(width):
+        idx_char = idx_end - width + 1 + idx
+        digit = char_codes[rows, np.maximum(idx_char, 0)] - ord("0")
+        valid &= (idx_char >= 0) & (digit >= 0) & (digit <= 9)
+        value = value*10 + digit
+
+    return value, valid
+
+
+def _time_digits_variable(char_codes, rows, idx_end):
+    """Converts a one or two digit field ending at column idx_end (inclusive) of each row to integers
+
+    Returns the integer values, the width of the field in each row and whether the field was valid
+    """
+
+    ones, valid = _time_digits(char_codes, rows, idx_end, 1)
+
+    tens = char_codes[rows, np.maximum(idx_end - 1, 0)] - ord("0")
+    has_tens = (idx_end >= 1) & (tens >= 0) & (tens <= 9)
+
+    value = ones + np.where(has_tens, tens*10, 0)
+    width = 1 + has_tens
+
+    return value, width, valid
+
+
+def _parse_time_date_ampm(char_codes, str_len):
+    """Parses times of the form 28/11/2019 10:46:01.099 AM to milliseconds since the epoch"""
+
+    rows = np.arange(char_codes.shape[0])
+    # index of the final character of each string
+    end = str_len - 1
+
+    is_pm = char_codes[rows, end - 1] == ord("P")
+    valid = is_pm | (char_codes[rows, end - 1] == ord("A"))
+
+    milli, valid_field = _time_digits(char_codes, rows, end - 3, 3)
+    valid &= valid_field
+    second, valid_field = _time_digits(char_codes, rows, end - 7, 2)
+    valid &= valid_field
+    minute, valid_field = _time_digits(char_codes, rows, end - 10, 2)
+    valid &= valid_field
+    hour, hour_width, valid_field = _time_digits_variable(char_codes, rows, end - 13)
+    valid &= valid_field
+
+    end_year = end - 13 - hour_width - 1
+    year, valid_field = _time_digits(char_codes, rows, end_year, 4)
+    valid &= valid_field
+    month, valid_field = _time_digits(char_codes, rows, end_year - 5, 2)
+    valid &= valid_field
+    day, _, valid_field = _time_digits_variable(char_codes, rows, end_year - 8)
+    valid &= valid_field & (month >= 1) & (month <= 12) & (day >= 1)
+
+    if not np.all(valid):
+        return None, valid
+
+    # 12 hour clock - 12 AM is midnight and 12 PM is midday
+    hour = hour % 12 + 12*is_pm
+
+    days = ((year - 1970)*12 + month - 1).astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + day - 1
+
+    time_ms = (((days*24 + hour)*60 + minute)*60 + second)*1000 + milli
+
+    return time_ms, valid
+
+
+def _parse_time_min_sec(char_codes, str_len):
+    """Parses times of the form 42:36.335 to milliseconds since the start of the hour"""
+
+    rows = np.arange(char_codes.shape[0])
+    end = str_len - 1
+
+    milli, valid = _time_digits(char_codes, rows, end, 3)
+    second, valid_field = _time_digits(char_codes, rows, end - 4, 2)
+    valid &= valid_field
+    minute, valid_field = _time_digits(char_codes, rows, end - 7, 2)
+    valid &= valid_field
+
+    time_ms = (minute*60 + second)*1000 + milli
+
+    return time_ms, valid
+
+
+def _parse_time_sec(char_codes, str_len):
+    """Parses times of the form 36.335 to milliseconds since the start of the minute"""
+
+    rows = np.arange(char_codes.shape[0])
+    end = str_len - 1
+
+    milli, valid = _time_digits(char_codes, rows, end, 3)
+    second, valid_field = _time_digits(char_codes, rows, end - 4, 2)
+    valid &= valid_field
+
+    time_ms = second*1000 + milli
+
+    return time_ms, valid
+
+
+# vectorised parsers for each time format in TIME_FORMAT_DICT
+TIME_PARSE_DICT = {"%d/%m/%Y %H:%M:%S.%f %p": _parse_time_date_ampm,
+                   "%M:%S.%f": _parse_time_min_sec,
+                   "%S.%f": _parse_time_sec}
 
 
 # ---------------------------------
@@ -239,30 +1159,49 @@ def check_config_file():
 
     no_errors = True
 
-    if len(cfg_analysis.CSV_FILE) != len(cfg_analysis.TIME_EXTRACT):
-        print(f"ERROR - There are {len(cfg_analysis.CSV_FILE)} files and {len(cfg_analysis.TIME_EXTRACT)} different file times")
-        print("Check CSV_FILE and TIME_EXTRACT")
-        no_errors = False
-
-    if len(cfg_analysis.CSV_FILE) != len(cfg_analysis.ALTITUDE):
-        print(f"ERROR - There are {len(cfg_analysis.CSV_FILE)} files and {len(cfg_analysis.ALTITUDE)} different altitudes")
-        print("Check CSV_FILE and ALTITUDE")
-        no_errors = False
+    if cfg.TEST_POINT_TABLE is not None:
+        # test points are read from the table instead of the analysis config file
+        no_errors = _check_test_point_table()
 
-    if len(cfg_analysis.CSV_FILE) != len(cfg_analysis.AIRSPEED):
-        print(f"ERROR - There are {len(cfg_analysis.CSV_FILE)} files and {len(cfg_analysis.AIRSPEED)} different airspeeds")
-        print("Check CSV_FILE and AIRSPEED")
-        no_errors = False
-
-    if len(cfg_analysis.TIME_EXTRACT[0]) != len(cfg_analysis.ALTITUDE[0]):
-        print(f"ERROR - There are {len(cfg_analysis.TIME_EXTRACT[0])} time slices and {len(cfg_analysis.ALTITUDE[0])} different altitudes")
-        print("Check CSV_FILE and TIME_EXTRACT")
-        no_errors = False
-
-    if len(cfg_analysis.TIME_EXTRACT[0]) != len(cfg_analysis.AIRSPEED[0]):
-        print(f"ERROR - There are {len(cfg_analysis.TIME_EXTRACT[0])} time slices and {len(cfg_analysis.AIRSPEED[0])} different airspeeds")
-        print("Check CSV_FILE and ALTITUDE")
-        no_errors = False
+    else:
+        if len(cfg_analysis.CSV_FILE) != len(cfg_analysis.TIME_EXTRACT):
+            print(f"ERROR - There are {len(cfg_analysis.CSV_FILE)} files and {len(cfg_analysis.TIME_EXTRACT)} different file times")
+            print("Check CSV_FILE and TIME_EXTRACT")
+            no_errors = False
+
+        if len(cfg_analysis.CSV_FILE) != len(cfg_analysis.ALTITUDE):
+            print(f"ERROR - There are {len(cfg_analysis.CSV_FILE)} files and {len(cfg_analysis.ALTITUDE)} different altitudes")
+            print("Check CSV_FILE and ALTITUDE")
+            no_errors = False
+
+        if len(cfg_analysis.CSV_FILE) != len(cfg_analysis.AIRSPEED):
+            print(f"ERROR - There are {len(cfg_analysis.CSV_FILE)} files and {len(cfg_analysis.AIRSPEED)} different airspeeds")
+            print("Check CSV_FILE and AIRSPEED")
+            no_errors = False
+
+        if len(cfg_analysis.TIME_EXTRACT[0]) != len(cfg_analysis.ALTITUDE[0]):
+            print(f"ERROR - There are {len(cfg_analysis.TIME_EXTRACT[0])} time slices and {len(cfg_analysis.ALTITUDE[0])} different altitudes")
+            print("Check CSV_FILE and TIME_EXTRACT")
+            no_errors = False
+
+        if len(cfg_analysis.TIME_EXTRACT[0]) != len(cfg_analysis.AIRSPEED[0]):
+            print(f"ERROR - There are {len(cfg_analysis.TIME_EXTRACT[0])} time slices and {len(cfg_analysis.AIRSPEED[0])} different airspeeds")
+            print("Check CSV_FILE and ALTITUDE")
+            no_errors = False
+
+    if cfg_analysis.DATA_FORMAT == 2:
+        missing_fields = [field for field in IDE_CONFIG_FIELDS if not hasattr(cfg_analysis, field)]
+        if missing_fields:
+            print(f"ERROR - .IDE recordings (DATA_FORMAT 2) require {', '.join(missing_fields)} in the analysis config file")
+            print("See the readme for the channel, parser and calibration fields")
+            no_errors = False
+
+    if cfg.DECIMATE_BANDWIDTH is not None and cfg.FILTER_PER_WINDOW:
+        samp_rate_decimated = SAMP_RATE_RECORDED/decimation_factor(SAMP_RATE_RECORDED, cfg.DECIMATE_BANDWIDTH)
+        if cfg_analysis.FREQ_LOWPASS >= samp_rate_decimated/2:
+            print(f"ERROR - FREQ_LOWPASS ({cfg_analysis.FREQ_LOWPASS}Hz) is above the Nyquist frequency after decimation ({samp_rate_decimated/2:.1f}Hz)")
+            print("Windows are low-pass filtered after decimation with FILTER_PER_WINDOW - increase DECIMATE_BANDWIDTH or reduce FREQ_LOWPASS")
+            no_errors = False
 
     if no_errors:
         return 1
@@ -272,18 +1211,35 @@ def check_config_file():
         sys.exit()
 
 
-def _check_timestep(time):
-    """Checks the timesteps between adjacent elements in a vector of times"""
+def _check_timestep(time, time_check=None):
+    """Checks the timesteps between adjacent elements in a vector of times
+
+    If the time axis was synthesised from the sample rate (SYNTH_TIME) the results of the sparse
+    timestamp check are reported instead, as adjacent timesteps are equal by construction
+    """
     print("\nChecking timesteps...")
 
-    difference = np.diff(time)
-    max_diff = np.max(difference)
-    min_diff = np.min(difference)
-    av_diff = np.mean(difference)
+    if time_check is not None:
+        print(f"Time axis synthesised from SAMP_RATE ({cfg_analysis.SAMP_RATE}Hz)")
+        print(f"Timestamps checked: {time_check['rows_checked']} (every {time_check['check_every']} rows)")
+        print(f"Max. difference to synthesised time: {time_check['max_error']:.5f}")
+        print(f"Drift at end of data: {time_check['drift']:.5f}")
+        if time_check["passed"]:
+            print(f"Within tolerance of {cfg.SYNTH_TIME_TOLERANCE:.5f} - synthesised time used")
+        else:
+            print(f"Outside tolerance of {cfg.SYNTH_TIME_TOLERANCE:.5f} - all timestamps parsed and used instead")
+            time_check = None
+
+    if time_check is None:
+        difference = np.diff(time)
+        max_diff = np.max(difference)
+        min_diff = np.min(difference)
+        av_diff = np.mean(difference)
+
+        print(f"Max. timestep: {max_diff:.5f}")
+        print(f"Min. timestep: {min_diff:.5f}")
+        print(f"Average timestep: {av_diff:.5f}")
 
-    print(f"Max. timestep: {max_diff:.5f}")
-    print(f"Min. timestep: {min_diff:.5f}")
-    print(f"Average timestep: {av_diff:.5f}")
     print(f"Timestep used in analysis: {cfg_analysis.TIMESTEP:.5f}")
     print("NOTE: FFT assumes equal timesteps between all points. Differences may introduce errors.")
 
@@ -296,7 +1252,8 @@ def _identify_time_format(str_sample_time):
     for regex_pattern_string in TIME_FORMAT_DICT:
         regex_pattern = re.compile(regex_pattern_string)
 
-        if regex_pattern.search(str_sample_time):
+        # first (most specific) match is used - "%S.%f" would otherwise also match "%M:%S.%f" times
+        if time_format is None and regex_pattern.search(str_sample_time):
             time_format = TIME_FORMAT_DICT[regex_pattern_string]
 
         if cfg.DEBUG:
@@ -10,71 +10,374 @@ TODO
 # Data is required to be:
 # - Equal timesteps between each datapoint
 
+import argparse
+import contextlib
+import functools
+import io
+import queue
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import flutter_config as cfg
 from flutter_config import cfg_analysis
 
-from flutter_input import import_data_acc, import_data_atmos, check_config_file
-from flutter_analysis import analyse_data_acc
-from flutter_output import compare_data_acc, save_csv_output
+from flutter_input import import_data_acc, import_data_atmos, check_config_file, load_test_point_table, \
+    _set_samp_rate, _use_lazy_load
+from flutter_analysis import analyse_data_acc, welch_test_points, analyse_damping_half_power, detect_test_points
+from flutter_output import compare_data_acc, save_csv_output, set_plot_queue, draw_queued_plots, plot_spectrogram, \
+    save_test_point_table, set_headless_figures
+from flutter_spectrogram import update_spectrogram, load_spectrogram
 from flutter_other import make_default_directories
 
 
-def main_program():
-    """Main runtime"""
+# time (s) between drawing plots queued by test points analysed in threads
+PLOT_POLL_INTERVAL = 0.1
+
+# test points analysed in a worker process (set by _init_point_worker)
+_WORKER_ACC_DATA = None
+
+
+def main_program(jobs=1, point_jobs=1, point_backend="thread"):
+    """Main runtime
+
+    With jobs > 1 files are imported and analysed in separate processes. Results are combined in
+    the order of the config file so the output matches a serial run.
+    With point_jobs > 1 the test points of each file are analysed concurrently (analyse_test_points).
+    """
 
     check_config_file()
 
-    analysis_files = cfg_analysis.CSV_FILE
+    # unattended runs save figures without showing them
+    if cfg.DAMPING_HEADLESS or cfg.DAMPING_LSTSQ:
+        print("NOTE - figures are saved (SAVE_FIG) but not shown with DAMPING_HEADLESS or DAMPING_LSTSQ")
+        set_headless_figures()
 
-    analysis_files_atmos = cfg_analysis.CSV_FILE_ATMOS
+    analysis_files = cfg_analysis.CSV_FILE
 
     print("Creating directories...")
     make_default_directories()
     print("Directories created.")
 
+    out_data = [["Source"], ["Test"], ["Frequencies"], ["Damping"], ["Damping (Half Power)"],
+                ["Damping Frequencies (Ref.)"]]
+    results = []
+
+    if jobs > 1 or point_jobs > 1:
+        check_parallel_config(jobs, point_jobs, point_backend)
+
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+            file_outputs = executor.map(functools.partial(_analyse_file_buffered, point_jobs=point_jobs,
+                                                          point_backend=point_backend),
+                                        range(len(analysis_files)))
+
+            # printed as each file finishes (in config order) with the file name as a tag
+            for idx_file, (file_results, file_out_data, console_output) in enumerate(file_outputs):
+                for line in console_output.splitlines():
+                    print(f"[{analysis_files[idx_file]}] {line}")
+
+                results.extend(file_results)
+                for idx_col in range(len(out_data)):
+                    out_data[idx_col].extend(file_out_data[idx_col])
+
+    else:
+        # for every file
+        for idx_file in range(len(analysis_files)):
+            file_results, file_out_data = analyse_file(idx_file, point_jobs, point_backend)
+
+            results.extend(file_results)
+            for idx_col in range(len(out_data)):
+                out_data[idx_col].extend(file_out_data[idx_col])
+
+    # all test points at once from their PSDs
+    if cfg.CALC_FREQ and cfg.CALC_DAMPING_HALF_POWER:
+        analyse_damping_half_power(results)
+        fill_damping_half_power(out_data)
+
+    compare_data_acc(results)
+
+    save_csv_output(out_data, cfg_analysis.ACC_BASIS_STR)
+
+
+def analyse_file(idx_file, point_jobs=1, point_backend="thread"):
+    """Imports and analyses every time range in a file
+
+    Returns:
+    - results = result dict of every test point with an airspeed
+    - out_data = rows for the output csv (one list per output column)
     """
-    print(f"Running on {analysis_files_atmos[0]}...")
-    atmos = import_data_atmos(analysis_files_atmos, 0)
 
-    out_data = [["Source"], ["Test"], ["Frequencies"], ["Damping"], ["Damping Frequencies (Ref.)"]]
+    analysis_files = cfg_analysis.CSV_FILE
+
+    time_ranges, airspeed, altitude, subtitle = test_point_config(idx_file)
 
-    # for every file
-    for idx_file in range(len(analysis_files)):
+    results = []
+    out_data = [[], [], [], [], [], []]
+
+    if len(time_ranges) == 0:
+        print(f"No test points in {analysis_files[idx_file]} (skipped)")
+        return results, out_data
+
+    print(f"Running on {analysis_files[idx_file]}...")
+    acc_data = import_data_acc(analysis_files, idx_file, time_ranges)
+
+    if cfg.SPECTROGRAM:
+        if _use_lazy_load(time_ranges):
+            print("WARNING - spectrogram requires the entire recording (skipped with LAZY_LOAD)")
+        else:
+            spectrogram_path = update_spectrogram(acc_data, analysis_files[idx_file])
+            plot_spectrogram(*load_spectrogram(spectrogram_path), title=analysis_files[idx_file],
+                             time_ranges=time_ranges, airspeeds=airspeed)
+
+    # power spectral density of every time range calculated together
+    psd_file = None
+    if cfg.CALC_FREQ:
+        psd_file = welch_test_points(acc_data, time_ranges)
+
+    # arguments of analyse_data_acc for every time range in the file
+    test_points = []
+    for idx_range in range(len(time_ranges)):
+
+        psd = None
+        if psd_file is not None:
+            psd = (psd_file[0], psd_file[1][idx_range])
+
+        test_points.append((time_ranges, idx_range, airspeed[idx_range], altitude[idx_range], subtitle[idx_range], psd))
+
+    results_file = analyse_test_points(acc_data, test_points, point_jobs, point_backend)
+
+    for idx_range, result_test_point in enumerate(results_file):
+
+        # by setting airspeed to None in testpoints, they can be removed from data result processing
+        if airspeed[idx_range] is not None:
+            results.append(result_test_point)
+
+        if cfg.SAVE_OUTPUT:
+            out_data[cfg.COL_OUT_SOURCE].append(cfg_analysis.ACC_BASIS_STR)
+            title_core = str(result_test_point["airspeed"]) + " @ " + str(result_test_point["altitude"]) + "K"
+            out_data[cfg.COL_OUT_TEST].append(title_core)
+            if cfg.CALC_FREQ:
+                out_data[cfg.COL_OUT_FREQ].append(result_test_point["modal_freq"])
+            if cfg.CALC_DAMPING:
+                out_data[cfg.COL_OUT_DAMPING].append(result_test_point["damping_modal_ratio"])
+                out_data[cfg.COL_OUT_DAMPING_FREQ].append(result_test_point["f_modal"])
+            if cfg.CALC_FREQ and cfg.CALC_DAMPING_HALF_POWER:
+                # half-power damping is calculated once all files are analysed (fill_damping_half_power)
+                out_data[cfg.COL_OUT_DAMPING_HALF_POWER].append(result_test_point)
+
+    return results, out_data
+
+
+def fill_damping_half_power(out_data):
+    """Replaces the test point results held in the half-power damping output column by their
+    half-power damping ratios (nan where there is no estimate)
+    """
+
+    col_half_power = out_data[cfg.COL_OUT_DAMPING_HALF_POWER]
+
+    # first row is the column title
+    col_half_power[1:] = [result.get("damping_half_power", float("nan")) for result in col_half_power[1:]]
+
+
+def test_point_config(idx_file):
+    """Time ranges, airspeeds, altitudes and subtitles of the test points in a file
+    Read from the test point table if TEST_POINT_TABLE is set, otherwise the analysis config file
+    """
+
+    if cfg.TEST_POINT_TABLE is None:
+        return (cfg_analysis.TIME_EXTRACT[idx_file], cfg_analysis.AIRSPEED[idx_file],
+                cfg_analysis.ALTITUDE[idx_file], cfg_analysis.SUBTITLE[idx_file])
+
+    test_points = load_test_point_table(cfg.TEST_POINT_TABLE).get(cfg_analysis.CSV_FILE[idx_file])
+
+    if test_points is None:
+        return [], [], [], []
+
+    return test_points["TIME_EXTRACT"], test_points["AIRSPEED"], test_points["ALTITUDE"], test_points["SUBTITLE"]
+
+
+def atmos_file(idx_file):
+    """Files and index of the atmospheric data for a file (arguments of import_data_atmos)
+
+    The atmospheric data is read from CSV_FILE_ATMOS (one file for each file in CSV_FILE or a single
+    file for all of them) and from the accelerometer file itself if CSV_FILE_ATMOS is not set
+    """
+
+    analysis_files_atmos = getattr(cfg_analysis, "CSV_FILE_ATMOS", None)
+
+    if not analysis_files_atmos:
+        return cfg_analysis.CSV_FILE, idx_file
+
+    if len(analysis_files_atmos) == len(cfg_analysis.CSV_FILE):
+        return analysis_files_atmos, idx_file
 
-        airspeed = cfg_analysis.AIRSPEED[idx_file]
-        altitude = cfg_analysis.ALTITUDE[idx_file]
-        time_ranges = cfg_analysis.TIME_EXTRACT[idx_file]
-        subtitle = cfg_analysis.SUBTITLE[idx_file]
+    if len(analysis_files_atmos) == 1:
+        return analysis_files_atmos, 0
 
-        print(f"Running on {analysis_files[idx_file]}...")
+    print(f"ERROR - There are {len(cfg_analysis.CSV_FILE)} files and {len(analysis_files_atmos)} atmospheric files")
+    sys.exit("Check CSV_FILE and CSV_FILE_ATMOS")
+
+
+def detect_test_points_all():
+    """Detects the test points in every file and saves them to a test point table
+
+    The table is saved to TEST_POINT_TABLE (or the Results folder if it is not set) so it can be
+    checked, the airspeeds filled in and then used by the analysis
+    """
+
+    analysis_files = cfg_analysis.CSV_FILE
+
+    print("Creating directories...")
+    make_default_directories()
+    print("Directories created.")
+
+    test_points = []
+
+    for idx_file in range(len(analysis_files)):
+        print(f"Detecting test points in {analysis_files[idx_file]}...")
+
+        # the entire record is scanned
         acc_data = import_data_acc(analysis_files, idx_file)
 
+        atmos_data = None
+        if cfg_analysis.DATA_FORMAT in (1, 2):
+            atmos_data = import_data_atmos(*atmos_file(idx_file))
+
+        for test_point in detect_test_points(acc_data, atmos_data):
+            test_point["file"] = analysis_files[idx_file]
+            test_points.append(test_point)
+
+    if cfg.TEST_POINT_TABLE is None:
+        filepath = cfg.OUTPUT_FILE_ROOT + cfg_analysis.ACC_BASIS_STR + "_TEST_POINTS.csv"
+    else:
+        filepath = cfg.TEST_POINT_TABLE
+
+    save_test_point_table(test_points, filepath)
+
+    return test_points
+
+
+def analyse_test_points(acc_data, test_points, point_jobs=1, point_backend="thread"):
+    """Runs analyse_data_acc for every test point of a file
+
+    test_points = (time_ranges, idx_range, airspeed, altitude, subtitle, psd) of each test point
+    With point_jobs > 1 test points are analysed concurrently in threads (SciPy FFTs and filters
+    release the GIL) or worker processes (point_backend = "process"). Plots are drawn by this
+    thread only and results are returned in the order of test_points.
+    """
+
+    if point_jobs <= 1 or len(test_points) <= 1:
+        return [analyse_data_acc(acc_data, *test_point[:5], psd=test_point[5]) for test_point in test_points]
+
+    if point_backend == "process":
         results = []
 
-        # for every time range in the file
-        for idx_range in range(len(time_ranges)):
+        with ProcessPoolExecutor(max_workers=point_jobs, initializer=_init_point_worker,
+                                 initargs=(acc_data, cfg_analysis.SAMP_RATE, cfg_analysis.TIMESTEP)) as executor:
 
-            result_test_point = analyse_data_acc(acc_data, time_ranges, idx_range,
-                                                 airspeed[idx_range], altitude[idx_range], subtitle[idx_range])
+            # console output and plots of each test point in config order
+            for result, console_output, plots in executor.map(_analyse_test_point_worker, test_points):
+                print(console_output, end="")
 
-            # by setting airspeed to None in testpoints, they can be removed from data result processing
-            if airspeed[idx_range] is not None:
-                results.append(result_test_point)
+                plot_queue = queue.SimpleQueue()
+                for plot in plots:
+                    plot_queue.put(plot)
+                draw_queued_plots(plot_queue)
 
-            if cfg.SAVE_OUTPUT:
-                out_data[cfg.COL_OUT_SOURCE].append(cfg_analysis.ACC_BASIS_STR)
-                title_core = str(result_test_point["airspeed"]) + " @ " + str(result_test_point["altitude"]) + "K"
-                out_data[cfg.COL_OUT_TEST].append(title_core)
-                if cfg.CALC_FREQ:
-                    out_data[cfg.COL_OUT_FREQ].append(result_test_point["modal_freq"])
-                if cfg.CALC_DAMPING:
-                    out_data[cfg.COL_OUT_DAMPING].append(result_test_point["damping_modal_ratio"])
-                    out_data[cfg.COL_OUT_DAMPING_FREQ].append(result_test_point["f_modal"])
+                results.append(result)
 
-    compare_data_acc(results)
+        return results
 
-    save_csv_output(out_data, cfg_analysis.ACC_BASIS_STR)
+    plot_queue = queue.SimpleQueue()
+
+    with ThreadPoolExecutor(max_workers=point_jobs, initializer=set_plot_queue, initargs=(plot_queue,)) as executor:
+        futures = [executor.submit(analyse_data_acc, acc_data, *test_point[:5], psd=test_point[5])
+                   for test_point in test_points]
+
+        # plots are drawn as they are queued until every test point is finished
+        while not all(future.done() for future in futures):
+            draw_queued_plots(plot_queue, timeout=PLOT_POLL_INTERVAL)
+        draw_queued_plots(plot_queue)
+
+    return [future.result() for future in futures]
+
+
+def check_parallel_config(jobs=1, point_jobs=1, point_backend="thread"):
+    """Checks the analysis can run in worker processes and threads (which cannot prompt for input)"""
+
+    if cfg.CALC_DAMPING and not (cfg.DAMPING_HEADLESS or cfg.DAMPING_LSTSQ) and \
+            (not cfg_analysis.DAMPING_AUTOMATIC or len(cfg_analysis.FREQ_FILTER_REF) == 0):
+        print("ERROR - damping calculations prompt for input unless DAMPING_HEADLESS is set, "
+              "or DAMPING_AUTOMATIC is set and FREQ_FILTER_REF is given")
+        sys.exit("Run with --jobs 1 --point-jobs 1 or update the analysis config file")
+
+    if jobs > 1 and point_jobs > 1 and point_backend == "process":
+        sys.exit("ERROR - the process backend for test points cannot be used with --jobs > 1 (use threads)")
+
+    return 1
+
+
+def _init_point_worker(acc_data, samp_rate, timestep):
+    """Worker processes for test points keep the file data and (decimated) sample rate of the main process"""
+
+    global _WORKER_ACC_DATA
+    _WORKER_ACC_DATA = acc_data
+
+    _set_samp_rate(samp_rate, timestep)
+
+
+def _analyse_test_point_worker(test_point):
+    """Runs analyse_data_acc in a worker process
+    Returns the result with the buffered console output and queued plots for the main process
     """
 
+    console_output = io.StringIO()
+    plot_queue = queue.SimpleQueue()
+    set_plot_queue(plot_queue)
+
+    with contextlib.redirect_stdout(console_output):
+        result = analyse_data_acc(_WORKER_ACC_DATA, *test_point[:5], psd=test_point[5])
+
+    set_plot_queue(None)
+
+    plots = []
+    while not plot_queue.empty():
+        plots.append(plot_queue.get())
+
+    return result, console_output.getvalue(), plots
+
+
+def _init_worker():
+    """Worker processes save figures without showing them"""
+
+    set_headless_figures()
+
+
+def _analyse_file_buffered(idx_file, point_jobs=1, point_backend="thread"):
+    """Runs analyse_file with console output buffered so it can be printed by the main process"""
+
+    console_output = io.StringIO()
+
+    with contextlib.redirect_stdout(console_output):
+        file_results, file_out_data = analyse_file(idx_file, point_jobs, point_backend)
+
+    return file_results, file_out_data, console_output.getvalue()
+
+
 if __name__ == "__main__":
-    main_program()
+    parser = argparse.ArgumentParser(description="Analyse vibration data from flight testing")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of files to import and analyse in parallel (default: 1)")
+    parser.add_argument("--point-jobs", type=int, default=1,
+                        help="number of test points in each file to analyse concurrently (default: 1)")
+    parser.add_argument("--point-backend", choices=["thread", "process"], default="thread",
+                        help="run concurrent test points in threads or processes (default: thread)")
+    parser.add_argument("--detect-test-points", action="store_true",
+                        help="detect the test points in every file and save them to a test point table "
+                             "(TEST_POINT_TABLE) instead of running the analysis")
+    args = parser.parse_args()
+
+    if args.detect_test_points:
+        detect_test_points_all()
+    else:
+        main_program(jobs=args.jobs, point_jobs=args.point_jobs, point_backend=args.point_backend)
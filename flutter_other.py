@@ -4,9 +4,11 @@
 Miscellaneous functions for analysis
 """
 
+import functools
 import math
 import matplotlib as plt
 import numpy as np
+import scipy.fft
 import scipy.signal as signal
 import sys
 import os
@@ -14,6 +16,97 @@ import os
 import flutter_config as cfg
 from flutter_config import cfg_analysis
 
+from flutter_output import queued_plot
+
+# ---------------------------------
+# CONSTANTS
+# ---------------------------------
+
+# number of filter designs memoised by design_filter_butter
+FILTER_CACHE_SIZE = 64
+
+# sample rate and timestep of the recordings (cfg_analysis values are changed by decimation)
+SAMP_RATE_RECORDED = cfg_analysis.SAMP_RATE
+TIMESTEP_RECORDED = cfg_analysis.TIMESTEP
+
+# ---------------------------------
+# CLASSES - DATA
+# ---------------------------------
+
+
+class ColumnData:
+    """Column store of equal length arrays indexed like a 2D numpy array (data[rows, col])
+
+    Each column is a separate contiguous array so columns can have different dtypes (time is
+    always float64 while signals follow PRECISION). Indexing returns views where numpy would.
+    Columns that have not been set are None. Filtered windows (FILTER_PER_WINDOW) are memoised
+    in filtered_windows.
+    """
+
+    __slots__ = ("columns", "filtered_windows")
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.filtered_windows = {}
+
+    def __getitem__(self, key):
+        rows, col = key
+        if col >= len(self.columns) or self.columns[col] is None:
+            raise IndexError(f"Column {col} has not been set")
+        return self.columns[col][rows]
+
+    def __setitem__(self, key, value):
+        rows, col = key
+        if col >= len(self.columns) or self.columns[col] is None:
+            raise IndexError(f"Column {col} has not been set")
+        self.columns[col][rows] = value
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def set_column(self, col, column):
+        """Sets (or adds) an entire column"""
+
+        if len(column) != len(self):
+            raise ValueError(f"Column {col} has {len(column)} rows (expected {len(self)})")
+
+        self.columns.extend([None]*(col + 1 - len(self.columns)))
+        self.columns[col] = column
+
+    @property
+    def shape(self):
+        return (len(self), len(self.columns))
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns if column is not None)
+
+    def __repr__(self):
+        num_preview = 3
+        columns = [column for column in self.columns if column is not None]
+        if len(self) > 2*num_preview:
+            preview = [np.concatenate((column[:num_preview], column[-num_preview:])) for column in columns]
+        else:
+            preview = columns
+        dtypes = ", ".join(str(column.dtype) if column is not None else "unset" for column in self.columns)
+        return f"ColumnData({len(self)} rows, columns: {dtypes})\n{np.column_stack(preview)}"
+
+
+def data_dtype():
+    """Returns the dtype for signal data set by PRECISION (time is always float64)"""
+
+    return np.dtype(cfg.PRECISION)
+
+
+def samples_at_samp_rate(num_samples):
+    """Converts a number of samples at the recorded sample rate to the same time at the current sample rate
+
+    Settings counted in samples (BIN_SIZE, DAMPING_PEAK_DISTANCE) are for the recorded sample rate
+    so they cover the same time and frequency step after decimation (DECIMATE_BANDWIDTH)
+    """
+
+    return max(int(round(num_samples*cfg_analysis.SAMP_RATE/SAMP_RATE_RECORDED)), 1)
+
 # ---------------------------------
 # FUNCTIONS - FILTERS
 # ---------------------------------
@@ -22,26 +115,209 @@ from flutter_config import cfg_analysis
 def acc_filter_butter(data, freq, filter_type):
     """Apply butterworth filter to data"""
 
-    filter_order = cfg.FILTER_ORDER = 4
+    freq, filter_type = _check_filter(freq, filter_type)
+
+    """Using b/a filter in Scipy with Nyquist frequency much larger than filter frequency has issues from from float numerical precision
+    sos (second order sections representation of IIR filter) fixes these issue
+    """
+    # [b,a] = signal.butter(FILTER_ORDER, freq_filter, filter_type);
+    # data_filter = signal.filtfilt(b, a, data)
+    sos, zi, padlen = design_filter_butter(cfg.FILTER_ORDER, freq, filter_type, cfg_analysis.SAMP_RATE)
+    # filtered in float64 (recursive filters accumulate rounding errors) and returned in the input precision
+    data_filter = sosfiltfilt_design(sos, zi, padlen, np.asarray(data, dtype=np.float64))
+
+    return data_filter.astype(np.result_type(np.asarray(data).dtype, np.float32), copy=False)
+
+
+def acc_filter_butter_bank(data, freq_bands, filter_type='bandpass'):
+    """Apply a butterworth filter for each frequency band to the same data
+
+    Returns a (n_bands, n_samples) array with the filtered data for each band as a row (each
+    row matches acc_filter_butter for that band). The data is converted and padded once for
+    all bands and each band is filtered straight into its row.
+    """
+
+    data = np.asarray(data)
+    data_filter = np.empty((len(freq_bands), len(data)), dtype=np.result_type(data.dtype, np.float32))
+    data = data.astype(np.float64, copy=False)
+
+    # odd extensions of the data for each padding length
+    data_ext = {}
+
+    for idx_band, freq in enumerate(freq_bands):
+        freq, filter_type_band = _check_filter(freq, filter_type)
+        sos, zi, padlen = design_filter_butter(cfg.FILTER_ORDER, freq, filter_type_band, cfg_analysis.SAMP_RATE)
+
+        if len(data) <= padlen:
+            data_filter[idx_band] = sosfiltfilt_design(sos, zi, padlen, data)
+            continue
+
+        if padlen not in data_ext:
+            data_ext[padlen] = _odd_extension(data, padlen)
+
+        data_filter[idx_band] = _sosfiltfilt_extended(sos, zi, padlen, data_ext[padlen])
+
+    return data_filter
+
+
+def _check_filter(freq, filter_type):
+    """Checks the filter type and frequency and returns them in the form used by design_filter_butter"""
 
     if filter_type == 'bandpass' or filter_type == 'bandstop':
         if len(freq) != 2:
             sys.exit(f"ERROR - Frequency length must be two for bandpass/bandstop filters (Current length: {len(freq)})")
-        freq_filter = [f/(cfg_analysis.SAMP_RATE/2) for f in freq]
-    elif filter_type == 'lowpass' or filter_type == 'high_pass':
-        freq_filter = freq/(cfg_analysis.SAMP_RATE/2)
+        freq = tuple(float(f) for f in freq)
+    elif filter_type == 'lowpass' or filter_type == 'high_pass' or filter_type == 'highpass':
+        filter_type = filter_type.replace("_", "")
+        freq = float(freq)
     else:
         sys.exit(f"ERROR - Invalid filter format selected (Filter selected: {filter_type})")
 
-    """Using b/a filter in Scipy with Nyquist frequency much larger than filter frequency has issues from from float numerical precision
-    sos (second order sections representation of IIR filter) fixes these issue
+    freq_nyquist = cfg_analysis.SAMP_RATE/2
+    for f in (freq if isinstance(freq, tuple) else (freq,)):
+        if not 0 < f < freq_nyquist:
+            sys.exit(f"ERROR - Filter frequency must be between 0 and the Nyquist frequency ({freq_nyquist}Hz) (Current frequency: {f}Hz)")
+
+    if not isinstance(cfg.FILTER_ORDER, int) or cfg.FILTER_ORDER < 1:
+        sys.exit(f"ERROR - Filter order must be a positive integer (Current order: {cfg.FILTER_ORDER})")
+
+    return freq, filter_type
+
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def design_filter_butter(filter_order, freq, filter_type, samp_rate):
+    """Designs a butterworth filter (memoised for each order, frequency, type and sample rate)
+
+    Returns:
+    - sos = second order sections of the filter
+    - zi = steady state initial conditions of the filter for a unit step (sosfilt_zi)
+    - padlen = length of the odd extension at each end used by sosfiltfilt
+
+    The returned arrays are shared between calls and must not be modified
     """
-    # [b,a] = signal.butter(FILTER_ORDER, freq_filter, filter_type);
-    # data_filter = signal.filtfilt(b, a, data)
+
+    if isinstance(freq, tuple):
+        freq_filter = [f/(samp_rate/2) for f in freq]
+    else:
+        freq_filter = freq/(samp_rate/2)
+
     sos = signal.butter(filter_order, freq_filter, filter_type, output="sos")
-    data_filter = signal.sosfiltfilt(sos, data)
+    zi = signal.sosfilt_zi(sos)
+
+    # same padding as signal.sosfiltfilt
+    num_zeros = min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    padlen = 3*(2*len(sos) + 1 - num_zeros)
+
+    return sos, zi, padlen
 
-    return data_filter
+
+def sosfiltfilt_design(sos, zi, padlen, data):
+    """Zero phase filtering with a precomputed filter design (equivalent to signal.sosfiltfilt)"""
+
+    if data.shape[-1] <= padlen:
+        # signal.sosfiltfilt gives the error message for data that is too short
+        return signal.sosfiltfilt(sos, data)
+
+    return _sosfiltfilt_extended(sos, zi, padlen, _odd_extension(data, padlen))
+
+
+def _odd_extension(data, padlen):
+    """Extends data at both ends by padlen samples with an odd extension (as signal.sosfiltfilt)"""
+
+    return np.concatenate((2*data[..., :1] - data[..., padlen:0:-1],
+                           data,
+                           2*data[..., -1:] - data[..., -2:-(padlen + 2):-1]), axis=-1)
+
+
+def _sosfiltfilt_extended(sos, zi, padlen, data_ext):
+    """Zero phase filters data that has already been extended by padlen and removes the extension"""
+
+    zi_shape = [sos.shape[0]] + [1]*(data_ext.ndim - 1) + [2]
+    zi = zi.reshape(zi_shape)
+
+    data_filter, _ = signal.sosfilt(sos, data_ext, zi=zi*data_ext[..., :1])
+    data_filter = data_filter[..., ::-1]
+    data_filter, _ = signal.sosfilt(sos, data_filter, zi=zi*data_filter[..., :1])
+
+    return data_filter[..., ::-1][..., padlen:-padlen]
+
+
+def filter_window_lowpass(acc_data, idx_start, idx_end):
+    """Returns the low-pass filtered signal between idx_start and idx_end
+
+    Uses the COL_FILTERED column unless FILTER_PER_WINDOW is set, in which case only the window
+    (padded by FILTER_PAD_TIME either side so edge effects are negligible) is filtered. Filtered
+    windows are memoised on acc_data so repeat access is free.
+    """
+
+    if not cfg.FILTER_PER_WINDOW:
+        return acc_data[:, cfg.COL_FILTERED][idx_start:idx_end]
+
+    key = (idx_start, idx_end)
+
+    if key not in acc_data.filtered_windows:
+        pad = int(round(cfg.FILTER_PAD_TIME*cfg_analysis.SAMP_RATE))
+        idx_pad_start = max(idx_start - pad, 0)
+        idx_pad_end = min(idx_end + pad, len(acc_data))
+
+        data_filter = acc_filter_butter(acc_data[:, cfg.COL_SIGNAL][idx_pad_start:idx_pad_end],
+                                        cfg_analysis.FREQ_LOWPASS, 'lowpass')
+        acc_data.filtered_windows[key] = data_filter[idx_start - idx_pad_start:idx_end - idx_pad_start]
+
+    return acc_data.filtered_windows[key]
+
+
+def acc_filter_butter_blocks(data, freq, filter_type, out=None, block_size=None):
+    """Apply butterworth filter to data one block at a time (for data larger than memory)
+
+    data and out can be memory mapped arrays (out can also be data to filter in place). Only a
+    block of block_size samples is held in memory at once. The filter state is carried between
+    blocks in both the forward and backward passes and the ends are padded as in
+    acc_filter_butter, so the result matches acc_filter_butter to floating point rounding
+    (forward pass results are stored in out, so a float32 out adds float32 rounding).
+    """
+
+    if block_size is None:
+        block_size = cfg.FILTER_BLOCK_SIZE
+
+    if out is None:
+        out = np.empty(len(data), dtype=np.result_type(data.dtype, np.float32))
+
+    freq, filter_type = _check_filter(freq, filter_type)
+
+    sos, zi, padlen = design_filter_butter(cfg.FILTER_ORDER, freq, filter_type, cfg_analysis.SAMP_RATE)
+
+    num_samples = len(data)
+
+    if num_samples <= max(padlen, block_size):
+        out[:] = acc_filter_butter(data, freq, filter_type)
+        return out
+
+    # odd extensions at each end (read before any in place writes)
+    data_start = np.asarray(data[:padlen + 1], dtype=np.float64)
+    data_end = np.asarray(data[-(padlen + 1):], dtype=np.float64)
+    ext_start = 2*data_start[0] - data_start[padlen:0:-1]
+    ext_end = 2*data_end[-1] - data_end[-2::-1]
+
+    blocks = [slice(idx, min(idx + block_size, num_samples)) for idx in range(0, num_samples, block_size)]
+
+    # forward pass
+    _, state = signal.sosfilt(sos, ext_start, zi=zi*ext_start[0])
+    for block in blocks:
+        out[block], state = signal.sosfilt(sos, np.asarray(data[block], dtype=np.float64), zi=state)
+    data_filter_end, _ = signal.sosfilt(sos, ext_end, zi=state)
+
+    # backward pass (starting from the end of the extension)
+    data_filter_end = data_filter_end[::-1]
+    _, state = signal.sosfilt(sos, data_filter_end, zi=zi*data_filter_end[0])
+    for block in reversed(blocks):
+        data_filter, state = signal.sosfilt(sos, np.asarray(out[block], dtype=np.float64)[::-1], zi=state)
+        out[block] = data_filter[::-1]
+
+    if isinstance(out, np.memmap):
+        out.flush()
+
+    return out
 
 # ---------------------------------
 # FUNCTIONS - CHECKS - STATISTICAL
@@ -71,32 +347,40 @@ def stationary_check_mean(data):
     return data_mean
 
 
-def stationary_check_autocorrelation(data):
-    """Checks if data is stationary by getting variation of autocorrelation over time"""
+def stationary_check_autocorrelation(data, max_lag=None):
+    """Checks if data is stationary by getting variation of autocorrelation over time
+
+    Autocorrelation of each segment is calculated with FFTs (zero padded to a fast length).
+    max_lag limits the lags calculated (samples) - defaults to AUTOCORR_MAX_LAG_TIME or every lag
+    Each segment is normalised by its maximum over the calculated lags
+    """
 
     tmp_len = len(data)
     NUM_SEGMENTS = 3
     num_points = math.floor(tmp_len/NUM_SEGMENTS)
 
-    autocorr_norm = np.zeros([NUM_SEGMENTS, num_points-1])
-
-    for idx in range(NUM_SEGMENTS):
-
-        x = data[idx*num_points:(idx+1)*num_points]
+    if max_lag is None and cfg.AUTOCORR_MAX_LAG_TIME is not None:
+        max_lag = int(round(cfg.AUTOCORR_MAX_LAG_TIME/cfg_analysis.TIMESTEP))
+    if max_lag is None or max_lag > num_points - 1:
+        max_lag = num_points - 1
 
-        x = x - x.mean()
+    x = np.reshape(np.asarray(data[:NUM_SEGMENTS*num_points], dtype=np.float64), (NUM_SEGMENTS, num_points))
+    x = x - x.mean(axis=1, keepdims=True)
 
-        autocorr = np.correlate(x, x, mode='full')
-        autocorr = autocorr[x.size:]
+    # padded so lags up to max_lag do not wrap around
+    nfft = scipy.fft.next_fast_len(num_points + max_lag)
+    spectra = scipy.fft.rfft(x, n=nfft, axis=1)
+    autocorr = scipy.fft.irfft(spectra.real**2 + spectra.imag**2, n=nfft, axis=1)
 
-        # normalise the data
-        autocorr /= autocorr.max()
+    # lags from 1 (as np.correlate(x, x, mode='full')[x.size:])
+    autocorr_norm = autocorr[:, 1:max_lag + 1]
 
-        autocorr_norm[idx, :] = autocorr
+    # normalise the data
+    autocorr_norm /= autocorr_norm.max(axis=1, keepdims=True)
 
-    lag = cfg_analysis.TIMESTEP*np.arange(0, num_points)
+    lag = cfg_analysis.TIMESTEP*np.arange(0, max_lag)
 
-    return autocorr_norm, lag[:-1]
+    return autocorr_norm, lag
 
 
 def stationary_check(data, time, check_mean=True, check_autocorr=True):
@@ -113,6 +397,7 @@ def stationary_check(data, time, check_mean=True, check_autocorr=True):
         plot_autocorr_variation_with_time(lag, data_corr)
 
 
+@queued_plot
 def plot_mean_variation_with_time(time, data_mean):
     """Plots variation of mean over time
     Used to check for stationary data
@@ -126,6 +411,7 @@ def plot_mean_variation_with_time(time, data_mean):
     plt.show()
 
 
+@queued_plot
 def plot_autocorr_variation_with_time(lag, data_corr):
     """Plots variation of autocorrelation over time
     Used to check for stationary data
@@ -11,21 +11,96 @@ MORE DETAILS
   bar = foo.FunctionBar()
 
 TODO
-- Add spectrogram of changes in modal frequencies at different airspeeds
+- None
 """
 
 from mpl_toolkits.mplot3d import Axes3D
 
 import csv
+import functools
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import numpy as np
+import queue
+import threading
 
 import flutter_config as cfg
 from flutter_config import cfg_analysis
 
 import bisect
 
+# columns of the test point table (TEST_POINT_TABLE)
+TEST_POINT_TABLE_COLUMNS = ["file", "start", "end", "airspeed", "altitude", "subtitle",
+                            "altitude_ft", "altitude_range_ft", "stable", "rms_peak"]
+
+# plots made by test points analysed concurrently are added to the plot queue of their thread
+# and drawn by a single consumer (draw_queued_plots) so matplotlib is only used by one thread
+_PLOT_QUEUE = threading.local()
+
+# ---------------------------------
+# FUNCTIONS - PLOT QUEUE
+# ---------------------------------
+
+
+def queued_plot(plot_func):
+    """Decorator for plotting functions - queues the plot if the current thread has a plot queue
+    (set_plot_queue) and plots it immediately otherwise
+    """
+
+    @functools.wraps(plot_func)
+    def plot_or_queue(*args, **kwargs):
+        plot_queue = getattr(_PLOT_QUEUE, "queue", None)
+
+        if plot_queue is None:
+            result = plot_func(*args, **kwargs)
+
+            # figures that are never shown are closed once saved so they do not build up
+            if matplotlib.get_backend().lower() == "agg":
+                plt.close("all")
+
+            return result
+
+        # the decorated function is queued (it can be pickled by name for worker processes)
+        plot_queue.put((plot_or_queue, args, kwargs))
+        return None
+
+    return plot_or_queue
+
+
+def set_plot_queue(plot_queue):
+    """Sets the plot queue of the current thread (None to plot immediately)"""
+
+    _PLOT_QUEUE.queue = plot_queue
+
+
+def set_headless_figures():
+    """Figures are saved (SAVE_FIG) without being shown so plots never wait for a figure window to close"""
+
+    matplotlib.use("Agg")
+
+
+def draw_queued_plots(plot_queue, timeout=None):
+    """Draws every plot in the queue
+    Waits up to timeout (s) for a plot if the queue is empty (None does not wait)
+
+    Returns the number of plots drawn
+    """
+
+    num_plots = 0
+
+    try:
+        plot = plot_queue.get(timeout=timeout) if timeout is not None else plot_queue.get_nowait()
+        while True:
+            plot_func, args, kwargs = plot
+            plot_func(*args, **kwargs)
+            num_plots += 1
+            plot = plot_queue.get_nowait()
+    except queue.Empty:
+        pass
+
+    return num_plots
+
 # ---------------------------------
 # FUNCTIONS - COMPARE RESULTS
 # ---------------------------------
@@ -169,21 +244,16 @@ def plot_modal_variation_with_airspeed_3D(results, altitude, airspeed_values, ti
 
     max_freq = 12
 
-    f_big = []
-    Gxx_big = []
-    airspeed_big = []
-
     altitude_str = "_" + str(altitude) + "K"
 
-    for airspeed in airspeed_values:
-        f, Gxx = get_freq_variation_with_airspeed(results, altitude, airspeed, max_freq)
+    f, airspeed_found, Gxx_matrix = get_psd_matrix(results, altitude, airspeed_values, max_freq)
 
-        if len(f) > 0:
-            airspeed_list = [airspeed]*len(f)
-            f_big.extend(f)
-            airspeed_big.extend(airspeed_list)
-            Gxx_big.extend(Gxx)
-            ax.plot(f, airspeed_list, Gxx)
+    for idx_airspeed, airspeed in enumerate(airspeed_found):
+        ax.plot(f, [airspeed]*len(f), Gxx_matrix[idx_airspeed])
+
+    f_big = np.tile(f, len(airspeed_found))
+    airspeed_big = np.repeat(airspeed_found, len(f))
+    Gxx_big = Gxx_matrix.ravel()
 
     ax.set_ylim(min(airspeed_values), max(airspeed_values))
     ax.set_xlim(0, max_freq)
@@ -251,6 +321,37 @@ def get_freq_variation_with_airspeed(results, altitude, airspeed, max_freq):
     return f, Gxx
 
 
+def get_psd_matrix(results, altitude, airspeed_values, max_freq):
+    """Returns the PSD of each airspeed (with results) at an altitude as a matrix
+
+    Returns:
+    - f = frequencies up to max_freq shared by all rows (from the first airspeed found)
+    - airspeed_found = airspeeds with results (one per row)
+    - Gxx_matrix = PSD with one row per airspeed (interpolated onto f if the frequencies differ)
+    """
+
+    f_shared = None
+    airspeed_found = []
+    Gxx_rows = []
+
+    for airspeed in airspeed_values:
+        f, Gxx = get_freq_variation_with_airspeed(results, altitude, airspeed, max_freq)
+
+        if len(f) > 0:
+            if f_shared is None:
+                f_shared = np.asarray(f)
+            elif len(f) != len(f_shared) or np.any(f != f_shared):
+                Gxx = np.interp(f_shared, f, Gxx)
+
+            airspeed_found.append(airspeed)
+            Gxx_rows.append(Gxx)
+
+    if f_shared is None:
+        return np.array([]), airspeed_found, np.zeros((0, 0))
+
+    return f_shared, airspeed_found, np.vstack(Gxx_rows)
+
+
 def get_damping_variation_with_airspeed(results, altitude, modal_freq_idx):
 
     damping_ratio = []
@@ -345,6 +446,7 @@ def plot_histogram(data):
     plt.show()
 
 
+@queued_plot
 def welch_plot(f, Gxx, f_max, Gxx_max, title=None, subtitle=None):
     """Plots the frequency domain of the signal"""
     # TODO - make this handle maximum values nicer
@@ -378,6 +480,7 @@ def welch_plot(f, Gxx, f_max, Gxx_max, title=None, subtitle=None):
         fig.savefig(cfg.IMAGE_FILE_ROOT + cfg_analysis.ANALYSIS_FILE_ROOT + title + "_FREQ" + ".png")
 
 
+@queued_plot
 def plot_acc(data, time, title=None, peaks_idx=None, fileref=None,
              subtitle=None, limits=None, save_image=True, filtered_image=False):
     """plots time varying data using Matplotlib"""
@@ -438,11 +541,109 @@ def plot_atmosphere(altitude, time, temperature=None, fig=None, fileref=None):
     return None
 
 
+# ---------------------------------
+# FUNCTIONS - SPECTROGRAM
+# ---------------------------------
+
+
+def plot_spectrogram(f, time, Sxx, title=None, time_ranges=None, airspeeds=None):
+    """Plots a spectrogram (frames x frequencies) downsampled to SPECTROGRAM_PLOT_SIZE
+    Test points (time_ranges) are marked and labelled with their airspeed
+
+    Sxx can be memory mapped - it is read in blocks so it is never loaded in full
+    """
+
+    max_times, max_freqs = cfg.SPECTROGRAM_PLOT_SIZE
+
+    time_plot, Sxx_plot = downsample_spectrogram(time, Sxx, max_times)
+    f_plot, Sxx_plot = downsample_spectrogram(f, Sxx_plot.T, max_freqs)
+
+    fig, ax = plt.subplots()
+
+    with np.errstate(divide="ignore"):
+        mesh = ax.pcolormesh(time_plot, f_plot, 10*np.log10(Sxx_plot), shading="auto", cmap="plasma")
+    fig.colorbar(mesh, ax=ax, label="PSD (dB)")
+
+    if time_ranges is not None:
+        for idx_range, time_range in enumerate(time_ranges):
+            if time_range == 0:
+                continue
+            ax.axvspan(time_range[0], time_range[1], color="white", alpha=0.15)
+            if airspeeds is not None and airspeeds[idx_range] is not None:
+                ax.annotate(str(airspeeds[idx_range]), (time_range[0], f_plot[-1]), color="white",
+                            textcoords="offset points", xytext=(2, -12))
+
+    plt.ylabel("Frequency (Hz)")
+    plt.xlabel("Time (s)")
+
+    if title is None:
+        plt.suptitle("Spectrogram", fontsize=20, y=1)
+    else:
+        plt.suptitle("Spectrogram of " + title, fontsize=20, y=1)
+
+    fig.set_size_inches(cfg.FIGURE_WIDTH, cfg.FIGURE_HEIGHT)
+    plt.show()
+
+    if cfg.SAVE_FIG:
+        fig.savefig(cfg.IMAGE_FILE_ROOT + cfg_analysis.ANALYSIS_FILE_ROOT + cfg_analysis.ACC_BASIS_STR +
+                    "_SPECTROGRAM_" + str(title) + ".png")
+
+    return fig, ax
+
+
+def downsample_spectrogram(axis_values, Sxx, max_rows):
+    """Averages groups of rows of Sxx so there are at most max_rows
+    Rows are read a block at a time so Sxx can be a memory map larger than memory
+
+    Returns the axis value at the centre of each group and the downsampled Sxx
+    """
+
+    num_rows = len(axis_values)
+    group_size = max(-(-num_rows//max_rows), 1)
+
+    if group_size == 1:
+        return np.asarray(axis_values), np.asarray(Sxx)
+
+    group_starts = np.arange(0, num_rows, group_size)
+    Sxx_downsampled = np.empty((len(group_starts),) + Sxx.shape[1:], dtype=np.float64)
+
+    # whole groups read at a time
+    block_rows = group_size*max(cfg.SPECTROGRAM_BLOCK_FRAMES//group_size, 1)
+    for row_start in range(0, num_rows, block_rows):
+        block = np.asarray(Sxx[row_start:row_start + block_rows], dtype=np.float64)
+        group_sums = np.add.reduceat(block, np.arange(0, len(block), group_size), axis=0)
+        group_sizes = np.minimum(group_size, len(block) - np.arange(0, len(block), group_size))
+        Sxx_downsampled[row_start//group_size:row_start//group_size + len(group_sums)] = \
+            group_sums/group_sizes.reshape((-1,) + (1,)*(block.ndim - 1))
+
+    axis_downsampled = np.add.reduceat(np.asarray(axis_values, dtype=np.float64), group_starts)
+    axis_downsampled /= np.minimum(group_size, num_rows - group_starts)
+
+    return axis_downsampled, Sxx_downsampled
+
 # ---------------------------------
 # FUNCTIONS - CSV
 # ---------------------------------
 
 
+def save_test_point_table(test_points, filepath):
+    """Saves detected test points (one row each) to a csv that can be used as TEST_POINT_TABLE
+    Empty airspeeds and altitudes can be filled in before the analysis is run
+    """
+
+    print(f"Saving test point table to {filepath}")
+
+    with open(filepath, mode='w', newline='') as csv_file:
+        csv_writer = csv.DictWriter(csv_file, fieldnames=TEST_POINT_TABLE_COLUMNS, extrasaction='ignore')
+        csv_writer.writeheader()
+        for test_point in test_points:
+            csv_writer.writerow({key: ("" if value is None else value) for key, value in test_point.items()})
+
+    print("Test point table saved.")
+
+    return 1
+
+
 def save_csv_output(data, filename):
     """Saves the data out as a csv
     saves in rows instead of columns as easier to work with
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""flutter_spectrogram
+
+Short-time power spectral density (spectrogram) of entire recordings in memory mapped files.
+
+Frames are the PSD of half overlapping BIN_SIZE segments (as the segments of Welch's method)
+and are stored as a frames x frequencies matrix in a raw file with the frame times in a second
+file. A json file records the settings and the number of frames completed. update_spectrogram
+only calculates frames that are not already stored, so an interrupted run carries on from the
+last completed block and a recording that has grown is appended to. Frames are calculated and
+written in blocks so memory use does not depend on the length of the recording.
+
+  Typical usage example:
+
+  spectrogram_path = update_spectrogram(acc_data, "flight_1.csv")
+  f, time, Sxx = load_spectrogram(spectrogram_path)
+"""
+
+# ---------------------------------
+# IMPORTS
+# ---------------------------------
+
+import json
+import numpy as np
+import os
+
+import flutter_config as cfg
+from flutter_config import cfg_analysis
+
+from flutter_analysis import _segment_psd, _welch_segments
+from flutter_other import samples_at_samp_rate
+
+# ---------------------------------
+# CONSTANTS
+# ---------------------------------
+
+# increment when the frame calculation changes so old spectrograms are recalculated
+SPECTROGRAM_VERSION = 1
+
+# stored precision of the PSD (frame times are float64)
+SPECTROGRAM_DTYPE = np.float32
+
+# ---------------------------------
+# FUNCTIONS
+# ---------------------------------
+
+
+def update_spectrogram(acc_data, filename):
+    """Calculates the spectrogram frames of acc_data (the whole record) that are not already stored
+
+    Frames are recalculated from the start if the settings have changed or the stored frames do not
+    match acc_data (a different recording with the same name).
+
+    Returns the spectrogram path (for load_spectrogram)
+    """
+
+    nperseg = samples_at_samp_rate(cfg_analysis.BIN_SIZE)
+    step = nperseg - nperseg//2
+    samp_rate = cfg_analysis.SAMP_RATE
+
+    f = np.fft.rfftfreq(nperseg, 1/samp_rate)
+    num_freq = len(f)
+    if cfg.SPECTROGRAM_MAX_FREQ is not None:
+        num_freq = int(np.searchsorted(f, cfg.SPECTROGRAM_MAX_FREQ, side="right"))
+
+    settings = {"version": SPECTROGRAM_VERSION, "nperseg": nperseg, "step": step, "samp_rate": samp_rate,
+                "num_freq": num_freq, "source": filename}
+
+    spectrogram_path = _spectrogram_path(filename)
+    time = acc_data[:, cfg.COL_TIME]
+
+    num_frames = max((len(acc_data) - nperseg)//step + 1, 0)
+    num_frames_done = _frames_done(spectrogram_path, settings, time)
+
+    if num_frames_done >= num_frames:
+        if cfg.SHOW_DETAIL:
+            print(f"Spectrogram of {filename} is up to date ({num_frames_done} frames)")
+        return spectrogram_path
+
+    print(f"Calculating spectrogram frames {num_frames_done} to {num_frames} of {filename}...")
+
+    Sxx = _open_memmap(spectrogram_path + ".dat", (num_frames, num_freq), SPECTROGRAM_DTYPE)
+    time_frames = _open_memmap(spectrogram_path + ".time.dat", (num_frames,), np.float64)
+
+    for frame_start in range(num_frames_done, num_frames, cfg.SPECTROGRAM_BLOCK_FRAMES):
+        frame_end = min(frame_start + cfg.SPECTROGRAM_BLOCK_FRAMES, num_frames)
+
+        idx_start = frame_start*step
+        idx_end = (frame_end - 1)*step + nperseg
+
+        segments, _, scale = _welch_segments([acc_data[:, cfg.COL_SIGNAL][idx_start:idx_end]], nperseg, samp_rate)
+
+        Sxx[frame_start:frame_end] = _segment_psd(segments, scale)[:, :num_freq]
+        # time at the centre of each frame
+        time_frames[frame_start:frame_end] = time[idx_start + nperseg//2:idx_end:step][:frame_end - frame_start]
+
+        # frames are only recorded as done once written
+        Sxx.flush()
+        time_frames.flush()
+        _write_info(spectrogram_path, settings, frame_end)
+
+    return spectrogram_path
+
+
+def load_spectrogram(spectrogram_path):
+    """Returns the frequencies, frame times and (read only memory mapped) PSD of a stored spectrogram"""
+
+    with open(spectrogram_path + ".json") as info_file:
+        info = json.load(info_file)
+
+    settings = info["settings"]
+    num_frames = info["num_frames"]
+
+    f = np.fft.rfftfreq(settings["nperseg"], 1/settings["samp_rate"])[:settings["num_freq"]]
+
+    if num_frames == 0:
+        return f, np.zeros(0), np.zeros((0, settings["num_freq"]), dtype=SPECTROGRAM_DTYPE)
+
+    # files can be longer than the completed frames if a run was interrupted
+    Sxx = np.memmap(spectrogram_path + ".dat", dtype=SPECTROGRAM_DTYPE, mode="r")
+    Sxx = Sxx[:num_frames*settings["num_freq"]].reshape(num_frames, settings["num_freq"])
+    time_frames = np.memmap(spectrogram_path + ".time.dat", dtype=np.float64, mode="r")[:num_frames]
+
+    return f, time_frames, Sxx
+
+
+def _frames_done(spectrogram_path, settings, time):
+    """Returns the number of stored frames that can be reused for a recording"""
+
+    try:
+        with open(spectrogram_path + ".json") as info_file:
+            info = json.load(info_file)
+    except (OSError, ValueError):
+        return 0
+
+    if info["settings"] != settings or info["num_frames"] == 0:
+        return 0
+
+    # last stored frame must be at the same time in the recording
+    num_frames_done = info["num_frames"]
+    idx_last = (num_frames_done - 1)*settings["step"] + settings["nperseg"]//2
+
+    try:
+        time_frames = np.memmap(spectrogram_path + ".time.dat", dtype=np.float64, mode="r")
+        if idx_last >= len(time) or time_frames[num_frames_done - 1] != time[idx_last]:
+            print(f"WARNING - stored spectrogram does not match {settings['source']}, recalculating")
+            return 0
+    except (OSError, ValueError, IndexError):
+        return 0
+
+    return num_frames_done
+
+
+def _open_memmap(filepath, shape, dtype):
+    """Opens a raw file as a memory map of shape, extending it (keeping its contents) if required"""
+
+    size = int(np.prod(shape))*np.dtype(dtype).itemsize
+
+    with open(filepath, "ab") as raw_file:
+        if os.path.getsize(filepath) < size:
+            raw_file.truncate(size)
+
+    return np.memmap(filepath, dtype=dtype, mode="r+", shape=shape)
+
+
+def _write_info(spectrogram_path, settings, num_frames):
+    """Records the settings and number of completed frames of a spectrogram"""
+
+    info_path_tmp = spectrogram_path + ".json.tmp"
+    with open(info_path_tmp, "w") as info_file:
+        json.dump({"settings": settings, "num_frames": num_frames}, info_file)
+    os.replace(info_path_tmp, spectrogram_path + ".json")
+
+
+def _spectrogram_path(filename):
+    """Returns the spectrogram path (without extension) for a raw file, creating the directory if required"""
+
+    dirname = os.path.dirname(__file__)
+    spectrogram_directory = os.path.join(dirname, cfg.SPECTROGRAM_FILE_ROOT)
+    os.makedirs(spectrogram_directory, exist_ok=True)
+
+    name = os.path.splitext(filename.replace("/", "_").replace("\\", "_"))[0]
+
+    return os.path.join(spectrogram_directory, name)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Test setup
+
+Dataset config files (/config) are not kept in the repository, so a minimal analysis config is
+registered in place of the one loaded by flutter_config when it is not present. Tests set any
+other fields they need with monkeypatch.
+"""
+
+import importlib.util
+import os
+import re
+import sys
+import types
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEST_CONFIG = {"DATA_FORMAT": 0,
+               "SAMP_RATE": 1000,
+               "TIMESTEP": 0.001,
+               "FREQ_LOWPASS": 50,
+               "OFFSET": 0,
+               "BIN_SIZE": 1024,
+               "NUM_HEADER_ROWS": 1,
+               "COL_IDX_MEASURE": 0,
+               "COL_TIME_MEASURE": 1,
+               "COL_SIGNAL_MEASURE": 2,
+               "COL_PRESSURE_MEASURE": 3,
+               "COL_TEMP_MEASURE": 4,
+               "CALIBRATION": 1,
+               "ACC_BASIS_STR": "TEST",
+               "CSV_FILE": [],
+               "CSV_FILE_ATMOS": []}
+
+
+def _register_test_config():
+    """Registers TEST_CONFIG as the analysis config module loaded by flutter_config"""
+
+    with open(os.path.join(ROOT, "flutter_config.py")) as config_file:
+        config_name = re.search(r"^from config import (\w+) as cfg_analysis", config_file.read(), re.MULTILINE)[1]
+
+    if importlib.util.find_spec("config") is not None:
+        return
+
+    config_package = types.ModuleType("config")
+    config_package.__path__ = []
+    config_module = types.ModuleType(f"config.{config_name}")
+    config_module.__dict__.update(TEST_CONFIG)
+    setattr(config_package, config_name, config_module)
+
+    sys.modules["config"] = config_package
+    sys.modules[f"config.{config_name}"] = config_module
+
+
+_register_test_config()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Writes the small .IDE fixture recording and its csv exports used by test_endaq_ide
+
+The recording is synthetic (written from the EBML element layout read by endaq_ide) so the csv
+exports hold exactly the calibrated values and sample times of the recording. Both channels are
+timed from one 32.768kHz tick counter and the csv times are seconds since the earliest sample of
+either channel (as exported by enDAQ lab):
+- channel 8 = three axis accelerometer ("<hhh", 1024Hz) in SimpleChannelDataBlock elements
+  with the 16 bit timestamps wrapping
+- channel 36 = pressure (raw counts) and temperature (degC) ("<If", 8Hz) in ChannelDataBlock
+  elements with the 24 bit timestamps wrapping
+
+Run from this folder to regenerate the fixtures:
+
+  python make_ide_fixture.py
+"""
+
+import numpy as np
+
+FILE_ROOT = "ide_fixture"
+
+CHANNEL_ACC = 8
+CHANNEL_ATMOS = 36
+
+# calibration polynomials (highest power first) from recorded values to g and Pa
+CAL_ACC = [0.004, 0.01]
+CAL_PRESSURE = [2.0, 0.0]
+
+TICKS_PER_SECOND = 32768
+
+SAMP_RATE_ACC = 1024
+BLOCK_SAMPLES_ACC = 128
+NUM_BLOCKS_ACC = 6
+# ticks of the shared counter (the accelerometer starts first and the atmospheric channel
+# ATMOS_OFFSET_TICKS later, with the 24 bit timestamps wrapping between them)
+START_TICKS_ACC = 2**24 - 20000
+ATMOS_OFFSET_TICKS = 6000
+
+SAMP_RATE_ATMOS = 8
+BLOCK_SAMPLES_ATMOS = 4
+NUM_BLOCKS_ATMOS = 5
+START_TICKS_ATMOS = START_TICKS_ACC + ATMOS_OFFSET_TICKS
+
+
+def element(element_id, data):
+    """EBML element (ID with its length marker, size and data)"""
+
+    size = len(data)
+    length = 1
+    while size >= (1 << (7*length)) - 1:
+        length += 1
+
+    return element_id.to_bytes((element_id.bit_length() + 7)//8, "big") + \
+        ((1 << (7*length)) | size).to_bytes(length, "big") + data
+
+
+def uint(value):
+    """Big endian unsigned integer element data"""
+
+    return value.to_bytes(max((value.bit_length() + 7)//8, 1), "big")
+
+
+def make_fixture():
+
+    num_acc = NUM_BLOCKS_ACC*BLOCK_SAMPLES_ACC
+    num_atmos = NUM_BLOCKS_ATMOS*BLOCK_SAMPLES_ATMOS
+
+    # absolute ticks (not wrapped) so the csv times do not depend on how the reader aligns channels
+    start_ticks = min(START_TICKS_ACC, START_TICKS_ATMOS)
+
+    time_acc = (START_TICKS_ACC - start_ticks)/TICKS_PER_SECOND + np.arange(num_acc)/SAMP_RATE_ACC
+    acc_raw = np.stack([np.round(1000*np.sin(2*np.pi*(5 + idx)*time_acc)) for idx in range(3)], axis=1)
+    acc_raw = acc_raw.astype("<i2")
+
+    time_atmos = (START_TICKS_ATMOS - start_ticks)/TICKS_PER_SECOND + np.arange(num_atmos)/SAMP_RATE_ATMOS
+    atmos_raw = np.zeros(num_atmos, dtype=[("pressure", "<u4"), ("temp", "<f4")])
+    atmos_raw["pressure"] = 45000 - 10*np.arange(num_atmos)
+    atmos_raw["temp"] = 20 - 0.25*np.arange(num_atmos)
+
+    blocks = []
+
+    for idx_block in range(NUM_BLOCKS_ACC):
+        ticks = START_TICKS_ACC + idx_block*BLOCK_SAMPLES_ACC*TICKS_PER_SECOND//SAMP_RATE_ACC
+        header = np.array([(ticks % 2**16, CHANNEL_ACC)], dtype=[("timecode", ">u2"), ("channel_id", "u1")])
+        payload = acc_raw[idx_block*BLOCK_SAMPLES_ACC:(idx_block + 1)*BLOCK_SAMPLES_ACC].tobytes()
+        blocks.append((time_acc[idx_block*BLOCK_SAMPLES_ACC], element(0xAC, header.tobytes() + payload)))
+
+    for idx_block in range(NUM_BLOCKS_ATMOS):
+        ticks = START_TICKS_ATMOS + idx_block*BLOCK_SAMPLES_ATMOS*TICKS_PER_SECOND//SAMP_RATE_ATMOS
+        payload = atmos_raw[idx_block*BLOCK_SAMPLES_ATMOS:(idx_block + 1)*BLOCK_SAMPLES_ATMOS].tobytes()
+        blocks.append((time_atmos[idx_block*BLOCK_SAMPLES_ATMOS],
+                       element(0xA1, element(0xB0, uint(CHANNEL_ATMOS)) + element(0xB4, uint(ticks % 2**24)) +
+                               element(0xB2, payload))))
+
+    # blocks of both channels in time order
+    blocks.sort(key=lambda block: block[0])
+
+    with open(FILE_ROOT + ".IDE", "wb") as ide_file:
+        ide_file.write(element(0x1A45DFA3, element(0x4282, b"mide")))
+        for _, block in blocks:
+            ide_file.write(block)
+
+    # csv exports (time first as exported by enDAQ lab)
+    acc = np.polyval(CAL_ACC, acc_raw.astype(np.float64))
+    np.savetxt(FILE_ROOT + "_acc.csv", np.column_stack([time_acc, acc]), delimiter=",", fmt="%.10g",
+               header="Time (s),X (g),Y (g),Z (g)", comments="")
+
+    pressure = np.polyval(CAL_PRESSURE, atmos_raw["pressure"].astype(np.float64))
+    np.savetxt(FILE_ROOT + "_atmos.csv", np.column_stack([time_atmos, pressure, atmos_raw["temp"]]),
+               delimiter=",", fmt="%.10g", header="Time (s),Pressure (Pa),Temperature (C)", comments="")
+
+
+if __name__ == "__main__":
+    make_fixture()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Tests of flutter_analysis against reference implementations (flutter_benchmark and scipy)"""
+
+import numpy as np
+import pytest
+from scipy import signal
+
+import flutter_config as cfg
+from flutter_config import cfg_analysis
+import flutter_analysis
+from flutter_benchmark import window_indices_where
+from flutter_input import make_acc_data
+
+SAMP_RATE = 1000
+
+
+@pytest.fixture
+def analysis_config(monkeypatch):
+
+    monkeypatch.setattr(cfg_analysis, "SAMP_RATE", SAMP_RATE)
+    monkeypatch.setattr(cfg_analysis, "TIMESTEP", 1/SAMP_RATE)
+    monkeypatch.setattr(cfg_analysis, "BIN_SIZE", 256)
+    monkeypatch.setattr(cfg_analysis, "DATA_FORMAT", 1)
+    monkeypatch.setattr(cfg_analysis, "OFFSET", 0.5)
+    monkeypatch.setattr(cfg, "DAMPING_PEAK_HEIGHT", 0.25)
+    monkeypatch.setattr(cfg, "DAMPING_PEAK_DISTANCE", 20)
+    monkeypatch.setattr(cfg, "DAMPING_PEAK_POLICY", "max_to_last")
+    monkeypatch.setattr(cfg, "DAMPING_CONFIDENCE", 0.95)
+
+
+def _decay(damp_ratio, freq=5, duration=5):
+    """Free decay of a single mode"""
+
+    time = np.arange(int(duration*SAMP_RATE))/SAMP_RATE
+    freq_damped = freq*np.sqrt(1 - damp_ratio**2)
+
+    return np.exp(-damp_ratio*2*np.pi*freq*time)*np.cos(2*np.pi*freq_damped*time)
+
+
+def test_window_indices_matches_where(analysis_config):
+    """Boundaries from searchsorted match np.where over the time column for each range"""
+
+    # irregular sample times
+    time = np.cumsum(np.random.default_rng(0).uniform(0.5e-3, 1.5e-3, 20000))
+    acc_data = make_acc_data(np.arange(len(time)), time, np.zeros(len(time)))
+
+    time_ranges = [[1, 2], 0, [2.0005, 3.25], [0.1, 19], [time[100], time[200]]]
+
+    idx_starts, idx_ends = flutter_analysis.window_indices(acc_data, time_ranges)
+    idx_starts_ref, idx_ends_ref = window_indices_where(acc_data, time_ranges)
+
+    np.testing.assert_array_equal(idx_starts, idx_starts_ref)
+    np.testing.assert_array_equal(idx_ends, idx_ends_ref)
+
+
+def test_window_indices_outside_record(analysis_config):
+
+    acc_data = make_acc_data(np.arange(1000), np.arange(1000)/SAMP_RATE, np.zeros(1000))
+
+    with pytest.raises(SystemExit):
+        flutter_analysis.window_indices(acc_data, [[5, 6]])
+
+
+@pytest.mark.parametrize("nperseg", [None, 100, 255])
+def test_welch_batch_matches_welch(analysis_config, nperseg):
+    """Each row of the batched PSD matches signal.welch of that window"""
+
+    rng = np.random.default_rng(0)
+    windows = [rng.standard_normal(num_samples) + 1 for num_samples in (256, 1000, 4321)]
+
+    f, Gxx = flutter_analysis.welch_batch(windows, SAMP_RATE, nperseg)
+
+    nperseg_ref = cfg_analysis.BIN_SIZE if nperseg is None else nperseg
+    for idx_window, window in enumerate(windows):
+        f_ref, Gxx_ref = signal.welch(window, SAMP_RATE, window="hann", nperseg=nperseg_ref,
+                                      noverlap=nperseg_ref//2, detrend="constant", scaling="density")
+
+        np.testing.assert_allclose(f, f_ref)
+        np.testing.assert_allclose(Gxx[idx_window], Gxx_ref, rtol=1e-9, atol=1e-15)
+
+
+def test_log_dec_lstsq_matches_polyfit(analysis_config):
+    """Least squares damping matches a polynomial fit of log(peak amplitude) against cycles"""
+
+    rng = np.random.default_rng(0)
+    data_bank = np.vstack([_decay(0.02), _decay(0.05) + 0.01*rng.standard_normal(5*SAMP_RATE)])
+
+    damp_ratio, damp_ratio_ci, residual, diagnostics = flutter_analysis.calc_damping_ratio_log_dec_lstsq(data_bank)
+
+    assert diagnostics == [flutter_analysis.DAMPING_OK]*2
+
+    for idx_band, data in enumerate(data_bank):
+        peaks, _ = flutter_analysis._log_dec_peaks(data)
+        slope, intercept = np.polyfit(np.arange(len(peaks)), np.log(peaks), 1)
+        log_dec = -slope
+
+        assert damp_ratio[idx_band] == pytest.approx(log_dec/np.sqrt(4*np.pi**2 + log_dec**2), rel=1e-9)
+        assert damp_ratio_ci[idx_band, 0] <= damp_ratio[idx_band] <= damp_ratio_ci[idx_band, 1]
+
+        fit_error = np.log(peaks) - (slope*np.arange(len(peaks)) + intercept)
+        assert residual[idx_band] == pytest.approx(np.sqrt(np.mean(fit_error**2)), rel=1e-6, abs=1e-12)
+
+    # exact exponential decay
+    assert damp_ratio[0] == pytest.approx(0.02, rel=1e-3)
+
+
+def test_log_dec_diagnostics(analysis_config, monkeypatch):
+    """Bands that cannot be fitted return nan with their diagnostic code"""
+
+    growing = _decay(-0.02)
+    single_peak = np.concatenate([np.zeros(500), np.hanning(200), np.zeros(500)])
+    invalid = _decay(0.02)
+    invalid[10] = np.nan
+
+    data_bank = [_decay(0.02), np.zeros(1000), invalid, single_peak, growing]
+
+    damp_ratio, _, _, diagnostics = flutter_analysis.calc_damping_ratio_log_dec_lstsq(data_bank)
+
+    assert diagnostics == [flutter_analysis.DAMPING_OK, flutter_analysis.DAMPING_TOO_FEW_PEAKS,
+                           flutter_analysis.DAMPING_INVALID_DATA, flutter_analysis.DAMPING_TOO_FEW_PEAKS,
+                           flutter_analysis.DAMPING_NO_CYCLES]
+    assert np.isfinite(damp_ratio[0])
+    assert np.all(np.isnan(damp_ratio[1:]))
+
+    # every peak of a growing oscillation is fitted with first_to_last
+    monkeypatch.setattr(cfg, "DAMPING_PEAK_POLICY", "first_to_last")
+
+    damp_ratio, _, _, diagnostics = flutter_analysis.calc_damping_ratio_log_dec_lstsq([growing])
+    assert diagnostics == [flutter_analysis.DAMPING_NO_DECAY]
+    assert np.isnan(damp_ratio[0])
+
+    assert flutter_analysis.calc_damping_ratio_log_dec_headless(growing) == \
+        (None, flutter_analysis.DAMPING_NO_DECAY)
+    assert flutter_analysis.calc_damping_ratio_log_dec_headless(np.array([])) == \
+        (None, flutter_analysis.DAMPING_INVALID_DATA)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Tests of the analysis of decimated data (DECIMATE_BANDWIDTH)"""
+
+import numpy as np
+import pytest
+
+import flutter_config as cfg
+from flutter_config import cfg_analysis
+import flutter_analysis
+import flutter_input
+from flutter_other import ColumnData
+
+SAMP_RATE = 1000
+FREQ_MODE = 5
+DAMP_RATIO = 0.02
+
+
+@pytest.fixture
+def decimation_config(monkeypatch):
+    """Recorded sample rate of 1000Hz decimated for a 20Hz bandwidth"""
+
+    monkeypatch.setattr(cfg_analysis, "SAMP_RATE", SAMP_RATE)
+    monkeypatch.setattr(cfg_analysis, "TIMESTEP", 1/SAMP_RATE)
+    monkeypatch.setattr(cfg_analysis, "BIN_SIZE", 1024)
+    monkeypatch.setattr(cfg, "DECIMATE_BANDWIDTH", 20)
+    monkeypatch.setattr(cfg, "SHOW_DETAIL", False)
+    monkeypatch.setattr(cfg, "DAMPING_PEAK_HEIGHT", 0.25)
+    monkeypatch.setattr(cfg, "DAMPING_PEAK_DISTANCE", 20)
+    monkeypatch.setattr(cfg, "DAMPING_PEAK_POLICY", "max_to_last")
+
+
+def _decimate(data):
+    """Decimates a signal as import_data_acc does (the sample rate is updated in cfg_analysis)"""
+
+    time = np.arange(len(data))/SAMP_RATE
+    acc_data = ColumnData([np.arange(len(data)), time, data, None])
+    acc_data, _ = flutter_input.decimate_acc_data(acc_data, [slice(0, len(data))])
+
+    return acc_data[:, cfg.COL_SIGNAL]
+
+
+def test_damping_unchanged_by_decimation(decimation_config):
+    """Logarithmic decrement of a decaying mode is the same with and without decimation"""
+
+    time = np.arange(10*SAMP_RATE)/SAMP_RATE
+    freq_damped = FREQ_MODE*np.sqrt(1 - DAMP_RATIO**2)
+    data = np.exp(-DAMP_RATIO*2*np.pi*FREQ_MODE*time)*np.cos(2*np.pi*freq_damped*time)
+
+    # the first second is skipped as the decimation filter rings at the start of the record
+    damp_ratio, diagnostic = flutter_analysis.calc_damping_ratio_log_dec_headless(data[SAMP_RATE:])
+    assert diagnostic == flutter_analysis.DAMPING_OK
+
+    data_decimated = _decimate(data)
+    assert cfg_analysis.SAMP_RATE < SAMP_RATE
+
+    samp_rate_decimated = int(cfg_analysis.SAMP_RATE)
+    damp_ratio_decimated, diagnostic = \
+        flutter_analysis.calc_damping_ratio_log_dec_headless(data_decimated[samp_rate_decimated:])
+    assert diagnostic == flutter_analysis.DAMPING_OK
+
+    assert damp_ratio == pytest.approx(DAMP_RATIO, rel=0.05)
+    assert damp_ratio_decimated == pytest.approx(damp_ratio, rel=0.05)
+
+
+def test_psd_unchanged_by_decimation(decimation_config):
+    """PSD frequency step and peak are the same with and without decimation"""
+
+    rng = np.random.default_rng(0)
+    time = np.arange(30*SAMP_RATE)/SAMP_RATE
+    data = np.sin(2*np.pi*FREQ_MODE*time) + 0.1*rng.standard_normal(len(time))
+
+    f, Gxx = flutter_analysis.welch_batch([data], SAMP_RATE)
+
+    data_decimated = _decimate(data)
+    f_decimated, Gxx_decimated = flutter_analysis.welch_batch([data_decimated], cfg_analysis.SAMP_RATE)
+
+    freq_step = f[1] - f[0]
+    assert f_decimated[1] - f_decimated[0] == pytest.approx(freq_step, rel=0.02)
+    assert abs(f_decimated[np.argmax(Gxx_decimated[0])] - f[np.argmax(Gxx[0])]) <= freq_step
+    assert np.max(Gxx_decimated) == pytest.approx(np.max(Gxx), rel=0.1)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Tests of reading .IDE recordings (endaq_ide and flutter_input.import_ide)
+
+The fixture recording and its csv exports are written by data/make_ide_fixture.py
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import flutter_config as cfg
+from flutter_config import cfg_analysis
+import flutter_input
+from endaq_ide import read_ide_channels
+
+DATA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data") + os.sep
+
+IDE_CONFIG = {"IDE_CHANNEL_ACC": 8,
+              "IDE_PARSER_ACC": "<hhh",
+              "IDE_CAL_ACC": [0.004, 0.01],
+              "IDE_CHANNEL_ATMOS": 36,
+              "IDE_PARSER_ATMOS": "<If",
+              "IDE_CAL_PRESSURE": [2.0, 0.0],
+              "IDE_CAL_TEMP": None}
+
+# the atmospheric channel starts 6000 ticks (of the 32.768kHz clock) after the accelerometer
+OFFSET_ATMOS = 6000/32768
+
+
+@pytest.fixture
+def ide_config(monkeypatch):
+    """Analysis config for the fixture recording"""
+
+    monkeypatch.setattr(cfg, "CSV_FILE_ROOT", DATA_ROOT)
+    for field, value in IDE_CONFIG.items():
+        monkeypatch.setattr(cfg_analysis, field, value, raising=False)
+    monkeypatch.setattr(cfg_analysis, "NUM_HEADER_ROWS", 1)
+
+    # subchannels of the recording
+    monkeypatch.setattr(cfg_analysis, "COL_SIGNAL_MEASURE", 0)
+    monkeypatch.setattr(cfg_analysis, "COL_PRESSURE_MEASURE", 0)
+    monkeypatch.setattr(cfg_analysis, "COL_TEMP_MEASURE", 1)
+
+
+def _import_csv(monkeypatch, filename, **columns):
+    """Imports a csv export of the fixture as a Slam Stick csv"""
+
+    monkeypatch.setattr(cfg_analysis, "COL_TIME_MEASURE", 0)
+    for field, value in columns.items():
+        monkeypatch.setattr(cfg_analysis, field, value)
+
+    read_acc = "COL_SIGNAL_MEASURE" in columns
+    acc_data, atmos_data = flutter_input.import_csv_slam_stick(filename, read_acc=read_acc, read_atmos=not read_acc)
+
+    return acc_data if read_acc else atmos_data
+
+
+def test_read_ide_channels_block_types():
+    """Both data block elements are decoded with their timestamps unwrapped"""
+
+    channels = read_ide_channels(DATA_ROOT + "ide_fixture.IDE", {8: "<hhh", 36: "<If"})
+
+    time_acc, data_acc = channels[8]
+    assert data_acc.shape == (768, 3)
+    np.testing.assert_allclose(time_acc, np.arange(768)/1024)
+
+    time_atmos, data_atmos = channels[36]
+    assert data_atmos.shape == (20, 2)
+    np.testing.assert_allclose(time_atmos, OFFSET_ATMOS + np.arange(20)/8)
+    np.testing.assert_array_equal(data_atmos[:, 0], 45000 - 10*np.arange(20))
+
+
+def test_read_ide_channels_offset():
+    """Channels keep their offset and share the time origin whichever channels are read"""
+
+    channels = read_ide_channels(DATA_ROOT + "ide_fixture.IDE", {8: "<hhh", 36: "<If"})
+    assert channels[36][0][0] - channels[8][0][0] == pytest.approx(OFFSET_ATMOS)
+
+    time_atmos, _ = read_ide_channels(DATA_ROOT + "ide_fixture.IDE", {36: "<If"})[36]
+    np.testing.assert_allclose(time_atmos, channels[36][0])
+
+
+@pytest.mark.parametrize("subchannel", [0, 1, 2])
+def test_import_ide_acc_matches_csv(monkeypatch, ide_config, subchannel):
+    """Calibrated acceleration and times match the csv export"""
+
+    monkeypatch.setattr(cfg_analysis, "COL_SIGNAL_MEASURE", subchannel)
+    acc_data, _ = flutter_input.import_ide("ide_fixture.IDE")
+
+    acc_data_csv = _import_csv(monkeypatch, "ide_fixture_acc.csv", COL_SIGNAL_MEASURE=subchannel + 1)
+
+    np.testing.assert_allclose(acc_data[:, cfg.COL_TIME], acc_data_csv[:, cfg.COL_TIME], atol=1e-9)
+    np.testing.assert_allclose(acc_data[:, cfg.COL_SIGNAL], acc_data_csv[:, cfg.COL_SIGNAL], rtol=1e-9, atol=1e-12)
+
+
+def test_import_ide_atmos_matches_csv(monkeypatch, ide_config):
+    """Calibrated pressure (Pa), temperature and pressure altitude match the csv export"""
+
+    _, atmos_data = flutter_input.import_ide("ide_fixture.IDE")
+
+    atmos_data_csv = _import_csv(monkeypatch, "ide_fixture_atmos.csv", COL_PRESSURE_MEASURE=1, COL_TEMP_MEASURE=2)
+
+    for col in (cfg.COL_TIME, cfg.COL_PRESSURE, cfg.COL_TEMP, cfg.COL_ALT):
+        np.testing.assert_allclose(atmos_data[:, col], atmos_data_csv[:, col], rtol=1e-9)
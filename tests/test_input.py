@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Tests of flutter_input"""
+
+import numpy as np
+import pytest
+
+import flutter_input
+from flutter_benchmark import convert_times_loop, make_time_strings
+
+
+def _write_endevco_csv(path, times):
+    """Writes an Endevco csv with the given time strings (sample index, time, signal)"""
+
+    with open(path, "w") as csv_file:
+        csv_file.write("Sample,Time,Signal\n")
+        for idx, time in enumerate(times):
+            csv_file.write(f"{idx},{time},{idx*0.1:.1f}\n")
+
+
+@pytest.mark.parametrize("suffix", ["AM", "PM"])
+def test_read_csv_endevco_fallback_chunk(tmp_path, capsys, suffix):
+    """A chunk parsed row by row (one digit month) joins the vectorised chunks either side of it"""
+
+    times = [f"28/01/2020 1:00:00.{ms:03d} {suffix}" for ms in range(4)]
+    times += [f"28/1/2020 1:00:00.{ms:03d} {suffix}" for ms in range(4, 6)]
+    times += [f"28/01/2020 1:00:00.{ms:03d} {suffix}" for ms in range(6, 10)]
+
+    path = tmp_path / "endevco.csv"
+    _write_endevco_csv(path, times)
+
+    sample_conv, time_conv, voltage_conv = flutter_input.read_csv_endevco(str(path), 0, 1, 2, 1, chunk_rows=2)
+
+    assert "parsing row by row" in capsys.readouterr().out
+    np.testing.assert_array_equal(sample_conv, np.arange(10))
+    np.testing.assert_allclose(time_conv, np.arange(10)*1e-3)
+    np.testing.assert_allclose(voltage_conv, np.arange(10)*0.1)
+
+
+@pytest.mark.parametrize("time_format, times", [
+    ("%d/%m/%Y %H:%M:%S.%f %p", ["28/11/2019 1:00:00.000 PM", "28/11/2019 12:00:00.500 AM",
+                                 "28/11/2019 12:30:00.500 PM", "28/11/2019 11:59:59.999 PM"]),
+    ("%M:%S.%f", ["42:36.335", "00:00.001"]),
+    ("%S.%f", ["36.335", "00.001"])])
+def test_parse_times_ms_loop_matches_vectorised(time_format, times):
+    """Row by row and vectorised time parsing have the same origin and 12 hour clock handling"""
+
+    times = np.array(times)
+
+    np.testing.assert_array_equal(flutter_input._parse_times_ms_loop(times, time_format),
+                                  flutter_input._parse_times_ms(times, time_format))
+
+
+@pytest.mark.parametrize("time_format", ["%d/%m/%Y %H:%M:%S.%f %p", "%M:%S.%f", "%S.%f"])
+def test_convert_times_matches_loop(time_format):
+    """Vectorised time conversion matches the row by row strptime conversion"""
+
+    # the loop does not unwrap times, so the times stay within the minute
+    time_str, time_expected = make_time_strings(5000, time_format)
+
+    time_conv = flutter_input._convert_times(time_str, time_format)
+
+    np.testing.assert_allclose(time_conv, convert_times_loop(time_str, time_format), atol=1e-9)
+    np.testing.assert_allclose(time_conv, time_expected, atol=1e-9)
+
+
+def test_convert_times_unwraps():
+    """Times past the minute are unwrapped (where the loop goes negative)"""
+
+    time_str, time_expected = make_time_strings(40000, "%S.%f")
+
+    np.testing.assert_allclose(flutter_input._convert_times(time_str, "%S.%f"), time_expected, atol=1e-9)
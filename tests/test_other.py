@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Tests of the filters and stationary checks of flutter_other against their reference implementations"""
+
+import numpy as np
+import pytest
+from scipy import signal
+
+import flutter_config as cfg
+from flutter_config import cfg_analysis
+import flutter_other
+from flutter_benchmark import stationary_check_autocorrelation_correlate
+
+SAMP_RATE = 1000
+
+
+@pytest.fixture
+def filter_config(monkeypatch):
+
+    monkeypatch.setattr(cfg_analysis, "SAMP_RATE", SAMP_RATE)
+    monkeypatch.setattr(cfg_analysis, "TIMESTEP", 1/SAMP_RATE)
+    monkeypatch.setattr(cfg, "FILTER_ORDER", 4)
+    monkeypatch.setattr(cfg, "AUTOCORR_MAX_LAG_TIME", None)
+
+
+def _test_signal(num_samples=5000):
+    """Two modes and noise"""
+
+    time = np.arange(num_samples)/SAMP_RATE
+    rng = np.random.default_rng(0)
+
+    return np.sin(2*np.pi*5*time) + 0.5*np.sin(2*np.pi*60*time) + 0.2*rng.standard_normal(num_samples)
+
+
+@pytest.mark.parametrize("freq, filter_type, freq_scipy", [
+    (50, "lowpass", 50/500),
+    (20, "high_pass", 20/500),
+    ([4, 6], "bandpass", [4/500, 6/500]),
+    ([55, 65], "bandstop", [55/500, 65/500])])
+def test_acc_filter_butter_matches_sosfiltfilt(filter_config, freq, filter_type, freq_scipy):
+    """Memoised design and zero phase filter match signal.butter and signal.sosfiltfilt"""
+
+    data = _test_signal()
+
+    sos = signal.butter(4, freq_scipy, filter_type.replace("_", ""), output="sos")
+    freq_design, filter_type_design = flutter_other._check_filter(freq, filter_type)
+    sos_design, _, _ = flutter_other.design_filter_butter(4, freq_design, filter_type_design, SAMP_RATE)
+
+    np.testing.assert_allclose(sos_design, sos)
+    np.testing.assert_allclose(flutter_other.acc_filter_butter(data, freq, filter_type),
+                               signal.sosfiltfilt(sos, data), rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize("freq, filter_type", [(600, "lowpass"), ([6, 4, 2], "bandpass"), (50, "notch")])
+def test_check_filter_invalid(filter_config, freq, filter_type):
+
+    with pytest.raises(SystemExit):
+        flutter_other._check_filter(freq, filter_type)
+
+
+def test_acc_filter_butter_bank_matches_bands(filter_config):
+    """Each row of the filter bank matches filtering that band alone"""
+
+    data = _test_signal()
+    freq_bands = [[4, 6], [50, 70], [4.5, 5.5]]
+
+    data_filter = flutter_other.acc_filter_butter_bank(data, freq_bands)
+
+    assert data_filter.shape == (len(freq_bands), len(data))
+    for idx_band, freq in enumerate(freq_bands):
+        np.testing.assert_allclose(data_filter[idx_band], flutter_other.acc_filter_butter(data, freq, "bandpass"),
+                                   rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize("block_size", [700, 1024, 4999])
+def test_acc_filter_butter_blocks_matches_whole(filter_config, block_size):
+    """Filtering in blocks matches filtering the whole record (also in place)"""
+
+    data = _test_signal()
+    data_filter = flutter_other.acc_filter_butter(data, 50, "lowpass")
+
+    np.testing.assert_allclose(flutter_other.acc_filter_butter_blocks(data, 50, "lowpass", block_size=block_size),
+                               data_filter, rtol=1e-9, atol=1e-12)
+
+    data_in_place = data.copy()
+    flutter_other.acc_filter_butter_blocks(data_in_place, 50, "lowpass", out=data_in_place, block_size=block_size)
+    np.testing.assert_allclose(data_in_place, data_filter, rtol=1e-9, atol=1e-12)
+
+
+def test_stationary_check_autocorrelation_matches_correlate(filter_config):
+    """FFT autocorrelation matches np.correlate for every lag"""
+
+    data = _test_signal(3001)
+
+    autocorr_norm, lag = flutter_other.stationary_check_autocorrelation(data)
+    autocorr_ref = stationary_check_autocorrelation_correlate(data)
+
+    assert autocorr_norm.shape == autocorr_ref.shape
+    assert len(lag) == autocorr_ref.shape[1]
+    np.testing.assert_allclose(autocorr_norm, autocorr_ref, atol=1e-10)
+
+
+def test_stationary_check_autocorrelation_max_lag(filter_config):
+    """Limited lags match the same lags of np.correlate (normalised over the lags calculated)"""
+
+    data = _test_signal(3001)
+
+    autocorr_norm, lag = flutter_other.stationary_check_autocorrelation(data, max_lag=100)
+    autocorr_ref = stationary_check_autocorrelation_correlate(data)[:, :100]
+
+    np.testing.assert_allclose(autocorr_norm, autocorr_ref/autocorr_ref.max(axis=1, keepdims=True), atol=1e-10)
+    np.testing.assert_allclose(lag, np.arange(100)/SAMP_RATE)
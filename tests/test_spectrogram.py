@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Tests of flutter_spectrogram against signal.spectrogram"""
+
+import numpy as np
+import pytest
+from scipy import signal
+
+import flutter_config as cfg
+from flutter_config import cfg_analysis
+import flutter_spectrogram
+from flutter_input import make_acc_data
+
+SAMP_RATE = 1000
+NPERSEG = 256
+
+
+@pytest.fixture
+def spectrogram_config(monkeypatch, tmp_path):
+
+    monkeypatch.setattr(cfg_analysis, "SAMP_RATE", SAMP_RATE)
+    monkeypatch.setattr(cfg_analysis, "BIN_SIZE", NPERSEG)
+    monkeypatch.setattr(cfg, "SPECTROGRAM_FILE_ROOT", str(tmp_path))
+    monkeypatch.setattr(cfg, "SPECTROGRAM_MAX_FREQ", None)
+    monkeypatch.setattr(cfg, "SPECTROGRAM_BLOCK_FRAMES", 7)
+    monkeypatch.setattr(cfg, "SHOW_DETAIL", False)
+
+
+def _acc_data(num_samples):
+
+    time = np.arange(num_samples)/SAMP_RATE
+    data = np.sin(2*np.pi*(5 + 10*time)*time) + 0.1*np.random.default_rng(0).standard_normal(num_samples)
+
+    return make_acc_data(np.arange(num_samples), time, data)
+
+
+def _spectrogram_ref(acc_data):
+
+    return signal.spectrogram(acc_data[:, cfg.COL_SIGNAL], SAMP_RATE, window="hann", nperseg=NPERSEG,
+                              noverlap=NPERSEG//2, detrend="constant", scaling="density", mode="psd")
+
+
+def test_spectrogram_matches_scipy(spectrogram_config):
+    """Frames calculated in blocks match signal.spectrogram"""
+
+    acc_data = _acc_data(10000)
+
+    f, time_frames, Sxx = flutter_spectrogram.load_spectrogram(
+        flutter_spectrogram.update_spectrogram(acc_data, "record.csv"))
+    f_ref, time_ref, Sxx_ref = _spectrogram_ref(acc_data)
+
+    np.testing.assert_allclose(f, f_ref)
+    np.testing.assert_allclose(time_frames, time_ref)
+    np.testing.assert_allclose(Sxx, Sxx_ref.T, rtol=1e-5, atol=1e-6*np.max(Sxx_ref))
+
+
+def test_spectrogram_appended(spectrogram_config, capsys):
+    """A recording that has grown only has its new frames calculated and matches a full calculation"""
+
+    acc_data = _acc_data(10000)
+    acc_data_start = make_acc_data(acc_data[:4000, cfg.COL_IDX], acc_data[:4000, cfg.COL_TIME],
+                                   acc_data[:4000, cfg.COL_SIGNAL])
+
+    spectrogram_path = flutter_spectrogram.update_spectrogram(acc_data_start, "record.csv")
+    num_frames_start = len(flutter_spectrogram.load_spectrogram(spectrogram_path)[1])
+    capsys.readouterr()
+
+    _, time_frames, Sxx = flutter_spectrogram.load_spectrogram(
+        flutter_spectrogram.update_spectrogram(acc_data, "record.csv"))
+    _, time_ref, Sxx_ref = _spectrogram_ref(acc_data)
+
+    assert f"frames {num_frames_start} to {len(time_ref)}" in capsys.readouterr().out
+    np.testing.assert_allclose(time_frames, time_ref)
+    np.testing.assert_allclose(Sxx, Sxx_ref.T, rtol=1e-5, atol=1e-6*np.max(Sxx_ref))